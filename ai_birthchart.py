@@ -1,27 +1,59 @@
+import asyncio
+import logging
 import os
 import getpass
-import json
-from typing import Annotated, Dict, List, Any, Union # More flexible typing
+import hashlib
+import time
+from typing import Annotated, Dict, List, Any, NamedTuple, Optional, Union # More flexible typing
 from typing_extensions import TypedDict
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage # Explicitly import message types
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, message_chunk_to_message # Explicitly import message types
+from langchain_core.runnables import RunnableConfig
 
+from astro_calendar import CalendarSelection
+from astro_encoding import EncodedChart, encoded_chart, format_chart_section, payload_digest
+from astro_parser import ChartValidationError
+from chart_registry import ChartRegistry, ChartTooLargeError
+from conversation_window import ConversationWindow, format_summary_section, message_text
+from graph_node import GraphNode
+import providers
+from prompt_cache import GeminiContextCacheBackend, PromptPrefixCache
+from response_cache import (
+    DEFAULT_AUDIT_RATE, DEFAULT_THRESHOLD, DEFAULT_TTL, HashingEmbeddings, SemanticResponseCache, chart_signature,
+    detect_script,
+)
 
-gemini_api_key = os.environ.get("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY environment variable not set.")
-model = ChatGoogleGenerativeAI(model="gemini-1.5-pro-002", google_api_key=gemini_api_key)
+logger = logging.getLogger(__name__)
+
+# Models, caches and the compiled graph are built on first use through `providers`,
+# so importing this module does not construct clients or validate GEMINI_API_KEY
+MODEL_NAME = "gemini-1.5-pro-002"
+# Calendar days either side of today put in the prompt, besides the dates the user asks about;
+# set to an empty string to always send the whole horizon
+_calendar_window = os.environ.get("LUNA_CALENDAR_WINDOW", "3")
+CALENDAR_WINDOW_DAYS = int(_calendar_window) if _calendar_window else None
+# Semantic cache of replies to first questions (see response_cache): "local" embeds questions with a
+# local hashing model, "gemini" with EMBEDDING_MODEL_NAME; empty disables it
+RESPONSE_CACHE = os.environ.get("LUNA_RESPONSE_CACHE", "")
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("LUNA_RESPONSE_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+RESPONSE_CACHE_TTL = float(os.environ.get("LUNA_RESPONSE_CACHE_TTL", DEFAULT_TTL))
+# Share of cache hits answered by the model anyway and compared with the cached reply
+RESPONSE_CACHE_AUDIT_RATE = float(os.environ.get("LUNA_RESPONSE_CACHE_AUDIT_RATE", DEFAULT_AUDIT_RATE))
+EMBEDDING_MODEL_NAME = "text-multilingual-embedding-002"
 
 class State(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages] # Use BaseMessage for message flexibility
-    astro_data: Dict[str, Any] # Add a field for your structured data
+    astro_data: Dict[str, Any] # Chart payload; registered by the `chart` node and replaced by `chart_id`
+    chart_id: str # Registered chart used by the thread (see chart_registry)
+    chart_key: str # Digest of an inline chart the registry refused, keying its cached encoding
+    summary: str # Rolling summary of messages evicted by the conversation window
+    language: str # Language of the conversation when the client knows it; partitions the response cache
 
-graph_builder = StateGraph(State)
 
-llm = model
+def get_llm():
+    return providers.chat_model(MODEL_NAME)
 
 # System Instruction Prompt (Customize this as needed for tone/persona)
 SYSTEM_INSTRUCTIONS = """You are Luna - a priestess—a wise and sensitive assistant guiding users on the path of self-discovery and personal growth. Like a time-honored Morgan Freeman, you are both sagacious and compassionate. You use exclusively Vedic (Eastern) astrology. Your task is to help the user gain deeper insight into themselves, their life cycles, and their relationship with the world by drawing upon your knowledge of Vedic astrology, psychology, and esoteric systems. Use a Coaching approach (MCC ICF): from time to time, ask clarifying questions based on the client’s messages—one at a time. These questions should be short, simple, and adhere to MCC ICF standards.
@@ -93,35 +125,217 @@ Example response to a request for calculating a natal chart:
 “Unfortunately, I cannot generate a natal chart for another person. However, you can do it yourself on Moonly! There you can also see how your stars align and check your astrological compatibility. How else may I support you on your path of self-discovery?”"""
 
 
-def priestess(state: State):
-    # 1. Extract User Message and Astro Data from State
+# Part of the response cache partition, so replies written for other instructions are not reused
+PROMPT_VERSION = hashlib.sha1(SYSTEM_INSTRUCTIONS.encode("utf-8")).hexdigest()[:12]
+
+
+def get_chart_registry() -> ChartRegistry:
+    return providers.get("ai_birthchart.chart_registry", ChartRegistry)
+
+
+def register_chart(astro_data: Dict[str, Any]) -> str:
+    """Upload a chart once; new threads can then be started with only {"chart_id": ...}"""
+    return get_chart_registry().register(astro_data)
+
+
+def attach_chart(state: State):
+    # A payload sent inline is registered and dropped from state, so checkpoints carry only its ID
+    astro_data = state.get("astro_data")
+    if astro_data:
+        # Hashed once per turn; the registry and the prompt encoding both key on it
+        digest = payload_digest(astro_data)
+        try:
+            return {"chart_id": get_chart_registry().register(astro_data, digest), "astro_data": {}}
+        except ChartTooLargeError:
+            raise
+        except ChartValidationError as e:
+            # Off-schema payloads (e.g. a numeric nakshatra) are still answered from the
+            # inline payload, encoded as it is, like before the registry existed
+            logger.warning(f"Chart not registered, keeping it inline: {e}")
+            return {"chart_key": digest}
+    chart_id = state.get("chart_id")
+    if chart_id:
+        # Fail before calling the model when the ID is unknown
+        get_chart_registry().get(chart_id)
+    return {}
+
+
+async def aattach_chart(state: State):
+    # Registering an inline payload hashes it and, the first time, parses it and writes
+    # SQLite, so it runs in a worker thread. A bare chart ID is normally served from the
+    # registry's in-process cache, where a hop to the executor costs more than the lookup.
+    if state.get("astro_data"):
+        return await asyncio.to_thread(attach_chart, state)
+    return attach_chart(state)
+
+
+def build_prefix_cache() -> PromptPrefixCache:
+    # Static instructions + chart block, reused across turns of the same chart.
+    # Set LUNA_PREFIX_CACHE=gemini to keep the prefix server-side as Gemini cached content.
+    if os.environ.get("LUNA_PREFIX_CACHE") == "gemini":
+        return PromptPrefixCache(GeminiContextCacheBackend(MODEL_NAME, providers.gemini_api_key()))
+    return PromptPrefixCache()
+
+
+def get_prefix_cache() -> PromptPrefixCache:
+    return providers.get("ai_birthchart.prefix_cache", build_prefix_cache)
+
+
+def build_response_cache() -> Optional[SemanticResponseCache]:
+    if not RESPONSE_CACHE:
+        return None
+    if RESPONSE_CACHE == "gemini":
+        from embedding_cache import CachedEmbeddings, get_embedding_disk_cache
+
+        embeddings = CachedEmbeddings(
+            providers.embedding_model(EMBEDDING_MODEL_NAME),
+            model_name=EMBEDDING_MODEL_NAME,
+            disk_cache=get_embedding_disk_cache()
+        )
+    elif RESPONSE_CACHE == "local":
+        embeddings = HashingEmbeddings()
+    else:
+        raise ValueError(f"Unknown LUNA_RESPONSE_CACHE {RESPONSE_CACHE!r}; expected 'local' or 'gemini'")
+    return SemanticResponseCache(
+        embeddings, threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL, audit_rate=RESPONSE_CACHE_AUDIT_RATE
+    )
+
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """Shared response cache, or None unless LUNA_RESPONSE_CACHE is set"""
+    return providers.get("ai_birthchart.response_cache", build_response_cache)
+
+
+class ChartContext(NamedTuple):
+    key: str
+    chart: Optional[EncodedChart]
+    selection: Optional[CalendarSelection]
+    question: str
+
+
+def chart_context(state: State) -> ChartContext:
+    # 1. Extract the chart from State; a payload still inline is encoded directly
     user_messages = state.get("messages", [])
     astro_data = state.get("astro_data", {})
+    chart = None
+    if state.get("chart_id"):
+        chart_key = state["chart_id"]
+        chart = get_chart_registry().get(chart_key).encoded
+    elif astro_data:
+        chart_key = state.get("chart_key") or payload_digest(astro_data)
+        chart = encoded_chart(astro_data, chart_key)
+    else:
+        chart_key = "no-chart"
 
-    # 2. Format the astro data section (keep it minimal)
-    astro_data_formatted = f"\nAstrological Data:\n{json.dumps(astro_data, indent=2)}\n" if astro_data else "\n"
-    
-    # 3. Create system message with just the instructions and astro data
-    system_message = SystemMessage(
-        content=SYSTEM_INSTRUCTIONS.format(astro_data_section=astro_data_formatted)
-    )
+    # 2. Select the calendar days the latest question needs (today +- the window and any dates it mentions)
+    question = next((message_text(m) for m in reversed(user_messages) if isinstance(m, HumanMessage)), "")
+    selection = chart.calendar.select(question, window=CALENDAR_WINDOW_DAYS) if chart is not None else None
+    return ChartContext(chart_key, chart, selection, question)
+
+
+def prepare_messages(state: State, context: Optional[ChartContext] = None):
+    user_messages = state.get("messages", [])
+    summary = state.get("summary", "")
+    chart_key, chart, selection, _ = context or chart_context(state)
+
+    # 3. Identify the prefix; the system prompt only changes with the chart, the selected days or the summary
+    prefix_key = f"{chart_key}:{selection.key}" if selection is not None else chart_key
+    if summary:
+        prefix_key = f"{prefix_key}:{hashlib.sha1(summary.encode('utf-8')).hexdigest()}"
+
+    def build_system_prompt():
+        # 4. Format the astro data section (compact tables, cached per chart)
+        astro_data_formatted = format_chart_section(chart, selection) if chart is not None else "\n"
+        return SYSTEM_INSTRUCTIONS.format(astro_data_section=astro_data_formatted) + format_summary_section(summary)
+
+    # 5. Reuse the cached instructions + chart prefix and send only the conversation
+    return get_prefix_cache().prepare(prefix_key, build_system_prompt, user_messages)
+
+
+def response_cache_partition(state: State, context: ChartContext) -> Optional[str]:
+    """Response cache partition of this turn, or None when its reply must not come from or go to the cache"""
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    # Only first questions: earlier turns or a summary change what the right answer is
+    if len(state.get("messages", [])) != 1 or state.get("summary") or not context.question.strip():
+        cache.bypass()
+        return None
+    language = state.get("language") or detect_script(context.question)
+    signature = chart_signature(context.chart, context.selection, context.question, MODEL_NAME, PROMPT_VERSION)
+    return f"{language}:{signature}"
+
+
+def priestess(state: State, config: RunnableConfig):
+    context = chart_context(state)
+
+    # 6. Answer a first question equivalent to an earlier one from the response cache
+    partition = response_cache_partition(state, context)
+    lookup = get_response_cache().lookup(partition, context.question) if partition else None
+    if lookup is not None and lookup.reply is not None:
+        return {"messages": [AIMessage(content=lookup.reply)]}
+    formatted_messages, call_kwargs = prepare_messages(state, context)
+
+    # 7. Stream Gemini's reply; passing `config` lets LangGraph forward every
+    # chunk to clients using the "messages" stream mode as soon as it arrives
+    started = time.perf_counter()
+    response = None
+    for chunk in get_llm().stream(formatted_messages, config, **call_kwargs):
+        response = chunk if response is None else response + chunk
+    message = message_chunk_to_message(response) if response is not None else AIMessage(content="")
+
+    # 8. Keep the reply for equivalent questions
+    if lookup is not None and response is not None:
+        get_response_cache().record(lookup, message_text(message), time.perf_counter() - started)
+
+    # 9. Return AI Response
+    return {"messages": [message]}
+
+
+async def apriestess(state: State, config: RunnableConfig):
+    context = chart_context(state)
+
+    # 6. Answer a first question equivalent to an earlier one from the response cache
+    partition = response_cache_partition(state, context)
+    lookup = await get_response_cache().alookup(partition, context.question) if partition else None
+    if lookup is not None and lookup.reply is not None:
+        return {"messages": [AIMessage(content=lookup.reply)]}
+    formatted_messages, call_kwargs = prepare_messages(state, context)
+
+    # 7. Stream Gemini's reply without holding a worker thread
+    started = time.perf_counter()
+    response = None
+    async for chunk in get_llm().astream(formatted_messages, config, **call_kwargs):
+        response = chunk if response is None else response + chunk
+    message = message_chunk_to_message(response) if response is not None else AIMessage(content="")
 
-    # 4. Format messages for Gemini - keeping user conversation separate from system context
-    formatted_messages = [system_message]  # System instructions first
-    if user_messages:  # Then add any user messages
-        formatted_messages.extend(user_messages)
+    # 8. Keep the reply for equivalent questions
+    if lookup is not None and response is not None:
+        await get_response_cache().arecord(lookup, message_text(message), time.perf_counter() - started)
 
-    # 5. Invoke Gemini with the formatted messages
-    response = llm.invoke(formatted_messages)
+    # 9. Return AI Response
+    return {"messages": [message]}
 
-    # 6. Return AI Response
-    return {"messages": [response]}
 
+def build_graph(checkpointer=None):
+    graph_builder = StateGraph(State)
 
-graph_builder.add_node("priestess", priestess)
-graph_builder.add_edge(START, "priestess")
-graph_builder.add_edge("priestess", END)
+    # Sync and async variants: graph.invoke/stream use the former, graph.ainvoke/astream the latter
+    conversation_window = ConversationWindow(get_llm)
+    graph_builder.add_node("chart", GraphNode(attach_chart, aattach_chart))
+    graph_builder.add_node("window", GraphNode(conversation_window, conversation_window.acall))
+    graph_builder.add_node("priestess", GraphNode(priestess, apriestess))
+    graph_builder.add_edge(START, "chart")
+    graph_builder.add_edge("chart", "window")
+    graph_builder.add_edge("window", "priestess")
+    graph_builder.add_edge("priestess", END)
 
-graph = graph_builder.compile()
+    # The deployment supplies the checkpointer; pass one to keep threads when running standalone
+    return graph_builder.compile(checkpointer=checkpointer)
 
 
+def __getattr__(name: str):
+    # `graph` (referenced from langgraph.json) is compiled on first access
+    if name == "graph":
+        return providers.get("ai_birthchart.graph", build_graph)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
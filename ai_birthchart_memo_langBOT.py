@@ -1,3 +1,4 @@
+import asyncio
 import os
 import uuid
 import json
@@ -10,13 +11,15 @@ from typing_extensions import TypedDict
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.store import InMemoryStore
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 
+import providers
+from ai_birthchart import SYSTEM_INSTRUCTIONS as LUNA_INSTRUCTIONS
+from conversation_window import ConversationWindow, format_summary_section
+from graph_node import GraphNode
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,38 +27,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Models, the memory store and the compiled graph are built on first use through `providers`
+MODEL_NAME = "gemini-2.0-flash-thinking-exp-01-21"
+EMBEDDING_MODEL_NAME = "text-multilingual-embedding-002"
+
+# Luna's instructions without a chart; this bot works from stored memories instead
+SYSTEM_INSTRUCTIONS = LUNA_INSTRUCTIONS.format(astro_data_section="\n")
+
 class State(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
     memory_context: Dict[str, Any]
+    summary: str
+
+# Directory of the persistent memory store; set to an empty string to keep memories in process memory
+MEMORY_STORE_PATH = os.environ.get("MEMORY_STORE_PATH", ".luna_memory")
+# Embedding size; detected from the model's first embedding when unset
+EMBEDDING_DIMS = int(os.environ["EMBEDDING_DIMS"]) if os.environ.get("EMBEDDING_DIMS") else None
+# Vectors of the persistent store are searched as "int8" or "pq" codes and re-ranked at full precision;
+# empty searches the float32 vectors directly
+MEMORY_QUANTIZATION = os.environ.get("MEMORY_QUANTIZATION", "")
+# Memories are written by a background queue after the reply; set to "0" to write them inline
+MEMORY_WRITE_BEHIND = os.environ.get("MEMORY_WRITE_BEHIND", "1") != "0"
+# SQLite file for conversation checkpoints; set to an empty string to keep them in process memory
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH", ".luna_checkpoints.sqlite3")
+# Comma-separated Unix sockets of memory shard servers (see memory_shards.py); empty keeps memories in this process
+MEMORY_SHARDS = [path for path in os.environ.get("MEMORY_SHARDS", "").split(",") if path]
+# Retrieval skips the query embedding when keyword matches cover this share of the query
+LEXICAL_CONFIDENCE = 0.8
+# Retention: idle days before a thread is deleted, memories kept per user, total bytes of
+# checkpoints and memories (0 disables each; all are off by default), and seconds between background
+# sweeps (0 disables sweeping). The sweeper only runs once a limit is set.
+RETENTION_THREAD_TTL_DAYS = float(os.environ.get("RETENTION_THREAD_TTL_DAYS", "0"))
+RETENTION_MEMORY_QUOTA = int(os.environ.get("RETENTION_MEMORY_QUOTA", "0"))
+RETENTION_BYTE_BUDGET = int(os.environ.get("RETENTION_BYTE_BUDGET", "0"))
+RETENTION_SWEEP_INTERVAL = float(os.environ.get("RETENTION_SWEEP_INTERVAL", "600"))
 
 class MemoryManager:
-    def __init__(self, embedding_model, llm):
+    def __init__(self, embedding_model, llm, store=None, write_behind=MEMORY_WRITE_BEHIND, read_your_writes=True,
+                 hybrid=True, lexical_confidence=LEXICAL_CONFIDENCE, store_path=MEMORY_STORE_PATH):
         """
         Initialize memory management system
         
         :param embedding_model: Embedding model for semantic search
         :param llm: Language model for summarization
+        :param store: LangGraph store to use; built from MEMORY_STORE_PATH when omitted
+        :param write_behind: Acknowledge memories immediately and write them from a background queue
+        :param read_your_writes: Include the user's queued, not yet stored memories in retrieval results
+        :param hybrid: Fuse BM25 keyword matches with vector search
+        :param lexical_confidence: Share of the query's keyword weight the best BM25 hit must cover
+            to answer without embedding the query; above 1 always embeds
+        :param store_path: Directory of the persistent store built when `store` is omitted; in memory when empty
         """
-        self.store = InMemoryStore(
-            index={
-                "embed": embedding_model,
-                "dims": 1024  # Adjust based on embedding model
-            }
-        )
+        index = {
+            "embed": embedding_model,
+            "dims": EMBEDDING_DIMS
+        }
+        if store is not None:
+            self.store = store
+        elif store_path:
+            from memory_store import DEFAULT_QUANTIZATION_CONFIG, PersistentVectorStore
+
+            quantization = {**DEFAULT_QUANTIZATION_CONFIG, "type": MEMORY_QUANTIZATION} if MEMORY_QUANTIZATION else None
+            self.store = PersistentVectorStore(store_path, index=index, quantization=quantization)
+        else:
+            from langgraph.store.memory import InMemoryStore
+
+            self.store = InMemoryStore(index=index)
         self.embedding_model = embedding_model
         self.llm = llm
+        self.read_your_writes = read_your_writes
+        self.write_queue = None
+        if write_behind:
+            from memory_queue import MemoryWriteQueue
 
-    def summarize_memories(self, memories: List[Dict]) -> str:
-        """
-        Summarize multiple memories into a concise overview
-        
-        :param memories: List of memory dictionaries
-        :return: Summarized memory context
-        """
-        try:
-            memory_texts = [json.dumps(memory) for memory in memories]
-            
-            summarization_prompt = f"""
+            self.write_queue = MemoryWriteQueue(self.store)
+        self.lexical_confidence = lexical_confidence
+        self.lexical = None
+        if hybrid:
+            from lexical_index import LexicalIndex
+
+            self.lexical = LexicalIndex(self._lexical_documents)
+
+    def _lexical_documents(self, namespace: tuple):
+        from memory_consolidation import list_memories
+
+        # Queued items first: one written in between is then found in the store instead
+        queued = self.write_queue.pending_items(namespace) if self.write_queue is not None else []
+        stored = [(item.key, item.value) for item in list_memories(self.store, namespace)]
+        return [(key, value["data"]) for key, value in queued + stored]
+
+    def _lexical_answer(self, hits) -> bool:
+        # Keywords alone are trusted when the best hit covers most of the query's rare terms
+        return bool(hits) and hits[0].coverage >= self.lexical_confidence
+
+    def _fuse(self, memories, hits, top_k: int) -> List[Dict]:
+        from lexical_index import reciprocal_rank_fusion
+
+        values = {hit.key: hit.value for hit in hits}
+        values.update((memory.key, memory.value["data"]) for memory in memories)
+        ranking = reciprocal_rank_fusion([[memory.key for memory in memories], [hit.key for hit in hits]])
+        return [values[key] for key in ranking[:top_k]]
+
+    def _with_pending(self, namespace: tuple, memories: List[Dict], top_k: int) -> List[Dict]:
+        # Queued memories are the newest ones; add them so the next turn sees the last exchange
+        if not self.read_your_writes or self.write_queue is None:
+            return memories
+        pending = [value["data"] for value in reversed(self.write_queue.pending_values(namespace))]
+        return (pending + [memory for memory in memories if memory not in pending])[:top_k]
+
+    def _summarization_request(self, memories: List[Dict]) -> List[BaseMessage]:
+        memory_texts = [json.dumps(memory) for memory in memories]
+
+        summarization_prompt = f"""
             Professionally summarize these conversation memories, 
             extracting key themes, important context, and recurring patterns:
             
@@ -64,17 +147,46 @@ class MemoryManager:
             Provide a structured, concise summary that captures 
             the essence of the interactions.
             """
-            
-            summary = self.llm.invoke([
-                SystemMessage(content="You are an expert memory summarization assistant."),
-                HumanMessage(content=summarization_prompt)
-            ])
-            
+
+        return [
+            SystemMessage(content="You are an expert memory summarization assistant."),
+            HumanMessage(content=summarization_prompt)
+        ]
+
+    def summarize_memories(self, memories: List[Dict]) -> str:
+        """
+        Summarize multiple memories into a concise overview
+        
+        :param memories: List of memory dictionaries
+        :return: Summarized memory context
+        """
+        try:
+            summary = self.llm.invoke(self._summarization_request(memories))
+            return summary.content
+        except Exception as e:
+            logger.error(f"Memory summarization failed: {e}")
+            return "Unable to summarize memories."
+
+    async def asummarize_memories(self, memories: List[Dict]) -> str:
+        """
+        Async variant of `summarize_memories`
+        
+        :param memories: List of memory dictionaries
+        :return: Summarized memory context
+        """
+        try:
+            summary = await self.llm.ainvoke(self._summarization_request(memories))
             return summary.content
         except Exception as e:
             logger.error(f"Memory summarization failed: {e}")
             return "Unable to summarize memories."
 
+    def _memory_record(self, memory_data: Dict) -> Dict:
+        return {
+            "data": memory_data,
+            "timestamp": datetime.now().isoformat()
+        }
+
     def store_memory(self, user_id: str, memory_data: Dict):
         """
         Store a memory with semantic embedding
@@ -86,14 +198,33 @@ class MemoryManager:
             namespace = ("user_memories", user_id)
             memory_id = str(uuid.uuid4())
             
-            self.store.put(
-                namespace, 
-                memory_id, 
-                {
-                    "data": memory_data,
-                    "timestamp": datetime.now().isoformat()
-                }
-            )
+            if self.write_queue is not None:
+                self.write_queue.put(namespace, memory_id, self._memory_record(memory_data))
+            else:
+                self.store.put(namespace, memory_id, self._memory_record(memory_data))
+            if self.lexical is not None:
+                self.lexical.add(namespace, memory_id, memory_data)
+            logger.info(f"Memory stored for user {user_id}")
+        except Exception as e:
+            logger.error(f"Memory storage failed: {e}")
+
+    async def astore_memory(self, user_id: str, memory_data: Dict):
+        """
+        Async variant of `store_memory`
+        
+        :param user_id: Unique identifier for the user
+        :param memory_data: Memory content to store
+        """
+        try:
+            namespace = ("user_memories", user_id)
+            memory_id = str(uuid.uuid4())
+
+            if self.write_queue is not None:
+                self.write_queue.put(namespace, memory_id, self._memory_record(memory_data))
+            else:
+                await self.store.aput(namespace, memory_id, self._memory_record(memory_data))
+            if self.lexical is not None:
+                self.lexical.add(namespace, memory_id, memory_data)
             logger.info(f"Memory stored for user {user_id}")
         except Exception as e:
             logger.error(f"Memory storage failed: {e}")
@@ -109,18 +240,62 @@ class MemoryManager:
         """
         try:
             namespace = ("user_memories", user_id)
+            hits = self.lexical.search(namespace, query, top_k * 2) if self.lexical is not None else []
+            if self._lexical_answer(hits):
+                # Queued memories are indexed by keyword too, so these hits already include them
+                return [hit.value for hit in hits[:top_k]]
             
             memories = self.store.search(
                 namespace, 
                 query=query, 
-                k=top_k
+                limit=top_k * 2 if hits else top_k
             )
             
-            return [memory.value["data"] for memory in memories]
+            return self._with_pending(namespace, self._fuse(memories, hits, top_k), top_k)
         except Exception as e:
             logger.error(f"Memory retrieval failed: {e}")
             return []
 
+    async def aretrieve_memories(self, user_id: str, query: str, top_k: int = 3) -> List[Dict]:
+        """
+        Async variant of `retrieve_memories`
+        
+        :param user_id: Unique identifier for the user
+        :param query: Semantic search query
+        :param top_k: Number of memories to retrieve
+        :return: List of retrieved memories
+        """
+        try:
+            namespace = ("user_memories", user_id)
+            hits = []
+            if self.lexical is not None:
+                # Loading a user's index reads the store, so keep it off the event loop
+                search = self.lexical.search
+                hits = (search(namespace, query, top_k * 2) if self.lexical.is_loaded(namespace)
+                        else await asyncio.to_thread(search, namespace, query, top_k * 2))
+            if self._lexical_answer(hits):
+                # Queued memories are indexed by keyword too, so these hits already include them
+                return [hit.value for hit in hits[:top_k]]
+
+            memories = await self.store.asearch(namespace, query=query, limit=top_k * 2 if hits else top_k)
+
+            return self._with_pending(namespace, self._fuse(memories, hits, top_k), top_k)
+        except Exception as e:
+            logger.error(f"Memory retrieval failed: {e}")
+            return []
+
+def build_system_message(state: State, memory_summary: str) -> SystemMessage:
+    # Modify system message to include memory context
+    return SystemMessage(
+        content=f"""
+        {SYSTEM_INSTRUCTIONS}
+        
+        Relevant User Memory Context:
+        {memory_summary}
+        {format_summary_section(state.get("summary", ""))}
+        """
+    )
+
 def priestess(state: State, config: RunnableConfig):
     """
     Agent node that incorporates memory context
@@ -130,6 +305,7 @@ def priestess(state: State, config: RunnableConfig):
     :return: Updated state with memory context
     """
     user_id = config["configurable"]["user_id"]
+    memory_manager = get_memory_manager()
     
     # Retrieve relevant memories
     previous_memories = memory_manager.retrieve_memories(
@@ -143,21 +319,13 @@ def priestess(state: State, config: RunnableConfig):
     else:
         memory_summary = json.dumps(previous_memories)
     
-    # Modify system message to include memory context
-    system_message = SystemMessage(
-        content=f"""
-        {SYSTEM_INSTRUCTIONS}
-        
-        Relevant User Memory Context:
-        {memory_summary}
-        """
-    )
+    system_message = build_system_message(state, memory_summary)
     
     # Prepare messages with memory context
     formatted_messages = [system_message] + state["messages"]
     
     # Generate response
-    response = llm.invoke(formatted_messages)
+    response = get_llm().invoke(formatted_messages)
     
     # Store the new interaction as a memory
     memory_manager.store_memory(
@@ -170,22 +338,124 @@ def priestess(state: State, config: RunnableConfig):
     
     return {"messages": [response]}
 
-# Initialize memory manager
-embedding_model = GoogleGenerativeAIEmbeddings(model="text-multilingual-embedding-002")
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-thinking-exp-01-21")
-memory_manager = MemoryManager(embedding_model, llm)
-
-# Define graph structure
-graph_builder = StateGraph(State)
-graph_builder.add_node("priestess", priestess)
-graph_builder.add_edge(START, "priestess")
-graph_builder.add_edge("priestess", END)
-
-# Compile graph with memory persistence
-graph = graph_builder.compile(
-    checkpointer=MemorySaver(),
-    interrupt_before=["priestess"]
-)
+async def apriestess(state: State, config: RunnableConfig):
+    """
+    Async variant of `priestess`
+    
+    :param state: Current state of the conversation
+    :param config: Configuration for the current invocation
+    :return: Updated state with memory context
+    """
+    user_id = config["configurable"]["user_id"]
+    query = state["messages"][-1].content
+    memory_manager = get_memory_manager()
+
+    previous_memories = await memory_manager.aretrieve_memories(user_id, query=query)
+
+    if len(previous_memories) > 3:
+        memory_summary = await memory_manager.asummarize_memories(previous_memories)
+    else:
+        memory_summary = json.dumps(previous_memories)
+
+    formatted_messages = [build_system_message(state, memory_summary)] + state["messages"]
+
+    response = await get_llm().ainvoke(formatted_messages)
+
+    await memory_manager.astore_memory(
+        user_id,
+        {
+            "user_message": query,
+            "ai_response": response.content
+        }
+    )
+
+    return {"messages": [response]}
+
+def get_llm():
+    return providers.chat_model(MODEL_NAME)
+
+def get_embeddings():
+    """Embeddings behind a content-hash cache that batches concurrent requests from all sessions"""
+    def build():
+        from embedding_cache import CachedEmbeddings, get_embedding_disk_cache
+
+        return CachedEmbeddings(
+            providers.embedding_model(EMBEDDING_MODEL_NAME),
+            model_name=EMBEDDING_MODEL_NAME,
+            disk_cache=get_embedding_disk_cache()
+        )
+
+    return providers.get("memo.embeddings", build)
+
+def build_memory_manager(store_path: str = MEMORY_STORE_PATH) -> MemoryManager:
+    """Memory manager owning a store in this process, swept by the retention sweeper"""
+    manager = MemoryManager(get_embeddings(), get_llm(), store_path=store_path)
+    get_retention_sweeper().attach(
+        store=manager.store,
+        on_memories_deleted=manager.lexical.drop if manager.lexical is not None else None
+    )
+    return manager
+
+def get_memory_manager() -> MemoryManager:
+    """Shared memory manager: a client of the MEMORY_SHARDS servers when set, a local one otherwise"""
+    def build():
+        if MEMORY_SHARDS:
+            from memory_shards import ShardedMemoryManager
+
+            return ShardedMemoryManager(MEMORY_SHARDS)
+        return build_memory_manager()
+
+    return providers.get("memo.memory_manager", build)
+
+def get_retention_sweeper():
+    """Sweeper expiring idle threads and trimming memories, in the background once a limit is set; backends attach as they are built"""
+    def build():
+        from retention import RetentionSweeper
+
+        sweeper = RetentionSweeper(
+            thread_ttl_days=RETENTION_THREAD_TTL_DAYS,
+            memory_quota=RETENTION_MEMORY_QUOTA,
+            byte_budget=RETENTION_BYTE_BUDGET,
+            interval=RETENTION_SWEEP_INTERVAL
+        )
+        if RETENTION_SWEEP_INTERVAL > 0 and sweeper.limited:
+            sweeper.start()
+        return sweeper
+
+    return providers.get("memo.retention", build)
+
+def build_checkpointer():
+    if not CHECKPOINT_DB_PATH:
+        from langgraph.checkpoint.memory import MemorySaver
+
+        return MemorySaver()
+    from checkpoint_store import SQLiteDeltaSaver
+
+    return SQLiteDeltaSaver(CHECKPOINT_DB_PATH)
+
+def build_graph():
+    # Define graph structure
+    graph_builder = StateGraph(State)
+    conversation_window = ConversationWindow(get_llm)
+    graph_builder.add_node("window", GraphNode(conversation_window, conversation_window.acall))
+    graph_builder.add_node("priestess", GraphNode(priestess, apriestess))
+    graph_builder.add_edge(START, "window")
+    graph_builder.add_edge("window", "priestess")
+    graph_builder.add_edge("priestess", END)
+
+    # Compile graph with memory persistence
+    checkpointer = build_checkpointer()
+    get_retention_sweeper().attach(checkpointer=checkpointer)
+    return graph_builder.compile(
+        checkpointer=checkpointer,
+        interrupt_before=["priestess"]
+    )
+
+def __getattr__(name: str):
+    # `graph` is compiled on first access
+    if name == "graph":
+        return providers.get("memo.graph", build_graph)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # # Example usage
 #
@@ -0,0 +1,125 @@
+import math
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 10
+# Training sample per centroid
+SAMPLES_PER_LIST = 32
+ASSIGN_CHUNK = 8192
+
+
+def default_nlist(size: int) -> int:
+    return max(1, int(2 * math.sqrt(size)))
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        fetch: Callable[[np.ndarray], np.ndarray],
+        nlist: Optional[int] = None,
+        nprobe: int = DEFAULT_NPROBE,
+        rebuild_growth: float = 2.0,
+        seed: int = 0,
+    ):
+        """
+        Inverted-file index over normalized vectors (inner product == cosine)
+
+        Vectors are clustered with spherical k-means; a query only scores the
+        vectors in its `nprobe` closest clusters. Raising `nprobe` trades latency
+        for recall. Inserts go to the nearest existing cluster; once the index has
+        grown by `rebuild_growth` since training, `needs_rebuild` turns true.
+
+        :param fetch: Returns the vectors for an array of positions
+        :param nlist: Number of clusters; defaults to 2 * sqrt(size) at build time
+        :param nprobe: Clusters scanned per query
+        :param rebuild_growth: Growth factor after which the clusters are retrained
+        :param seed: Random seed for training
+        """
+        self.fetch = fetch
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rebuild_growth = rebuild_growth
+        self.rng = np.random.default_rng(seed)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.list_arrays: List[Optional[np.ndarray]] = []
+        self.trained_size = 0
+        self.size = 0
+
+    def _train(self, vectors: np.ndarray, nlist: int) -> np.ndarray:
+        sample_size = min(len(vectors), nlist * SAMPLES_PER_LIST)
+        sample = vectors[self.rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[self.rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[self.rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        return centroids.astype(np.float32)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[start:start + ASSIGN_CHUNK] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), ASSIGN_CHUNK)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def build(self, vectors: np.ndarray, positions: np.ndarray):
+        """
+        (Re)train the clusters and index every given vector
+
+        :param vectors: Normalized vectors, one per row
+        :param positions: Caller's position for each row, passed back to `fetch` and returned by `search`
+        """
+        nlist = min(self.nlist or default_nlist(len(vectors)), len(vectors))
+        self.centroids = self._train(vectors, nlist)
+        assignment = self._assign(vectors)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self.lists = [positions[order[bounds[i]:bounds[i + 1]]].tolist() for i in range(nlist)]
+        self.list_arrays = [None] * nlist
+        self.trained_size = self.size = len(vectors)
+
+    def add(self, vectors: np.ndarray, positions: np.ndarray):
+        """Insert vectors into their nearest existing clusters"""
+        for cluster, position in zip(self._assign(vectors), positions):
+            self.lists[cluster].append(int(position))
+            self.list_arrays[cluster] = None
+        self.size += len(vectors)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self.size >= self.trained_size * self.rebuild_growth
+
+    def _list_array(self, cluster: int) -> np.ndarray:
+        array = self.list_arrays[cluster]
+        if array is None:
+            array = self.list_arrays[cluster] = np.asarray(self.lists[cluster], dtype=np.int64)
+        return array
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by inner product
+
+        :param query: Normalized query vector
+        :param k: Number of results
+        :param nprobe: Overrides the index's `nprobe` for this query
+        :return: Positions and scores, best first
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self._list_array(cluster) for cluster in probed])
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = self.fetch(candidates) @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
@@ -0,0 +1,363 @@
+"""
+Date-indexed calendar of an astro payload and query-aware selection of its rows
+
+The `dates` block of a chart covers the client's whole horizon (a month today,
+up to a year later). Only the days a question is about are put in the prompt:
+today +- a small window, plus every date, range, month or relative period the
+message mentions, and the days of any lunar day it names. Asking for the whole
+month/year/calendar selects every row.
+"""
+import bisect
+import calendar
+import re
+from datetime import date, timedelta
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Days either side of today included in every selection
+DEFAULT_WINDOW_DAYS = 3
+
+# English and Russian month names and abbreviations, looked up by their first three letters
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+    "янв": 1, "фев": 2, "мар": 3, "апр": 4, "май": 5, "мая": 5, "мае": 5, "июн": 6,
+    "июл": 7, "авг": 8, "сен": 9, "окт": 10, "ноя": 11, "дек": 12,
+}
+_MONTH_WORD = (
+    r"(january|jan|february|feb|march|mar|april|apr|may|june|jun|july|jul|august|aug"
+    r"|september|sept|sep|october|oct|november|nov|december|dec"
+    r"|январ[ьяе]|феврал[ьяе]|март[ае]?|апрел[ьяе]|ма[йяе]|июн[ьяе]|июл[ьяе]|август[ае]?"
+    r"|сентябр[ьяе]|октябр[ьяе]|ноябр[ьяе]|декабр[ьяе])\b\.?"
+)
+# English month names that are also common words; read as months only after a preposition or before a year
+_AMBIGUOUS_MONTHS = ("may", "march", "mar")
+_MONTH_CONTEXT_RE = re.compile(r"\b(?:in|of|during|for|until|till|by|from|next|this|early|late|mid|whole)\s+$", re.IGNORECASE)
+
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+# Day first, as clients write it: 15.01, 15/01/2025. Without a year this is also how
+# decimals and fractions look ("7.5 hours", "3/4 of"), so such a match only counts as a
+# date with a two-digit month or after a date word, and never before a unit
+_NUMERIC_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2}|\d{4}))?\b")
+_NUMERIC_CONTEXT_RE = re.compile(
+    r"\b(?:on|by|until|till|to|from|before|after|since|date|dated|day"
+    r"|на|к|до|с|со|по|после|дата|числа|число)\s+$",
+    re.IGNORECASE,
+)
+_QUANTITY_RE = re.compile(
+    r"^\s*(?:%|(?:of|из|x|times|percent|hours?|hrs?|h|minutes?|mins?|seconds?|secs?|days?|weeks?|months?"
+    r"|years?|kg|kilos?|lbs?|pounds?|km|miles?|m|cm|meters?|metres?|liters?|litres?|l|cups?|points?|stars?"
+    r"|dollars?|euros?|usd|eur|rub|час\w*|минут\w*|секунд\w*|дн\w*|недел\w*|месяц\w*|лет|год\w*"
+    r"|кг|км|раз\w*|процент\w*|рубл\w*)\b)",
+    re.IGNORECASE,
+)
+# A day of the current or next month: "on the 20th", "20-го числа"
+_ORDINAL_DAY_RE = re.compile(
+    r"\b(?:on|by|until|till|to|from|before|after|since|through)\s+the\s+(\d{1,2})(?:st|nd|rd|th)\b"
+    r"(?!\s+(?:lunar|moon)\b)|\b(\d{1,2})(?:-?го)?\s+числа\b",
+    re.IGNORECASE,
+)
+# "lunar day 15", "the 15th lunar day", "15-й лунный день", "лунный день 15"
+_LUNAR_DAY_RE = re.compile(
+    r"\b(?:lunar|moon)\s+day\s+(\d{1,2})\b|\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:lunar|moon)\s+day"
+    r"|\b(\d{1,2})(?:-?(?:й|ый|ой|го|м))?\s+лунн\w*\s+д[не]\w*|\bлунн\w*\s+д[не]\w*\s+(\d{1,2})\b",
+    re.IGNORECASE,
+)
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH_WORD + r"(?:\s+(\d{4}))?", re.IGNORECASE)
+_MONTH_DAY_RE = re.compile(r"\b" + _MONTH_WORD + r"\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(\d{4}))?", re.IGNORECASE)
+_MONTH_RE = re.compile(r"\b" + _MONTH_WORD + r"(?:\s+(\d{4}))?", re.IGNORECASE)
+_RANGE_JOIN = r"\s*(?:-|–|—|\.\.|to|until|till|through|до|по)\s*"
+# "10-15 January", "from 10 to 15 января", "between 10 and 15 January"
+_DAY_RANGE_RE = re.compile(r"\b(?:(?:between|между)\s+(\d{1,2})\s+(?:and|и)\s+|(\d{1,2})" + _RANGE_JOIN + r")"
+                           r"(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH_WORD + r"(?:\s+(\d{4}))?", re.IGNORECASE)
+# Text between two dates that makes them a range: "2025-01-10 to 2025-01-15"
+_RANGE_JOIN_RE = re.compile(r"^" + _RANGE_JOIN + r"$", re.IGNORECASE)
+# "between Jan 12 and Jan 14": the same, when the first date follows "between"
+_BETWEEN_RE = re.compile(r"\b(?:between|между)\s+$", re.IGNORECASE)
+_BETWEEN_JOIN_RE = re.compile(r"^\s*(?:and|и)\s*$", re.IGNORECASE)
+_IN_DAYS_RE = re.compile(r"\b(?:in|within|next|coming|через|ближайшие|следующие)\s+(\d{1,3})\s+(?:days?|дн[еяи]\w*|день)",
+                         re.IGNORECASE)
+_FULL_RE = re.compile(
+    r"\b(?:whole|entire|full|all)\s+(?:the\s+)?(?:month|year|calendar|horizon|period|dates)\b"
+    r"|\bвесь\s+(?:месяц|год|календарь|период)|\bвсе\s+дни",
+    re.IGNORECASE,
+)
+
+# (pattern, days from today to the start, length in days); "this/next week" are handled separately
+_RELATIVE = [
+    (re.compile(r"\b(?:day after tomorrow)\b|послезавтра", re.IGNORECASE), 2, 1),
+    (re.compile(r"\btomorrow\b|(?<!после)завтра", re.IGNORECASE), 1, 1),
+    (re.compile(r"\byesterday\b|вчера", re.IGNORECASE), -1, 1),
+]
+_THIS_WEEK_RE = re.compile(r"\bthis\s+week\b|этой\s+неделе|эту\s+неделю", re.IGNORECASE)
+_NEXT_WEEK_RE = re.compile(r"\bnext\s+week\b|следующей\s+неделе|следующую\s+неделю", re.IGNORECASE)
+_WEEKEND_RE = re.compile(r"\bweekend\b|выходны[ех]", re.IGNORECASE)
+_THIS_MONTH_RE = re.compile(r"\bthis\s+month\b|этом\s+месяце|этот\s+месяц", re.IGNORECASE)
+_NEXT_MONTH_RE = re.compile(r"\bnext\s+month\b|следующем\s+месяце|следующий\s+месяц", re.IGNORECASE)
+
+
+class DateRange(NamedTuple):
+    start: date
+    end: date  # inclusive
+
+
+def _month_number(word: str) -> Optional[int]:
+    return _MONTHS.get(word.lower()[:3])
+
+
+def _full_year(year: Optional[str]) -> Optional[int]:
+    if not year:
+        return None
+    value = int(year)
+    return value + 2000 if value < 100 else value
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _overlaps(span: DateRange, horizon: Optional[DateRange]) -> bool:
+    return horizon is not None and span.start <= horizon.end and horizon.start <= span.end
+
+
+def _nearest_year(month: int, day: int, today: date, horizon: Optional[DateRange]) -> Optional[date]:
+    # A date without a year falls in the horizon if it can, otherwise it is the occurrence closest to today
+    candidates = [_safe_date(today.year + offset, month, day) for offset in (-1, 0, 1)]
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    return min(candidates, key=lambda candidate: (not _overlaps(DateRange(candidate, candidate), horizon),
+                                                  abs((candidate - today).days))) if candidates else None
+
+
+def _day(month: int, day: int, year: Optional[int], today: date, horizon: Optional[DateRange]) -> Optional[DateRange]:
+    found = _safe_date(year, month, day) if year else _nearest_year(month, day, today, horizon)
+    return DateRange(found, found) if found else None
+
+
+def _month_range(month: int, year: int) -> DateRange:
+    return DateRange(date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1]))
+
+
+def _month(month: int, year: Optional[int], today: date, horizon: Optional[DateRange]) -> DateRange:
+    if year is not None:
+        return _month_range(month, year)
+    # The occurrence in the horizon, otherwise the next one or the current one
+    upcoming = _month_range(month, today.year + (1 if month < today.month else 0))
+    candidates = [_month_range(month, today.year + offset) for offset in (-1, 0, 1)]
+    return next((span for span in candidates if _overlaps(span, horizon)), upcoming)
+
+
+def _next_day_of_month(day: int, today: date) -> Optional[DateRange]:
+    # "the 20th" is this month's when it is still ahead, otherwise next month's
+    month_start = today.replace(day=1)
+    for _ in range(3):
+        found = _safe_date(month_start.year, month_start.month, day)
+        if found is not None and found >= today:
+            return DateRange(found, found)
+        month_start = (month_start + timedelta(days=32)).replace(day=1)
+    return None
+
+
+def _numeric_date(match: "re.Match", text: str) -> bool:
+    if match[3]:
+        return True
+    if _QUANTITY_RE.match(text[match.end():]):
+        return False
+    return len(match[2]) == 2 or _NUMERIC_CONTEXT_RE.search(text[:match.start()]) is not None
+
+
+def mentioned_lunar_days(text: str) -> List[int]:
+    """Lunar days (1-30) a message names, such as lunar day 15 or 15-й лунный день"""
+    found = []
+    for match in _LUNAR_DAY_RE.finditer(text):
+        day = int(next(group for group in match.groups() if group))
+        if 1 <= day <= 30 and day not in found:
+            found.append(day)
+    return found
+
+
+def mentioned_ranges(text: str, today: date, horizon: Optional[DateRange] = None) -> Tuple[List[DateRange], bool]:
+    """
+    Dates and periods a message refers to
+
+    :param text: User message
+    :param today: Reference day for relative expressions and dates without a year
+    :param horizon: Days the calendar covers; dates without a year are placed in it when possible
+    :return: Mentioned ranges, and whether the whole horizon was asked for
+    """
+    if _FULL_RE.search(text):
+        return [], True
+
+    # Spans already read as days, so "15 January" does not also select all of January
+    days: List[Tuple[Tuple[int, int], Optional[DateRange]]] = []
+
+    def taken(match: "re.Match") -> bool:
+        return any(start < match.end() and match.start() < end for (start, end), _ in days)
+
+    def add(found: Optional[DateRange], match: "re.Match"):
+        if found is not None and not taken(match):
+            days.append((match.span(), found))
+
+    for match in _LUNAR_DAY_RE.finditer(text):
+        # Claimed so its number is not read as a date; selected by `mentioned_lunar_days`
+        days.append((match.span(), None))
+    for match in _DAY_RANGE_RE.finditer(text):
+        month, year = _month_number(match[4]), _full_year(match[5])
+        first = _day(month, int(match[1] or match[2]), year, today, horizon)
+        last = _day(month, int(match[3]), year, today, horizon)
+        if first and last and first.start <= last.start:
+            add(DateRange(first.start, last.end), match)
+    for match in _ISO_RE.finditer(text):
+        add(_day(int(match[2]), int(match[3]), int(match[1]), today, horizon), match)
+    for match in _NUMERIC_RE.finditer(text):
+        if _numeric_date(match, text):
+            add(_day(int(match[2]), int(match[1]), _full_year(match[3]), today, horizon), match)
+    for match in _DAY_MONTH_RE.finditer(text):
+        add(_day(_month_number(match[2]), int(match[1]), _full_year(match[3]), today, horizon), match)
+    for match in _MONTH_DAY_RE.finditer(text):
+        add(_day(_month_number(match[1]), int(match[2]), _full_year(match[3]), today, horizon), match)
+    for match in _ORDINAL_DAY_RE.finditer(text):
+        add(_next_day_of_month(int(match[1] or match[2]), today), match)
+
+    # Two dates joined by "to", "-", "до", ... (or "between ... and ...") become one range
+    days.sort(key=lambda item: item[0])
+    ranges: List[DateRange] = []
+    previous_start = previous_end = None
+    for (start, end), found in days:
+        if found is None:
+            previous_start = previous_end = None
+            continue
+        gap = text[previous_end:start] if previous_end is not None else None
+        joined = gap is not None and (_RANGE_JOIN_RE.match(gap) or (
+            _BETWEEN_JOIN_RE.match(gap) and _BETWEEN_RE.search(text[:previous_start])))
+        if joined and ranges[-1].start <= found.end:
+            ranges[-1] = DateRange(ranges[-1].start, found.end)
+        else:
+            ranges.append(found)
+        previous_start, previous_end = start, end
+
+    for match in _MONTH_RE.finditer(text):
+        if taken(match):
+            continue
+        if match[1].lower() in _AMBIGUOUS_MONTHS and not (match[2] or _MONTH_CONTEXT_RE.search(text[:match.start()])):
+            continue
+        ranges.append(_month(_month_number(match[1]), _full_year(match[2]), today, horizon))
+
+    for pattern, offset, length in _RELATIVE:
+        if pattern.search(text):
+            start = today + timedelta(days=offset)
+            ranges.append(DateRange(start, start + timedelta(days=length - 1)))
+    monday = today - timedelta(days=today.weekday())
+    if _THIS_WEEK_RE.search(text):
+        ranges.append(DateRange(monday, monday + timedelta(days=6)))
+    if _NEXT_WEEK_RE.search(text):
+        ranges.append(DateRange(monday + timedelta(days=7), monday + timedelta(days=13)))
+    if _WEEKEND_RE.search(text):
+        saturday = monday + timedelta(days=5)
+        ranges.append(DateRange(saturday, saturday + timedelta(days=1)))
+    if _THIS_MONTH_RE.search(text):
+        ranges.append(_month_range(today.month, today.year))
+    if _NEXT_MONTH_RE.search(text):
+        first = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        ranges.append(_month_range(first.month, first.year))
+    for match in _IN_DAYS_RE.finditer(text):
+        ranges.append(DateRange(today, today + timedelta(days=int(match[1]))))
+    return ranges, False
+
+
+class CalendarSelection(NamedTuple):
+    positions: Tuple[int, ...]
+    today: date
+    full: bool
+
+    @property
+    def key(self) -> str:
+        """Identifies the selected rows, for caching prompts built from them"""
+        if self.full:
+            return "all"
+        runs, start = [], None
+        for index, position in enumerate(self.positions):
+            if start is None:
+                start = position
+            if index + 1 == len(self.positions) or self.positions[index + 1] != position + 1:
+                runs.append(f"{start}-{position}" if start != position else str(start))
+                start = None
+        return f"{self.today.isoformat()}:{','.join(runs)}"
+
+
+class Calendar:
+    def __init__(self, days: Sequence[date], lines: Sequence[str], lunar_days: Optional[Sequence[Optional[int]]] = None):
+        """
+        Calendar rows of one chart, indexed by date
+
+        :param days: Date of every row, ascending
+        :param lines: Encoded row for each date
+        :param lunar_days: Lunar day of each row, for questions naming one
+        """
+        self.days = list(days)
+        self.lines = list(lines)
+        self.lunar_days = list(lunar_days) if lunar_days is not None else [None] * len(self.days)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[Optional[date], str, Optional[int]]]) -> "Calendar":
+        """Build from (date, encoded line, lunar day) rows in any order; rows without a valid date are dropped"""
+        dated = sorted((row for row in rows if row[0] is not None), key=lambda row: row[0])
+        return cls([row[0] for row in dated], [row[1] for row in dated], [row[2] for row in dated])
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def start(self) -> Optional[date]:
+        return self.days[0] if self.days else None
+
+    @property
+    def end(self) -> Optional[date]:
+        return self.days[-1] if self.days else None
+
+    def _positions(self, span: DateRange) -> range:
+        return range(bisect.bisect_left(self.days, span.start), bisect.bisect_right(self.days, span.end))
+
+    def select(self, text: str = "", today: Optional[date] = None,
+               window: Optional[int] = DEFAULT_WINDOW_DAYS) -> CalendarSelection:
+        """
+        Rows a message needs: today +- `window` days plus every period and lunar day it mentions
+
+        :param text: User message; empty selects only the window around today
+        :param today: Reference day, the current date by default
+        :param window: Days either side of today, or None for the whole horizon
+        """
+        today = today or date.today()
+        horizon = DateRange(self.start, self.end) if self.days else None
+        ranges, full = mentioned_ranges(text, today, horizon) if text else ([], False)
+        if full or window is None:
+            return CalendarSelection(tuple(range(len(self.days))), today, True)
+
+        # A horizon that has not started yet, or has already ended, still shows its nearest days
+        anchor = min(max(today, self.start), self.end) if self.days else today
+        ranges.append(DateRange(anchor - timedelta(days=window), anchor + timedelta(days=window)))
+        positions = {position for span in ranges for position in self._positions(span)}
+        lunar_days = mentioned_lunar_days(text) if text else []
+        if lunar_days:
+            positions.update(position for position, lunar_day in enumerate(self.lunar_days) if lunar_day in lunar_days)
+        positions = sorted(positions)
+        return CalendarSelection(tuple(positions), today, len(positions) == len(self.days))
+
+    def render(self, header: str, selection: Optional[CalendarSelection] = None) -> List[str]:
+        """
+        Prompt lines for the selected rows
+
+        :param header: Column header line introducing the rows
+        :param selection: Rows to include; every row when omitted or full
+        """
+        if selection is None or selection.full:
+            return [header + ":"] + self.lines
+        lines = [
+            f"Today: {selection.today.isoformat()}",
+            f"{header}, {len(selection.positions)} of {len(self.days)} days "
+            f"(calendar covers {self.start.isoformat()} to {self.end.isoformat()}; "
+            f"other days are included when the user asks about them):",
+        ]
+        lines.extend(self.lines[position] for position in selection.positions)
+        return lines
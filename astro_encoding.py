@@ -0,0 +1,216 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from astro_calendar import Calendar, CalendarSelection
+
+# Columns emitted for every planet row, in order. `id`, `NakshatraName` (the same as
+# `nakshatra` in client payloads) and `NormDegree` (`sign_degree` as a decimal) are left
+# out: they add tokens to every prompt without telling the model anything new
+PLANET_COLUMNS = ("Name", "sign", "sign_degree", "House", "nakshatra", "sign_lord", "IsRetro")
+# Columns emitted for every calendar row, in order
+DATE_COLUMNS = ("date", "lunarDay", "nakshatra", "holidays")
+CALENDAR_HEADER = "Calendar (" + " | ".join(DATE_COLUMNS) + ")"
+
+ENCODED_CACHE_SIZE = 1024
+
+_encoded_cache: "OrderedDict[str, EncodedChart]" = OrderedDict()
+_encoded_cache_lock = threading.Lock()
+
+
+def chart_hash(astro_data: Dict[str, Any]) -> str:
+    """
+    Stable content hash of an astro payload, independent of its key order
+
+    Serializes the whole payload, so it is meant for giving a chart its ID
+    once (see chart_registry), not for every turn.
+
+    :param astro_data: Raw astro payload as received from the client
+    :return: Hex digest identifying the payload
+    """
+    canonical = json.dumps(astro_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def payload_digest(astro_data: Any) -> str:
+    """
+    Hash of a payload exactly as sent, key order included
+
+    Recognizes a client resending the same payload; the same chart with its
+    keys reordered gets another digest but the same `chart_hash`.
+    """
+    raw = json.dumps(astro_data, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _cell(value: Any) -> str:
+    if value is None or value == "":
+        return "-"
+    if isinstance(value, bool):
+        return "R" if value else "-"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return str(value)
+
+
+def _decode_nathal(nathal: Any) -> Any:
+    # `nathal` arrives as JSON encoded inside a JSON string
+    if isinstance(nathal, str):
+        try:
+            return json.loads(nathal)
+        except ValueError:
+            return nathal
+    return nathal
+
+
+def _encode_nathal(nathal: Any, lines: List[str]):
+    if not isinstance(nathal, dict):
+        lines.append(f"Natal chart: {_cell(nathal)}")
+        return
+
+    details = nathal.get("astro_details") or {}
+    if details:
+        lines.append("Natal details: " + "; ".join(f"{k}={_cell(v)}" for k, v in details.items()))
+
+    planets = nathal.get("planets_position") or []
+    if planets:
+        lines.append("Natal planets (" + " | ".join(PLANET_COLUMNS) + "):")
+        for planet in planets:
+            lines.append(" | ".join(_cell(planet.get(column)) for column in PLANET_COLUMNS))
+
+    for key, value in nathal.items():
+        if key not in ("astro_details", "planets_position"):
+            lines.append(f"Natal {key}: {_cell(value)}")
+
+
+def _row_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _lunar_day(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _encode_dates(dates: List[Dict[str, Any]]) -> Calendar:
+    return Calendar.from_rows(
+        (_row_date(row.get("date")), " | ".join(_cell(row.get(column)) for column in DATE_COLUMNS),
+         _lunar_day(row.get("lunarDay")))
+        for row in dates if isinstance(row, dict)
+    )
+
+
+class EncodedChart(NamedTuple):
+    # Lines before and after the calendar, which is rendered per question
+    head: List[str]
+    tail: List[str]
+    calendar: Calendar
+
+    def text(self, selection: Optional[CalendarSelection] = None) -> str:
+        """Encoded chart with the selected calendar rows, or every row when `selection` is None"""
+        calendar_lines = self.calendar.render(CALENDAR_HEADER, selection) if len(self.calendar) else []
+        return "\n".join(self.head + calendar_lines + self.tail)
+
+
+def encode_chart(astro_data: Dict[str, Any]) -> EncodedChart:
+    """
+    Encode an astro payload as compact tabular text (no caching)
+
+    :param astro_data: Raw astro payload, either the full response or its `data` block
+    :return: One line per planet and the additional attributes, plus the calendar indexed by date
+    """
+    data = astro_data.get("data", astro_data) if isinstance(astro_data, dict) else astro_data
+    if not isinstance(data, dict):
+        return EncodedChart([_cell(data)], [], Calendar([], []))
+
+    head: List[str] = []
+    tail: List[str] = []
+    calendar = None
+    for key, value in data.items():
+        lines = head if calendar is None else tail
+        if key == "nathal":
+            _encode_nathal(_decode_nathal(value), lines)
+        elif key == "additionals" and isinstance(value, dict):
+            lines.append("Additionals: " + "; ".join(f"{k}={_cell(v)}" for k, v in value.items()))
+        elif key == "dates" and isinstance(value, list):
+            calendar = _encode_dates(value)
+        else:
+            lines.append(f"{key}: {_cell(value)}")
+    return EncodedChart(head, tail, calendar or Calendar([], []))
+
+
+def encode_astro_payload(astro_data: Dict[str, Any]) -> str:
+    """Encode an astro payload with its whole calendar (no caching)"""
+    return encode_chart(astro_data).text()
+
+
+def encoded_chart(astro_data: Dict[str, Any], key: Optional[str] = None) -> EncodedChart:
+    """
+    Encoded chart and calendar index, reusing the cached encoding of an identical chart
+
+    :param astro_data: Raw astro payload
+    :param key: Chart ID or precomputed `payload_digest`, computed from the payload when omitted
+    """
+    key = key or payload_digest(astro_data)
+    with _encoded_cache_lock:
+        encoded = _encoded_cache.get(key)
+        if encoded is not None:
+            _encoded_cache.move_to_end(key)
+            return encoded
+
+    encoded = encode_chart(astro_data)
+
+    with _encoded_cache_lock:
+        _encoded_cache[key] = encoded
+        _encoded_cache.move_to_end(key)
+        while len(_encoded_cache) > ENCODED_CACHE_SIZE:
+            _encoded_cache.popitem(last=False)
+    return encoded
+
+
+def encode_astro_data(astro_data: Dict[str, Any], key: Optional[str] = None) -> str:
+    """
+    Encode an astro payload with its whole calendar, reusing the cached encoding of an identical chart
+
+    :param astro_data: Raw astro payload
+    :param key: Chart ID or precomputed `payload_digest`, computed from the payload when omitted
+    :return: Compact tabular text for the system prompt
+    """
+    return encoded_chart(astro_data, key).text()
+
+
+def format_astro_section(
+    astro_data: Dict[str, Any],
+    key: Optional[str] = None,
+    selection: Optional[CalendarSelection] = None,
+) -> str:
+    """
+    Build the `astro_data_section` spliced into the priestess instructions
+
+    :param astro_data: Raw astro payload (may be empty)
+    :param key: Chart ID or precomputed `payload_digest`, passed through to `encoded_chart`
+    :param selection: Calendar rows to include (see `Calendar.select`); the whole calendar when omitted
+    :return: Section text, or a bare newline when no data was supplied
+    """
+    if not astro_data:
+        return "\n"
+    return format_chart_section(encoded_chart(astro_data, key), selection)
+
+
+def format_chart_section(encoded: EncodedChart, selection: Optional[CalendarSelection] = None) -> str:
+    """`astro_data_section` for an already encoded chart, e.g. one from the chart registry"""
+    return f"\nAstrological Data:\n{encoded.text(selection)}\n"
+
+
+def clear_cache():
+    """Drop all cached encodings"""
+    with _encoded_cache_lock:
+        _encoded_cache.clear()
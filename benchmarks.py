@@ -0,0 +1,1062 @@
+"""
+Micro-benchmarks for the Luna graphs
+
+Run a single benchmark with `python benchmarks.py <name>`, or list them with
+`python benchmarks.py --help`. Benchmarks only use local data and fake models.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import timeit
+from typing import Any, Callable, Dict, Optional
+
+
+SAMPLE_PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suerdata.json")
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], None]] = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def load_sample_payload(path: str = SAMPLE_PAYLOAD_PATH) -> Dict[str, Any]:
+    # suerdata.json holds an example payload followed by its schema; use the example
+    with open(path, encoding="utf-8") as f:
+        payload, _ = json.JSONDecoder().raw_decode(f.read())
+    return payload
+
+
+def report(label: str, seconds: float, number: int):
+    print(f"{label:<40} {seconds / number * 1e6:10.1f} us/op")
+
+
+SAMPLE_REPLY = (
+    "Your Moon in Bharni speaks of a heart that carries great creative force, "
+    "and this lunar day invites you to rest before you begin something new. "
+    "What would feel nourishing to you this week?"
+)
+
+
+def fake_chat_model(reply: str = SAMPLE_REPLY, token_delay: float = 0.0):
+    """Local chat model that streams `reply` word by word, sleeping `token_delay` per chunk"""
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+
+    class SlowFakeChatModel(GenericFakeChatModel):
+        delay: float = 0.0
+
+        def _stream(self, *args, **kwargs):
+            for chunk in super()._stream(*args, **kwargs):
+                time.sleep(self.delay)
+                yield chunk
+
+    def replies():
+        while True:
+            yield AIMessage(content=reply)
+
+    return SlowFakeChatModel(messages=replies(), delay=token_delay)
+
+
+def sleepy_chat_model(delay: float, reply: str = SAMPLE_REPLY, reply_for: Optional[Callable[[list], str]] = None):
+    """
+    Local chat model whose calls take `delay` seconds: a blocking sleep when sync, asyncio.sleep when async
+
+    `reply_for`, when given, builds each reply from the prompt messages instead of repeating `reply`.
+    """
+    import asyncio
+
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class SleepyChatModel(BaseChatModel):
+        delay: float
+        reply: str
+        reply_for: Any = None
+        calls: int = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "sleepy-fake"
+
+        def _result(self, messages) -> ChatResult:
+            self.calls += 1
+            reply = self.reply_for(messages) if self.reply_for is not None else self.reply
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.delay)
+            return self._result(messages)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.delay)
+            return self._result(messages)
+
+    return SleepyChatModel(delay=delay, reply=reply, reply_for=reply_for)
+
+
+def load_graph_module(name: str):
+    # The benchmarks swap every model for a fake; the key only satisfies validation
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    # Charts registered by the graphs stay in memory
+    os.environ.setdefault("CHART_REGISTRY_PATH", "")
+    return __import__(name)
+
+
+@benchmark("astro-encoding")
+def bench_astro_encoding(args: argparse.Namespace):
+    import astro_encoding
+
+    payload = load_sample_payload()
+    number = args.number
+
+    def cold():
+        astro_encoding.clear_cache()
+        return astro_encoding.format_astro_section(payload)
+
+    report("json.dumps(indent=2)", timeit.timeit(lambda: json.dumps(payload, indent=2), number=number), number)
+    report("encode_astro_data (cold cache)", timeit.timeit(cold, number=number), number)
+    report("encode_astro_data (warm cache)",
+           timeit.timeit(lambda: astro_encoding.format_astro_section(payload), number=number), number)
+
+    pretty = json.dumps(payload, indent=2)
+    compact = astro_encoding.format_astro_section(payload)
+    print(f"prompt chars: json.dumps={len(pretty)} compact={len(compact)} "
+          f"({len(compact) / len(pretty):.0%})")
+
+
+def synthetic_payload(days: int, start: str = "2025-01-01") -> Dict[str, Any]:
+    """The sample chart with a calendar of `days` consecutive days"""
+    from datetime import date, timedelta
+
+    payload = load_sample_payload()
+    first = date.fromisoformat(start)
+    payload["data"]["dates"] = [
+        {"lunarDay": day % 30 + 1, "date": (first + timedelta(days=day)).isoformat(),
+         "nakshatra": str(day % 27 + 1), "holidays": "Ekadashi" if day % 15 == 10 else None}
+        for day in range(days)
+    ]
+    return payload
+
+
+CALENDAR_QUESTIONS = (
+    "What does my Moon in Bharni mean?",
+    "Is tomorrow a good day to start something new?",
+    "What should I expect next week?",
+    "What about 2025-03-08 and 10-15 April?",
+    "Show me the whole year",
+)
+
+
+@benchmark("calendar")
+def bench_calendar(args: argparse.Namespace):
+    from datetime import date
+
+    import astro_encoding
+
+    today = date(2025, 1, 10)
+    for days in (31, 90, 365):
+        payload = synthetic_payload(days)
+        chart = astro_encoding.encoded_chart(payload)
+        full = len(astro_encoding.format_astro_section(payload))
+        print(f"{days} days: whole calendar {full} chars")
+        for question in CALENDAR_QUESTIONS:
+            selection = chart.calendar.select(question, today)
+            sliced = len(astro_encoding.format_astro_section(payload, selection=selection))
+            seconds = timeit.timeit(lambda: chart.calendar.select(question, today), number=args.number)
+            print(f"  {question[:38]:<40} {len(selection.positions):4d} days {sliced:6d} chars "
+                  f"({sliced / full:4.0%})  select {seconds / args.number * 1e6:6.1f} us")
+
+
+@benchmark("astro-parser")
+def bench_astro_parser(args: argparse.Namespace):
+    """Parse time and retained memory of year-long payloads: generic dicts vs streamed typed records"""
+    import gc
+    import tracemalloc
+    from datetime import date, timedelta
+
+    from astro_parser import parse_chart, parse_chart_stream
+
+    def decode_generic(raw: bytes):
+        payload = json.loads(raw)
+        payload["data"]["nathal"] = json.loads(payload["data"]["nathal"])
+        return payload
+
+    users = args.users
+    # A different horizon start per user, so no two payloads are identical
+    raws = [json.dumps(synthetic_payload(365, (date(2025, 1, 1) + timedelta(days=user % 90)).isoformat()),
+                       ensure_ascii=False).encode("utf-8") for user in range(users)]
+    print(f"{users} users, 365-day payloads of {len(raws[0]) / 1024:.1f} KiB")
+
+    parsers = (
+        ("json.loads + nathal (dicts)", decode_generic),
+        ("parse_chart_stream (records)", parse_chart_stream),
+        ("json.loads + parse_chart", lambda raw: parse_chart(json.loads(raw))),
+    )
+    for label, parse in parsers:
+        gc.collect()
+        start = time.perf_counter()
+        parsed = [parse(raw) for raw in raws]
+        elapsed = time.perf_counter() - start
+        del parsed
+        gc.collect()
+
+        tracemalloc.start()
+        parse(raws[0])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        parsed = [parse(raw) for raw in raws]
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del parsed
+        print(f"{label:<30} {elapsed / users * 1e6:8.1f} us/payload  retained {retained / users / 1024:6.1f} KiB/user "
+              f"({retained / 2 ** 20:7.1f} MiB total)  parse peak {peak / 1024:6.1f} KiB")
+
+
+@benchmark("chart-registry")
+def bench_chart_registry(args: argparse.Namespace):
+    """Request bytes, per-turn chart handling and checkpoint bytes, chart sent inline every turn vs by ID"""
+    import tempfile
+
+    from langchain_core.messages import HumanMessage
+
+    import providers
+    from checkpoint_store import SQLiteDeltaSaver
+
+    ai_birthchart = load_graph_module("ai_birthchart")
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", fake_chat_model(token_delay=0))
+    payload = load_sample_payload()
+    chart_id = ai_birthchart.register_chart(payload)
+    question = HumanMessage(content="What does my Moon in Bharni mean?")
+
+    inline_request = json.dumps({"messages": [{"role": "user", "content": question.content}], "astro_data": payload})
+    id_request = json.dumps({"messages": [{"role": "user", "content": question.content}], "chart_id": chart_id})
+    print(f"request bytes: inline {len(inline_request.encode())}  by id {len(id_request.encode())}")
+
+    # The server receives the payload as JSON and hashes it to find its cached encoding
+    inline_state = lambda: {"messages": [question], "astro_data": json.loads(json.dumps(payload))}
+    report("prepare_messages (chart inline)",
+           timeit.timeit(lambda: ai_birthchart.prepare_messages(inline_state()), number=args.number), args.number)
+    report("prepare_messages (chart_id)",
+           timeit.timeit(lambda: ai_birthchart.prepare_messages({"messages": [question], "chart_id": chart_id}),
+                         number=args.number), args.number)
+
+    turns = 20
+    with tempfile.TemporaryDirectory() as directory:
+        for label, first, rest in (
+            ("chart inline every turn", {"astro_data": payload}, {"astro_data": payload}),
+            ("chart_id on first turn", {"chart_id": chart_id}, {}),
+        ):
+            saver = SQLiteDeltaSaver(os.path.join(directory, f"{len(rest)}.sqlite3"), compact_every=0)
+            graph = ai_birthchart.build_graph(saver)
+            config = {"configurable": {"thread_id": "user"}}
+            for turn in range(turns):
+                graph.invoke({"messages": [HumanMessage(content=f"Turn {turn}: what about my Moon?")],
+                              **(rest if turn else first)}, config)
+            print(f"{label:<26} {saver.bytes_written / turns / 1024:6.1f} KiB checkpointed/turn")
+    print(f"registry: {ai_birthchart.get_chart_registry().stats()}")
+
+
+# (intent, relevant planet, paraphrases); {nakshatra} is the asker's Moon nakshatra
+CACHE_INTENTS = (
+    ("moon", "Moon", ("What does my Moon in {nakshatra} mean?", "what does my moon in {nakshatra} mean",
+                      "What does my Moon in {nakshatra} mean for me?")),
+    ("moon", "Moon", ("Что значит моя Луна в {nakshatra}?", "что значит моя луна в {nakshatra}")),
+    ("sun", "Sun", ("What does my Sun sign say about me?", "what does my sun sign say about me",
+                    "What does my Sun sign say about who I am?")),
+    ("today", None, ("Is today good for starting something?", "is today a good day for starting something",
+                     "Is today good for starting something new?")),
+    # Worded like "today" but asking something else: the signature separates the first, only the threshold the second
+    ("tomorrow", None, ("Is tomorrow good for starting something?",)),
+    ("ending", None, ("Is today good for ending something?",)),
+    ("purpose", None, ("What is my life purpose?", "what is my life purpose", "What's my life purpose?")),
+)
+
+
+def cache_workload_chart(rng, variants: int) -> Dict[str, Any]:
+    """Calendar around today; Moon, Sun and Ascendant drawn from `variants` placements, degrees unique per user"""
+    from datetime import date, timedelta
+
+    payload = synthetic_payload(60, (date.today() - timedelta(days=30)).isoformat())
+    nathal = json.loads(payload["data"]["nathal"])
+    nakshatras = ("Ashwini", "Bharni", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu", "Pushya")
+    signs = ("Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio")
+    for planet in nathal["planets_position"]:
+        if planet["Name"] in ("Moon", "Sun", "Ascendant"):
+            variant = rng.randrange(variants)
+            planet.update(sign=signs[variant % len(signs)], nakshatra=nakshatras[variant % len(nakshatras)],
+                          House=variant % 12 + 1)
+        planet["sign_degree"] = f"{rng.randrange(30)}:{rng.randrange(60)}:{rng.randrange(60)}"
+    payload["data"]["nathal"] = json.dumps(nathal, ensure_ascii=False)
+    return payload
+
+
+@benchmark("response-cache")
+def bench_response_cache(args: argparse.Namespace):
+    """Hit rate, model calls and time saved, true and audited false hits of the semantic response cache"""
+    import random
+    import re
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    import providers
+    from response_cache import HashingEmbeddings, SemanticResponseCache, detect_script
+
+    ai_birthchart = load_graph_module("ai_birthchart")
+    # Audited false hits are logged as warnings; the totals below are enough
+    logging.getLogger("response_cache").setLevel(logging.ERROR)
+    intents = {paraphrase.format(nakshatra=nakshatra): (intent, planet)
+               for intent, planet, paraphrases in CACHE_INTENTS for paraphrase in paraphrases
+               for nakshatra in ("Ashwini", "Bharni", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu", "Pushya")}
+
+    def reply_for(messages) -> str:
+        # The right answer depends on the intent, the reply language and the chart rows the intent reads
+        question = messages[-1].content
+        intent, planet = intents[question]
+        system = messages[0].content
+        if planet:
+            row = re.search(rf"^{planet} \| (\w+) \| [^|]+ \| (\w+) \| (\w+)", system, re.M).groups()
+        elif intent == "purpose":
+            row = tuple(re.search(rf"^{name} \| (\w+)", system, re.M).group(1) for name in ("Ascendant", "Sun", "Moon"))
+        else:
+            row = re.search(r"^Today: (.*)$", system, re.M).groups()
+        return f"{intent} {detect_script(question)} {' '.join(row)}"
+
+    rng = random.Random(0)
+    requests = []
+    for _ in range(args.users):
+        chart_id = ai_birthchart.register_chart(cache_workload_chart(rng, args.variants))
+        planets = ai_birthchart.get_chart_registry().get(chart_id).chart.planets
+        moon = next(planet for planet in planets if planet.name == "Moon").nakshatra
+        _, _, paraphrases = rng.choice(CACHE_INTENTS)
+        question = rng.choice(paraphrases).format(nakshatra=moon)
+        # A share of turns are follow-ups, which always go to the model
+        history = [HumanMessage(content="Hello"), AIMessage(content="Welcome")] if rng.random() < 0.2 else []
+        requests.append({"messages": history + [HumanMessage(content=question)], "chart_id": chart_id})
+    print(f"{args.users} users, {args.variants} Moon/Sun/Ascendant placements, model latency {args.llm_delay * 1e3:.0f} ms, "
+          f"{args.workers} workers")
+
+    # 0.5 is deliberately loose, to show false hits and the audit catching them
+    for threshold in (0.5, 0.8, 0.9, 0.95):
+        model = sleepy_chat_model(args.llm_delay, reply_for=reply_for)
+        cache = SemanticResponseCache(HashingEmbeddings(), threshold=threshold, audit_rate=0.1, seed=0)
+        providers.override(f"chat:{ai_birthchart.MODEL_NAME}", model)
+        providers.override("ai_birthchart.response_cache", cache)
+        graph = ai_birthchart.build_graph()
+
+        def ask(request):
+            reply = graph.invoke(request)["messages"][-1].content
+            # What the model answers for this exact prompt
+            messages, _ = ai_birthchart.prepare_messages(request)
+            return reply != reply_for(messages)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as pool:
+            false_hits = sum(pool.map(ask, requests))
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        print(f"threshold {threshold:.2f}: {elapsed:6.2f} s  model calls {model.calls:5d}/{len(requests)}  "
+              f"hit rate {stats['hit_rate']:.1%}  bypasses {stats['bypasses']}  "
+              f"saved {stats['latency_saved_seconds']:.1f} s of model time  "
+              f"false hits {false_hits} ({false_hits / max(1, stats['hits']):.1%} of hits)  "
+              f"audit: {stats['false_hits']}/{stats['audited']} false ({stats['false_hit_rate']:.1%})")
+    providers.reset("ai_birthchart.response_cache")
+
+
+@benchmark("ttfb")
+def bench_time_to_first_byte(args: argparse.Namespace):
+    from langchain_core.messages import HumanMessage
+
+    import providers
+
+    ai_birthchart = load_graph_module("ai_birthchart")
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", fake_chat_model(token_delay=args.token_delay))
+    inputs = {"messages": [HumanMessage(content="What does my Moon in Bharni mean?")],
+              "astro_data": load_sample_payload()}
+
+    start = time.perf_counter()
+    ai_birthchart.graph.invoke(inputs)
+    print(f"{'invoke: full reply':<40} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+    start = time.perf_counter()
+    first = None
+    for chunk, metadata in ai_birthchart.graph.stream(inputs, stream_mode="messages"):
+        if first is None and chunk.content:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    print(f"{'stream: first token':<40} {first * 1e3:10.1f} ms")
+    print(f"{'stream: full reply':<40} {total * 1e3:10.1f} ms")
+
+
+@benchmark("concurrency")
+def bench_concurrency(args: argparse.Namespace):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import HumanMessage
+
+    import providers
+
+    ai_birthchart = load_graph_module("ai_birthchart")
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", sleepy_chat_model(args.llm_delay))
+    payload = load_sample_payload()
+
+    def inputs(session: int):
+        return {"messages": [HumanMessage(content=f"Session {session}: is today good for new beginnings?")],
+                "astro_data": payload}
+
+    async def run_async(sessions: int):
+        await asyncio.gather(*(ai_birthchart.graph.ainvoke(inputs(i)) for i in range(sessions)))
+
+    # Warm up imports, the chart cache and the graph before measuring
+    asyncio.run(run_async(10))
+    # Turns/s is capped by CPU time per turn times the cores available, however long the LLM takes
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"fake LLM latency {args.llm_delay * 1e3:.0f} ms, sync thread pool of {args.workers} workers, "
+          f"{cores} CPU core(s)")
+    for sessions in args.sessions:
+        start, cpu_start = time.perf_counter(), time.process_time()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(lambda i: ai_birthchart.graph.invoke(inputs(i)), range(sessions)))
+        sync_elapsed, sync_cpu = time.perf_counter() - start, time.process_time() - cpu_start
+
+        start, cpu_start = time.perf_counter(), time.process_time()
+        asyncio.run(run_async(sessions))
+        async_elapsed, async_cpu = time.perf_counter() - start, time.process_time() - cpu_start
+
+        print(f"{sessions:>5} sessions: sync {sessions / sync_elapsed:8.1f} turns/s "
+              f"({sync_cpu / sessions * 1e3:.1f} ms CPU/turn)   "
+              f"async {sessions / async_elapsed:8.1f} turns/s ({async_cpu / sessions * 1e3:.1f} ms CPU/turn)")
+
+
+@benchmark("fanout")
+def bench_fanout(args: argparse.Namespace):
+    # Translation memory would turn every repeat into a hit
+    os.environ["TRANSLATION_MEMORY_PATH"] = ""
+    import providers
+
+    translator_engine = load_graph_module("translator_engine")
+    providers.override(f"chat:{translator_engine.MODEL_NAME}", sleepy_chat_model(args.llm_delay))
+    languages = list(translator_engine.LANGUAGES)
+
+    start = time.perf_counter()
+    for language in languages:
+        translator_engine.translate_text(SAMPLE_REPLY, language)
+    print(f"{'serial, ' + str(len(languages)) + ' languages':<40} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+    start = time.perf_counter()
+    translator_engine.fan_out_translate(SAMPLE_REPLY, languages)
+    print(f"{'fan_out_translate':<40} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+
+STARTUP_SCRIPT = """
+import importlib.util, json, resource, sys, time
+start = time.perf_counter()
+modules = {}
+for name, spec in json.load(open("langgraph.json"))["graphs"].items():
+    path, attr = spec.split(":")
+    if path not in modules:
+        module_spec = importlib.util.spec_from_file_location(path[2:-3], path)
+        modules[path] = importlib.util.module_from_spec(module_spec)
+        sys.modules[module_spec.name] = modules[path]
+        module_spec.loader.exec_module(modules[path])
+    getattr(modules[path], attr)
+elapsed = time.perf_counter() - start
+print(len(modules), elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+@benchmark("startup")
+def bench_startup(args: argparse.Namespace):
+    """Load every graph in langgraph.json like the server does; run at two commits to compare"""
+    import subprocess
+    import sys
+
+    import statistics
+
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    runs = []
+    for run in range(args.repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, check=True,
+                                capture_output=True, text=True).stdout.split()
+        modules, elapsed, max_rss_kb = int(output[0]), float(output[1]), int(output[2])
+        runs.append((elapsed, max_rss_kb))
+        print(f"run {run}: {modules} graph modules loaded in {elapsed * 1e3:8.1f} ms, "
+              f"max RSS {max_rss_kb / 1024:7.1f} MiB")
+    # Single runs vary by a few hundred ms; compare medians between commits
+    print(f"median: {statistics.median(r[0] for r in runs) * 1e3:8.1f} ms, "
+          f"max RSS {statistics.median(r[1] for r in runs) / 1024:7.1f} MiB")
+
+
+def synthetic_embeddings(count: int, dims: int, topics: int = 200, seed: int = 0):
+    """Normalized vectors drawn around `topics` centres, roughly like a user's conversation memories"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dims)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, count)] + 0.6 * rng.standard_normal((count, dims)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_ms(samples, percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))] * 1e3
+
+
+@benchmark("ann")
+def bench_ann(args: argparse.Namespace):
+    import numpy as np
+
+    from ann_index import IVFIndex
+
+    k = 3
+    for size in args.sizes:
+        vectors = synthetic_embeddings(size, args.dims)
+        queries = synthetic_embeddings(args.queries, args.dims, seed=1)
+        positions = np.arange(size)
+
+        exact, brute_latency = [], []
+        for query in queries:
+            start = time.perf_counter()
+            scores = vectors @ query
+            top = np.argpartition(-scores, k - 1)[:k]
+            brute_latency.append(time.perf_counter() - start)
+            exact.append(set(top.tolist()))
+        print(f"{size:>7} memories  brute force      recall@3 1.000  p99 {percentile_ms(brute_latency, 99):7.3f} ms")
+
+        start = time.perf_counter()
+        index = IVFIndex(lambda p: vectors[p])
+        index.build(vectors, positions)
+        print(f"{'':>7} build {time.perf_counter() - start:6.2f} s, nlist {len(index.lists)}")
+        for nprobe in args.nprobe:
+            hits, latency = 0, []
+            for query, truth in zip(queries, exact):
+                start = time.perf_counter()
+                found, _ = index.search(query, k, nprobe=nprobe)
+                latency.append(time.perf_counter() - start)
+                hits += len(truth & set(found.tolist()))
+            print(f"{'':>7} IVF nprobe={nprobe:<4}      recall@3 {hits / (k * len(queries)):.3f}  "
+                  f"p99 {percentile_ms(latency, 99):7.3f} ms")
+
+
+@benchmark("quantization")
+def bench_quantization(args: argparse.Namespace):
+    """Recall@10 against exact float32 search, latency and searched bytes per vector for int8 and product codes"""
+    import tempfile
+
+    import numpy as np
+
+    from memory_store import DEFAULT_QUANTIZATION_CONFIG, NamespaceVectors
+    from vector_quantization import DEFAULT_RERANK
+
+    k = 10
+    variants = [("float32", None)] + [
+        (f"{kind} rerank x{rerank}", {**DEFAULT_QUANTIZATION_CONFIG, "type": kind, "rerank": rerank, "min_size": 0})
+        for kind, rerank in (("int8", 1), ("int8", DEFAULT_RERANK["int8"]), ("pq", 1), ("pq", DEFAULT_RERANK["pq"]))
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            vectors = synthetic_embeddings(size, args.dims)
+            queries = synthetic_embeddings(args.queries, args.dims, seed=1)
+            path = os.path.join(directory, f"{size}.f32")
+            vectors.tofile(path)
+            exact = [set(np.argpartition(-(vectors @ query), k - 1)[:k].tolist()) for query in queries]
+            keys = [str(row) for row in range(size)]
+            print(f"{size} vectors of {args.dims} dims, exact scan (no IVF)")
+            for label, quantization in variants:
+                start = time.perf_counter()
+                namespace = NamespaceVectors(path, args.dims, keys, list(range(size)), None, quantization)
+                namespace.search(queries[0], k)
+                namespace.wait_for_rebuild()
+                built = time.perf_counter() - start
+                hits, latency = 0, []
+                for query, truth in zip(queries, exact):
+                    start = time.perf_counter()
+                    found = namespace.search(query, k)
+                    latency.append(time.perf_counter() - start)
+                    hits += len(truth & {int(key) for key, _ in found})
+                searched = namespace.codes.nbytes if namespace.codes is not None else vectors.nbytes
+                print(f"  {label:<18} {searched / size:7.1f} B/vector ({vectors.nbytes / searched:5.1f}x smaller)  "
+                      f"recall@{k} {hits / (k * len(queries)):.3f}  p50 {percentile_ms(latency, 50):7.2f} ms  "
+                      f"p99 {percentile_ms(latency, 99):7.2f} ms  build {built:5.2f} s")
+
+
+def slow_fake_embeddings(delay: float, dims: int = 768):
+    """Deterministic local embeddings whose every call takes `delay` seconds; counts its calls"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    class SlowFakeEmbedding(DeterministicFakeEmbedding):
+        delay: float = 0.0
+        calls: int = 0
+
+        def embed_documents(self, texts):
+            self.calls += 1
+            time.sleep(self.delay)
+            return super().embed_documents(texts)
+
+        def embed_query(self, text):
+            self.calls += 1
+            time.sleep(self.delay)
+            return super().embed_query(text)
+
+    return SlowFakeEmbedding(size=dims, delay=delay)
+
+
+@benchmark("embeddings")
+def bench_embeddings(args: argparse.Namespace):
+    """Per-turn query + memory embeds from concurrent sessions, direct vs cached and batched"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from embedding_cache import CachedEmbeddings
+
+    # A few questions recur across sessions, as they do in practice
+    questions = [f"What does my Moon in nakshatra {i % 27} mean for this week?" for i in range(200)]
+
+    def turn(embeddings, session: int, turn_index: int):
+        question = questions[(session * 7 + turn_index) % len(questions)]
+        embeddings.embed_query(question)
+        embeddings.embed_documents([json.dumps({"user_message": question, "ai_response": f"{session}:{turn_index}"})])
+
+    for sessions in args.sessions:
+        for label in ("direct", "cached"):
+            model = slow_fake_embeddings(args.embed_delay, args.dims)
+            embeddings = model if label == "direct" else CachedEmbeddings(model, model_name="fake")
+            start = time.perf_counter()
+            with ThreadPoolExecutor(min(sessions, args.workers)) as pool:
+                list(pool.map(lambda s: [turn(embeddings, s, t) for t in range(3)], range(sessions)))
+            elapsed = time.perf_counter() - start
+            line = f"{sessions:>5} sessions {label:<7} {elapsed:7.2f} s  {model.calls:6d} embedding calls"
+            if label == "cached":
+                stats = embeddings.stats()
+                line += (f"  hit rate {stats['hit_rate']:.2f}  mean batch {stats['mean_batch_size']:.1f}  "
+                         f"p50 {stats['p50_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms")
+            print(line)
+
+
+@benchmark("memory-writes")
+def bench_memory_writes(args: argparse.Namespace):
+    """Memo bot turn latency with memories written inline vs by the write-behind queue"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import HumanMessage
+    from langgraph.store.memory import InMemoryStore
+
+    import providers
+
+    memo = load_graph_module("ai_birthchart_memo_langBOT")
+    providers.override(f"chat:{memo.MODEL_NAME}", sleepy_chat_model(args.turn_llm_delay))
+    turns = 5
+
+    for sessions in args.sessions:
+        for write_behind in (False, True):
+            embeddings = slow_fake_embeddings(args.embed_delay, args.dims)
+            store = InMemoryStore(index={"embed": embeddings, "dims": args.dims})
+            manager = memo.MemoryManager(embeddings, memo.get_llm(), store=store, write_behind=write_behind)
+            providers.override("memo.memory_manager", manager)
+
+            def session(user: int):
+                config = {"configurable": {"user_id": f"user-{user}"}}
+                latencies = []
+                for turn in range(turns):
+                    state = {"messages": [HumanMessage(content=f"Turn {turn}: what about my Moon?")]}
+                    start = time.perf_counter()
+                    memo.priestess(state, config)
+                    latencies.append(time.perf_counter() - start)
+                return latencies
+
+            with ThreadPoolExecutor(min(sessions, args.workers)) as pool:
+                latencies = [sample for samples in pool.map(session, range(sessions)) for sample in samples]
+            if manager.write_queue is not None:
+                manager.write_queue.close()
+            stored = sum(len(store.search(("user_memories", f"user-{user}"), limit=turns)) for user in range(sessions))
+            label = "write-behind" if write_behind else "inline"
+            print(f"{sessions:>5} sessions {label:<13} turn p50 {percentile_ms(latencies, 50):7.1f} ms  "
+                  f"p99 {percentile_ms(latencies, 99):7.1f} ms  {stored}/{sessions * turns} memories stored")
+
+
+PLANETS = ["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu", "Ketu"]
+NAKSHATRAS = ["Ashwini", "Bharni", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu", "Pushya", "Ashlesha",
+              "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta", "Chitra", "Swati", "Vishakha", "Anuradha",
+              "Jyeshtha", "Mula", "Purva Ashadha", "Uttara Ashadha", "Shravana", "Dhanishta", "Shatabhisha",
+              "Purva Bhadrapada", "Uttara Bhadrapada", "Revati"]
+SMALL_TALK = ["I feel tired and a bit lost this week", "My sister is visiting and I am nervous about it",
+              "Work has been stressful, what should I focus on?", "I want to start painting again",
+              "Is this a good time to rest?", "I had a strange dream last night"]
+# Vague follow-ups that share few words with the stored conversation
+PARAPHRASES = ["How can I find some calm?", "Why am I so exhausted lately?", "Any advice on family visits?",
+               "Should I pick up a creative hobby?", "What do my dreams mean?"]
+
+
+def synthetic_conversation(size: int, seed: int = 0):
+    """Memo bot memories: questions about placements and lunar days mixed with small talk"""
+    import random
+
+    rng = random.Random(seed)
+    memories = []
+    for _ in range(size):
+        if rng.random() < 0.6:
+            planet, nakshatra, day = rng.choice(PLANETS), rng.choice(NAKSHATRAS), rng.randint(1, 30)
+            memories.append({
+                "user_message": f"What does {planet} in {nakshatra} mean for me on lunar day {day}?",
+                "ai_response": f"{planet} in {nakshatra} on lunar day {day} asks you to slow down and listen.",
+            })
+        else:
+            memories.append({"user_message": rng.choice(SMALL_TALK), "ai_response": "Take a breath, dear one."})
+    return memories
+
+
+@benchmark("hybrid")
+def bench_hybrid_retrieval(args: argparse.Namespace):
+    """Memory retrieval latency, embedding calls and exact-term hits: vector only, fused, fused with keyword fast path"""
+    import random
+
+    from langgraph.store.memory import InMemoryStore
+
+    memo = load_graph_module("ai_birthchart_memo_langBOT")
+    memories = synthetic_conversation(args.number)
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        if rng.random() < 0.5:
+            planet, nakshatra = rng.choice(PLANETS), rng.choice(NAKSHATRAS)
+            queries.append((f"What does {planet} in {nakshatra} mean for me?", (planet, nakshatra)))
+        else:
+            queries.append((rng.choice(SMALL_TALK + PARAPHRASES), None))
+
+    modes = [("vector only", False, 0.0), ("hybrid", True, 1.01), ("hybrid + fast path", True, memo.LEXICAL_CONFIDENCE)]
+    for label, hybrid, confidence in modes:
+        embeddings = slow_fake_embeddings(0.0, args.dims)
+        store = InMemoryStore(index={"embed": embeddings, "dims": args.dims})
+        manager = memo.MemoryManager(embeddings, None, store=store, write_behind=False, hybrid=hybrid,
+                                     lexical_confidence=confidence)
+        for memory in memories:
+            manager.store_memory("user", memory)
+        embeddings.delay, embeddings.calls = args.embed_delay, 0
+
+        latencies, exact_hits, exact_queries = [], 0, 0
+        for query, terms in queries:
+            start = time.perf_counter()
+            found = manager.retrieve_memories("user", query)
+            latencies.append(time.perf_counter() - start)
+            if terms is not None:
+                exact_queries += 1
+                exact_hits += any(all(term in memory.get("user_message", "") for term in terms) for memory in found)
+        print(f"{label:<20} p50 {percentile_ms(latencies, 50):7.1f} ms  p99 {percentile_ms(latencies, 99):7.1f} ms  "
+              f"embedding calls {embeddings.calls:4d}/{len(queries)}  exact-term hit@3 {exact_hits / exact_queries:.2f}")
+
+
+def reply_graph(checkpointer):
+    """One-node message graph that answers every turn with SAMPLE_REPLY"""
+    from typing import Annotated, List
+
+    from langchain_core.messages import AIMessage
+    from langgraph.graph import END, START, StateGraph
+    from langgraph.graph.message import add_messages
+    from typing_extensions import TypedDict
+
+    class State(TypedDict):
+        messages: Annotated[List, add_messages]
+
+    builder = StateGraph(State)
+    builder.add_node("priestess", lambda state: {"messages": [AIMessage(content=SAMPLE_REPLY)]})
+    builder.add_edge(START, "priestess")
+    builder.add_edge("priestess", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+@benchmark("checkpoints")
+def bench_checkpoints(args: argparse.Namespace):
+    """Checkpoint bytes and latency per turn as a thread grows, full snapshots vs message deltas, and reopen cost"""
+    import tempfile
+
+    from langchain_core.messages import HumanMessage
+
+    from checkpoint_store import SQLiteDeltaSaver
+
+    build = reply_graph
+    turns = 200
+    with tempfile.TemporaryDirectory() as directory:
+        for label, interval in (("full snapshots", 0), ("message deltas", 50)):
+            saver = SQLiteDeltaSaver(os.path.join(directory, f"{interval}.sqlite3"), snapshot_interval=interval,
+                                     compact_every=0)
+            graph = build(saver)
+            config = {"configurable": {"thread_id": "long"}}
+            for turn in range(turns):
+                if turn == turns - 20:
+                    written, start = saver.bytes_written, time.perf_counter()
+                graph.invoke({"messages": [HumanMessage(content=f"Turn {turn}: what about my Moon?")]}, config)
+            per_turn = (saver.bytes_written - written) / 20
+            print(f"{label:<16} turn {turns}: {per_turn / 1024:8.1f} KiB written/turn  "
+                  f"{(time.perf_counter() - start) / 20 * 1e3:6.2f} ms/turn")
+
+        path = os.path.join(directory, "many.sqlite3")
+        graph = build(SQLiteDeltaSaver(path, compact_every=0))
+        for thread in range(args.number // 10):
+            for turn in range(10):
+                graph.invoke({"messages": [HumanMessage(content=f"Turn {turn}")]},
+                             {"configurable": {"thread_id": f"user-{thread}"}})
+        start = time.perf_counter()
+        graph = build(SQLiteDeltaSaver(path))
+        opened = time.perf_counter() - start
+        graph.get_state({"configurable": {"thread_id": "user-7"}})
+        print(f"reopen with {args.number // 10} threads: {opened * 1e3:.1f} ms, first thread resumed after "
+              f"{(time.perf_counter() - start) * 1e3:.1f} ms, file {os.path.getsize(path) / 1024:.0f} KiB")
+
+
+@benchmark("retention")
+def bench_retention(args: argparse.Namespace):
+    """Bytes reclaimed and sweep time for memory quotas, a byte budget and thread TTL, in-memory and on disk"""
+    import tempfile
+    from datetime import datetime, timedelta, timezone
+
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.store.base import PutOp
+    from langgraph.store.memory import InMemoryStore
+
+    from checkpoint_store import SQLiteDeltaSaver
+    from memory_consolidation import MEMORY_NAMESPACE
+    from memory_store import PersistentVectorStore
+    from retention import RetentionSweeper, memory_usage, thread_usage
+
+    threads, users, per_user = args.number // 10, 50, 200
+    conversation = synthetic_conversation(per_user)
+    with tempfile.TemporaryDirectory() as directory:
+        backends = [
+            ("in-memory", lambda: MemorySaver(), lambda index: InMemoryStore(index=index), None),
+            ("sqlite", lambda: SQLiteDeltaSaver(os.path.join(directory, "checkpoints.sqlite3"), compact_every=0),
+             lambda index: PersistentVectorStore(os.path.join(directory, "memory"), index=index),
+             lambda: sum(os.path.getsize(os.path.join(root, name))
+                         for root, _, names in os.walk(directory) for name in names)),
+        ]
+        for label, make_checkpointer, make_store, disk_size in backends:
+            checkpointer = make_checkpointer()
+            store = make_store({"embed": slow_fake_embeddings(0, args.dims), "dims": args.dims})
+            graph = reply_graph(checkpointer)
+            for thread in range(threads):
+                for turn in range(10):
+                    graph.invoke({"messages": [HumanMessage(content=f"Turn {turn}")]},
+                                 {"configurable": {"thread_id": f"user-{thread}"}})
+            for user in range(users):
+                store.batch([PutOp((MEMORY_NAMESPACE, f"user-{user}"), f"m{index}", {"data": memory, "turn": index})
+                             for index, memory in enumerate(conversation)])
+
+            sweeper = RetentionSweeper(checkpointer, store, thread_ttl_days=0, memory_quota=0, protect_recent=0)
+            stored = (sum(thread.bytes for thread in thread_usage(checkpointer))
+                      + sum(memory.bytes for memories in memory_usage(store).values() for memory in memories))
+            print(f"{label}: {threads} threads, {users * per_user} memories"
+                  + (f", {disk_size() / 1024:.0f} KiB on disk" if disk_size else ""))
+            phases = [
+                ("none", {}, None),
+                ("quota", {"memory_quota": per_user // 2}, None),
+                ("byte budget", {"byte_budget": stored // 4}, None),
+                ("thread TTL", {"thread_ttl_days": 30}, datetime.now(timezone.utc) + timedelta(days=31)),
+            ]
+            for phase, settings, now in phases:
+                for name, value in settings.items():
+                    setattr(sweeper, name, value)
+                result = sweeper.sweep(now)
+                print(f"  {phase:<12} -{result['expired_threads'] + result['evicted_threads']:>5} threads "
+                      f"-{result['trimmed_memories'] + result['evicted_memories']:>6} memories  "
+                      f"{result['reclaimed_bytes'] / 1024:9.0f} KiB reclaimed  "
+                      f"{result['disk_bytes_freed'] / 1024:7.0f} KiB freed on disk  {result['seconds'] * 1e3:7.1f} ms")
+            if disk_size:
+                print(f"  {disk_size() / 1024:.0f} KiB on disk after sweeping")
+
+
+def fake_memory_shard(path: str, embed_delay: float, llm_delay: float, dims: int):
+    """Shard server process with fake models and an in-memory store; spawn target of the shards benchmark"""
+    import providers
+
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    memo = load_graph_module("ai_birthchart_memo_langBOT")
+    providers.override(f"chat:{memo.MODEL_NAME}", sleepy_chat_model(llm_delay))
+    providers.override(f"embeddings:{memo.EMBEDDING_MODEL_NAME}", slow_fake_embeddings(embed_delay, dims))
+    from memory_shards import serve
+
+    serve(path, "")
+
+
+@benchmark("shards")
+def bench_shards(args: argparse.Namespace):
+    """Memo turns per second (retrieve + store) against one in-process manager vs 1, 2 and 4 shard processes"""
+    import multiprocessing
+    import random
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    import providers
+    from memory_shards import ShardedMemoryManager
+
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    memo = load_graph_module("ai_birthchart_memo_langBOT")
+    providers.override(f"chat:{memo.MODEL_NAME}", sleepy_chat_model(0))
+    providers.override(f"embeddings:{memo.EMBEDDING_MODEL_NAME}", slow_fake_embeddings(args.embed_delay, args.dims))
+    users, preload, turns = 400, 25, args.number // 10
+    conversation = synthetic_conversation(preload)
+
+    def run(manager, label: str, shards=None):
+        with ThreadPoolExecutor(args.workers) as pool:
+            list(pool.map(lambda user: [manager.store_memory(f"user-{user}", memory) for memory in conversation],
+                          range(users)))
+        manager.flush() if shards else manager.write_queue.flush()
+        rng = random.Random(0)
+        picks = [(f"user-{rng.randrange(users)}", rng.choice(PARAPHRASES)) for _ in range(turns)]
+
+        def turn(pick):
+            user_id, query = pick
+            start = time.perf_counter()
+            memories = manager.retrieve_memories(user_id, query)
+            manager.store_memory(user_id, {"user_message": query, "ai_response": SAMPLE_REPLY})
+            return time.perf_counter() - start, len(memories)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as pool:
+            results = list(pool.map(turn, picks))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for latency, _ in results]
+        if shards:
+            owners = [manager.ring.shard_for(f"user-{user}") for user in range(users)]
+            spread = " / ".join(str(owners.count(name)) for name in manager.clients)
+        else:
+            spread = str(users)
+        print(f"{label:<12} {turns / elapsed:8.1f} turns/s  p50 {percentile_ms(latencies, 50):7.1f} ms  "
+              f"p99 {percentile_ms(latencies, 99):7.1f} ms  empty {sum(1 for _, n in results if not n):>3}  "
+              f"users per process {spread}")
+
+    print(f"{users} users x {preload} memories, {turns} turns from {args.workers} threads, "
+          f"{os.cpu_count()} CPUs")
+    run(memo.MemoryManager(memo.get_embeddings(), memo.get_llm(), store_path=""), "in-process")
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (1, 2, 4):
+            paths = [os.path.join(directory, f"{count}-shard-{index}.sock") for index in range(count)]
+            processes = [context.Process(target=fake_memory_shard, args=(path, args.embed_delay, 0, args.dims), daemon=True)
+                         for path in paths]
+            for process in processes:
+                process.start()
+            while not all(os.path.exists(path) for path in paths):
+                time.sleep(0.05)
+            manager = ShardedMemoryManager(paths, pool_size=args.workers)
+            try:
+                run(manager, f"{count} shard{'s' if count > 1 else ''}", shards=True)
+            finally:
+                manager.close()
+                for process in processes:
+                    process.terminate()
+                    process.join()
+
+
+FORECAST = "Today the Moon enters Rohini: a calm day for planting intentions and tending what you already love."
+
+
+@benchmark("single-flight")
+def bench_single_flight(args: argparse.Namespace):
+    """Upstream model calls and wall time for a burst of identical translations, with and without single-flight"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import HumanMessage
+
+    # Translation memory would answer repeats that arrive after the first call finished
+    os.environ["TRANSLATION_MEMORY_PATH"] = ""
+    import providers
+    from single_flight import SingleFlight, SingleFlightChatModel
+
+    translator_engine = load_graph_module("translator_engine")
+    # A push campaign: every client asks for the same forecast in its language
+    languages = ["en", "es", "de", "ru"]
+    requests = [({"messages": [HumanMessage(content=FORECAST)]},
+                 {"configurable": {"target_language": languages[client % len(languages)]}})
+                for client in range(args.burst)]
+    print(f"{args.burst} requests, {len(languages)} distinct prompts, model latency {args.llm_delay * 1e3:.0f} ms")
+
+    for mode in ("threads", "asyncio"):
+        for label in ("direct", "single-flight"):
+            model = sleepy_chat_model(args.llm_delay)
+            flights = SingleFlight()
+            providers.override(f"chat:{translator_engine.MODEL_NAME}", model if label == "direct" else
+                               SingleFlightChatModel(model=model, model_name=translator_engine.MODEL_NAME,
+                                                     flights=flights))
+            graph = translator_engine.build_graph()
+
+            start = time.perf_counter()
+            if mode == "threads":
+                with ThreadPoolExecutor(args.workers) as pool:
+                    list(pool.map(lambda request: graph.invoke(*request), requests))
+            else:
+                async def burst():
+                    await asyncio.gather(*(graph.ainvoke(*request) for request in requests))
+
+                asyncio.run(burst())
+            elapsed = time.perf_counter() - start
+            print(f"{mode:<8} {label:<14} {elapsed:7.2f} s  {model.calls:6d} upstream calls  "
+                  f"{args.burst / elapsed:8.1f} requests/s")
+
+
+GRAPH_MODULES = ["ai_birthchart", "ai_birthchart_memo_langBOT", "translator_engine"]
+
+
+@benchmark("importtime")
+def bench_import_time(args: argparse.Namespace):
+    """Cumulative `python -X importtime` cost of each graph module; fails above --max-import-ms"""
+    import subprocess
+    import sys
+
+    failed = []
+    for module in GRAPH_MODULES:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True)
+        cumulative_us = None
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split("|")
+            if line.startswith("import time:") and len(fields) == 3 and fields[2].strip() == module:
+                cumulative_us = int(fields[1])
+        if result.returncode != 0 or cumulative_us is None:
+            print(f"{module:<40} import failed")
+            failed.append(module)
+            continue
+        print(f"{module:<40} {cumulative_us / 1e3:10.1f} ms")
+        if cumulative_us / 1e3 > args.max_import_ms:
+            failed.append(module)
+    if failed:
+        sys.exit(f"import time regression (> {args.max_import_ms} ms or failed): {', '.join(failed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per measurement")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Fake model delay per streamed chunk (s)")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="Fake model latency per call (s)")
+    parser.add_argument("--embed-delay", type=float, default=0.1, help="Fake embedding latency per call (s)")
+    parser.add_argument("--turn-llm-delay", type=float, default=0.2, help="Fake model latency per memo turn (s)")
+    parser.add_argument("--workers", type=int, default=32, help="Thread pool size for the sync path")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 100, 1000], help="Concurrent sessions")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions for process-level benchmarks")
+    parser.add_argument("--max-import-ms", type=float, default=1500, help="importtime regression threshold")
+    parser.add_argument("--dims", type=int, default=768, help="Embedding dimensionality")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Memories per user")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per size")
+    parser.add_argument("--users", type=int, default=2000, help="Users (payloads) for the parser benchmark")
+    parser.add_argument("--burst", type=int, default=1000, help="Duplicate requests sent at once (single-flight)")
+    parser.add_argument("--variants", type=int, default=4, help="Chart placements shared by users (response cache)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32], help="IVF clusters scanned")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Content-addressed registry of astro charts
+
+A chart is uploaded once, validated, normalized (the doubly-encoded `nathal`
+string is decoded) and stored under the hash of its normalized form. Threads
+then carry only the chart ID; the priestess looks the chart up in a bounded
+in-process cache of parsed charts, so the payload is neither resent, reparsed
+nor copied into every checkpoint. Register a chart from the command line with
+`python chart_registry.py chart.json`.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from astro_encoding import EncodedChart, chart_hash, encode_chart, payload_digest
+from astro_parser import AstroChart, ChartValidationError, load_chart, parse_chart
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding uploaded charts; set to an empty string to keep them in process memory
+DEFAULT_PATH = os.environ.get("CHART_REGISTRY_PATH", ".luna_charts.sqlite3")
+# Parsed charts kept in memory
+DEFAULT_CACHE_SIZE = 1024
+# Normalized payloads larger than this are refused
+MAX_CHART_BYTES = 512 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS charts (
+    chart_id TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class ChartTooLargeError(ChartValidationError):
+    pass
+
+
+class RegisteredChart(NamedTuple):
+    chart_id: str
+    chart: AstroChart
+    encoded: EncodedChart
+
+
+def normalize_chart(astro_data: Any) -> Dict[str, Any]:
+    """
+    Validate an astro payload and return its normalized form
+
+    Accepts the full response or its `data` block, with `nathal` either as the
+    JSON string clients send or already decoded.
+
+    :param astro_data: Payload as received from the client
+    :return: {"data": {...}} with `nathal` decoded
+    :raises ChartValidationError: The payload does not match the schema in suerdata.json
+    """
+    return parse_chart(astro_data).to_dict()
+
+
+class ChartRegistry:
+    def __init__(self, path: str = DEFAULT_PATH, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Uploaded charts keyed by the hash of their normalized payload
+
+        :param path: SQLite database file shared by worker processes; empty keeps charts in process memory
+        :param cache_size: Parsed charts kept in the in-process LRU
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.local = threading.local()
+        # Payloads of an in-memory registry (no path)
+        self.payloads: Dict[str, bytes] = {}
+        self.cache: "OrderedDict[str, RegisteredChart]" = OrderedDict()
+        # Digest of a payload exactly as the client sent it -> its chart ID, or the error it
+        # was refused with, so a client resending the same payload every turn skips parsing
+        self.aliases: "OrderedDict[str, Union[str, ChartValidationError]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"registered": 0, "duplicates": 0, "hits": 0, "loads": 0}
+        if path:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def _remember(self, chart: RegisteredChart) -> RegisteredChart:
+        with self.lock:
+            self.cache[chart.chart_id] = chart
+            self.cache.move_to_end(chart.chart_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return chart
+
+    def register(self, astro_data: Dict[str, Any], digest: Optional[str] = None) -> str:
+        """
+        Validate and store a chart; registering the same chart again is a no-op
+
+        A payload identical to one seen before in this process is only hashed
+        and looked up, whether it was registered or refused; anything else is
+        parsed and validated first.
+
+        :param astro_data: Payload as received from the client
+        :param digest: `payload_digest(astro_data)`, when the caller already has it
+        :return: Chart ID to pass as `chart_id` from now on
+        :raises ChartValidationError: The payload does not match the schema
+        :raises ChartTooLargeError: The normalized payload is larger than MAX_CHART_BYTES
+        """
+        digest = digest or payload_digest(astro_data)
+        with self.lock:
+            seen = self.aliases.get(digest)
+            if seen is not None:
+                self.aliases.move_to_end(digest)
+                if isinstance(seen, ChartValidationError):
+                    raise type(seen)(str(seen))
+                self.counters["duplicates"] += 1
+                return seen
+
+        try:
+            chart_id = self._store(astro_data)
+        except ChartValidationError as e:
+            self._alias(digest, e)
+            raise
+        self._alias(digest, chart_id)
+        return chart_id
+
+    def _alias(self, digest: str, outcome: Union[str, ChartValidationError]):
+        with self.lock:
+            self.aliases[digest] = outcome
+            while len(self.aliases) > self.cache_size:
+                self.aliases.popitem(last=False)
+
+    def _store(self, astro_data: Dict[str, Any]) -> str:
+        chart = parse_chart(astro_data)
+        normalized = chart.to_dict()
+        chart_id = chart_hash(normalized)
+        with self.lock:
+            known = chart_id in self.cache
+        if not known:
+            # Stored in the client's key order, which the prompt follows; the ID hashes a canonical form
+            payload = json.dumps(normalized, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            if len(payload) > MAX_CHART_BYTES:
+                raise ChartTooLargeError(f"Chart is {len(payload)} bytes, more than the {MAX_CHART_BYTES} allowed")
+            if self.path:
+                inserted = self._connection().execute(
+                    "INSERT OR IGNORE INTO charts (chart_id, payload, created_at) VALUES (?, ?, ?)",
+                    (chart_id, zlib.compress(payload), time.time()),
+                ).rowcount
+            else:
+                with self.lock:
+                    inserted = self.payloads.setdefault(chart_id, payload) is payload
+            self._remember(RegisteredChart(chart_id, chart, encode_chart(normalized)))
+        with self.lock:
+            self.counters["registered" if not known and inserted else "duplicates"] += 1
+        return chart_id
+
+    def get(self, chart_id: str) -> RegisteredChart:
+        """
+        Parsed chart for an ID, from the in-process cache or storage
+
+        :raises KeyError: No chart was registered under `chart_id`
+        """
+        with self.lock:
+            chart = self.cache.get(chart_id)
+            if chart is not None:
+                self.cache.move_to_end(chart_id)
+                self.counters["hits"] += 1
+                return chart
+
+        if self.path:
+            row = self._connection().execute("SELECT payload FROM charts WHERE chart_id = ?", (chart_id,)).fetchone()
+            payload = zlib.decompress(row[0]) if row else None
+        else:
+            payload = self.payloads.get(chart_id)
+        if payload is None:
+            raise KeyError(f"Unknown chart {chart_id!r}; register it first")
+        chart = load_chart(payload)
+        with self.lock:
+            self.counters["loads"] += 1
+        return self._remember(RegisteredChart(chart_id, chart, encode_chart(chart.to_dict())))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.counters, "cached": len(self.cache)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Register astro charts and print their IDs")
+    parser.add_argument("files", nargs="+", help="JSON files holding one astro payload each")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="Registry database")
+    args = parser.parse_args()
+
+    registry = ChartRegistry(args.path)
+    for name in args.files:
+        with open(name, encoding="utf-8") as f:
+            # Like suerdata.json, a file may hold the payload followed by other documents
+            payload, _ = json.JSONDecoder().raw_decode(f.read())
+        print(f"{registry.register(payload)}  {name}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
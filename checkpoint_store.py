@@ -0,0 +1,667 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = ".luna_checkpoints.sqlite3"
+# A message list is stored in full after this many deltas, bounding the replay on load
+DEFAULT_SNAPSHOT_INTERVAL = 50
+# Checkpoints kept per thread by compaction
+DEFAULT_KEEP_CHECKPOINTS = 20
+# Compaction runs in the background after this many checkpoint writes
+DEFAULT_COMPACT_EVERY = 1000
+# Threads whose latest message lists are kept in memory to diff against
+DEFAULT_MAX_CACHED_THREADS = 1024
+COMPRESS_MIN_BYTES = 512
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    type TEXT,
+    data BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+-- Time of each thread's latest checkpoint, so that retention finds idle threads without decoding checkpoints
+CREATE TABLE IF NOT EXISTS thread_activity (
+    thread_id TEXT PRIMARY KEY,
+    last_active TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS thread_activity_last_active ON thread_activity (last_active);
+"""
+# PRAGMA user_version of files whose thread_activity is filled in
+SCHEMA_VERSION = 1
+
+
+def _is_message_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(m, BaseMessage) and m.id for m in value)
+
+
+def diff_messages(previous: List[BaseMessage], current: List[BaseMessage]) -> Optional[Tuple[List[str], List[BaseMessage]]]:
+    """
+    Express `current` as removals from and upserts onto `previous`
+
+    :return: (removed ids, new or changed messages), or None when the order
+        changed in a way `apply_message_delta` cannot reproduce
+    """
+    previous_by_id = {message.id: message for message in previous}
+    current_ids = {message.id for message in current}
+    removed = [message.id for message in previous if message.id not in current_ids]
+    upserts = []
+    for message in current:
+        before = previous_by_id.get(message.id)
+        if before is None or not (before is message or before == message):
+            upserts.append(message)
+    expected = [message.id for message in previous if message.id in current_ids]
+    expected += [message.id for message in current if message.id not in previous_by_id]
+    if expected != [message.id for message in current]:
+        return None
+    return removed, upserts
+
+
+def apply_message_delta(messages: List[BaseMessage], removed: Iterable[str], upserts: List[BaseMessage]) -> List[BaseMessage]:
+    removed = set(removed)
+    pending = {message.id: message for message in upserts}
+    result = [pending.pop(message.id, message) for message in messages if message.id not in removed]
+    # Whatever is left is new and goes at the end, in order
+    result.extend(pending.values())
+    return result
+
+
+class SQLiteDeltaSaver(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        *,
+        snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL,
+        keep_checkpoints: int = DEFAULT_KEEP_CHECKPOINTS,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        max_cached_threads: int = DEFAULT_MAX_CACHED_THREADS,
+        serde=None,
+    ):
+        """
+        Durable checkpointer on an append-mostly SQLite file in WAL mode
+
+        Channel values are serialized with the saver's msgpack serializer (no
+        pickle) and compressed when large. A message list is stored as a delta
+        against the thread's previous checkpoint (removed ids plus new or
+        changed messages), so a turn writes O(new messages); every
+        `snapshot_interval` deltas the full list is written again. Nothing is
+        loaded at startup: a thread is read when it is first resumed, and its
+        latest message lists are then kept in memory to diff against.
+
+        Compaction keeps the newest `keep_checkpoints` checkpoints per thread,
+        re-materializes the oldest kept deltas and deletes the rest. It runs in
+        the background every `compact_every` writes, or on demand via `compact`.
+
+        :param path: SQLite database file
+        :param snapshot_interval: Deltas between full snapshots of a message list
+        :param keep_checkpoints: Checkpoints per thread kept by compaction
+        :param compact_every: Checkpoint writes between background compactions; 0 disables them
+        :param max_cached_threads: Threads whose latest state is kept for diffing
+        :param serde: Serializer; LangGraph's default when omitted
+        """
+        super().__init__(serde=serde)
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.keep_checkpoints = keep_checkpoints
+        self.compact_every = compact_every
+        self.max_cached_threads = max_cached_threads
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+        # (thread_id, checkpoint_ns) -> latest checkpoint id, its channel versions and message lists
+        self.heads: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.touched: Set[Tuple[str, str]] = set()
+        self.puts = 0
+        self.bytes_written = 0
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # Files written before thread_activity existed: read each thread's latest checkpoint once
+                latest = conn.execute(
+                    "SELECT thread_id, MAX(checkpoint_id), type, checkpoint FROM checkpoints GROUP BY thread_id"
+                ).fetchall()
+                conn.executemany("INSERT OR IGNORE INTO thread_activity VALUES (?, ?)",
+                                 [(thread_id, self._load(type_, data)["ts"]) for thread_id, _, type_, data in latest])
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            # Only takes effect on a new file; lets `vacuum` hand freed pages back to the filesystem
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            type_, data = f"{type_}+zlib", zlib.compress(data, 1)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.endswith("+zlib"):
+            type_, data = type_[:-len("+zlib")], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    # Channel values
+
+    def _load_value(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str, channel: str,
+                    version: str) -> Tuple[Any, int, bool]:
+        # Follows delta rows back to the nearest full value; returns (value, deltas applied, found)
+        deltas = []
+        while True:
+            row = conn.execute(
+                "SELECT kind, type, data FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? "
+                "AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                if deltas:
+                    logger.error(f"Checkpoint delta chain of {thread_id}/{channel} is broken at {version}")
+                return None, 0, False
+            kind, type_, data = row
+            value = self._load(type_, data)
+            if kind == "value":
+                break
+            deltas.append(value)
+            version = value["base"]
+        for delta in reversed(deltas):
+            value = apply_message_delta(value, delta["remove"], delta["upsert"])
+        return value, len(deltas), True
+
+    def _load_values(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str,
+                     versions: ChannelVersions) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, List, int]]]:
+        values, lists = {}, {}
+        for channel, version in versions.items():
+            value, chain, found = self._load_value(conn, thread_id, checkpoint_ns, channel, version)
+            if not found:
+                continue
+            values[channel] = value
+            if _is_message_list(value):
+                lists[channel] = (str(version), value, chain)
+        return values, lists
+
+    def _encode_value(self, head: Optional[Dict[str, Any]], channel: str, value: Any) -> Tuple[str, str, bytes, Any]:
+        # Returns (kind, type, data, cached list entry or None)
+        if not _is_message_list(value):
+            return ("value", *self._dump(value), None)
+        previous = head["lists"].get(channel) if head is not None else None
+        if previous is not None and previous[2] < self.snapshot_interval:
+            base_version, base_messages, chain = previous
+            delta = diff_messages(base_messages, value)
+            if delta is not None:
+                removed, upserts = delta
+                return ("delta", *self._dump({"base": base_version, "remove": removed, "upsert": upserts}),
+                        (list(value), chain + 1))
+        return ("value", *self._dump(value), (list(value), 0))
+
+    def _set_head(self, key: Tuple[str, str], head: Dict[str, Any]):
+        with self.lock:
+            self.heads[key] = head
+            self.heads.move_to_end(key)
+            while len(self.heads) > self.max_cached_threads:
+                self.heads.popitem(last=False)
+
+    # BaseCheckpointSaver
+
+    def _tuple(self, conn: sqlite3.Connection, row: Tuple, thread_id: str, checkpoint_ns: str,
+               remember: bool = False) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint_data, metadata_type, metadata_data = row
+        checkpoint = self._load(type_, checkpoint_data)
+        values, lists = self._load_values(conn, thread_id, checkpoint_ns, checkpoint["channel_versions"])
+        if remember:
+            self._set_head((thread_id, checkpoint_ns), {
+                "checkpoint_id": checkpoint_id,
+                "versions": dict(checkpoint["channel_versions"]),
+                "lists": lists,
+            })
+        writes = conn.execute(
+            "SELECT task_id, idx, channel, type, data, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        writes.sort(key=lambda write: writes_sort_key(write[5], write[0], write[1]))
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=self._load(metadata_type, metadata_data),
+            pending_writes=[(task_id, channel, self._load(t, d)) for task_id, _, channel, t, d, _ in writes],
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        conn = self._connection()
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id := get_checkpoint_id(config):
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        # The checkpoint being resumed is the parent of the next write, so keep it to diff against
+        return self._tuple(conn, row, thread_id, checkpoint_ns, remember=True)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        conn = self._connection()
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints")
+        conditions, params = [], []
+        if config is not None:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+
+        for thread_id, checkpoint_ns, *row in conn.execute(query, params).fetchall():
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self._load(row[4], row[5])
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(conn, tuple(row), thread_id, checkpoint_ns)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        key = (thread_id, checkpoint_ns)
+        stored = checkpoint.copy()
+        values = stored.pop("channel_values")
+
+        # 1. Diff message lists against the parent when its state is in memory
+        with self.lock:
+            head = self.heads.get(key)
+        if head is not None and head["checkpoint_id"] != parent_id:
+            head = None
+        lists = {}
+        if head is not None:
+            # Lists are only reusable as a base at the version the parent points to
+            lists = {
+                channel: entry for channel, entry in head["lists"].items()
+                if head["versions"].get(channel) is not None and str(head["versions"][channel]) == entry[0]
+            }
+            head = {**head, "lists": lists}
+
+        rows = []
+        new_lists = {}
+        for channel, version in new_versions.items():
+            if channel not in values:
+                rows.append((thread_id, checkpoint_ns, channel, str(version), "empty", None, None))
+                continue
+            kind, type_, data, cached = self._encode_value(head, channel, values[channel])
+            rows.append((thread_id, checkpoint_ns, channel, str(version), kind, type_, data))
+            if cached is not None:
+                new_lists[channel] = (str(version), *cached)
+        checkpoint_type, checkpoint_data = self._dump(stored)
+        metadata_type, metadata_data = self._dump(get_checkpoint_metadata(config, metadata))
+
+        # 2. Write the changed channels and the checkpoint in one transaction
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id,
+                 checkpoint_type, checkpoint_data, metadata_type, metadata_data),
+            )
+            conn.execute(
+                "INSERT INTO thread_activity VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+                (thread_id, checkpoint["ts"]),
+            )
+
+        # 3. This checkpoint is the parent of the next one
+        unchanged = {channel: entry for channel, entry in lists.items() if channel not in new_versions}
+        self._set_head(key, {
+            "checkpoint_id": checkpoint["id"],
+            "versions": dict(checkpoint["channel_versions"]),
+            "lists": {**unchanged, **new_lists},
+        })
+        written = sum(len(row[6] or b"") for row in rows) + len(checkpoint_data) + len(metadata_data)
+        with self.lock:
+            self.bytes_written += written
+            self.puts += 1
+            self.touched.add(key)
+            compact = self.compact_every and self.puts % self.compact_every == 0
+        if compact:
+            threading.Thread(target=self.compact, name="checkpoint-compaction", daemon=True).start()
+
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for index, (channel, value) in enumerate(writes):
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, index),
+                         channel, *self._dump(value), task_path))
+        # Regular writes are stored once; special ones (negative index) are overwritten
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [row for row in rows if row[4] >= 0])
+            conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [row for row in rows if row[4] < 0])
+
+    def delete_thread(self, thread_id: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            for table in ("checkpoints", "blobs", "writes", "thread_activity"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        with self.lock:
+            for key in [key for key in self.heads if key[0] == thread_id]:
+                del self.heads[key]
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # Async variants run the blocking SQLite calls off the event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.delete_thread, thread_id)
+
+    # Compaction
+
+    def _compact_thread(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str) -> int:
+        rows = conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        if len(rows) <= self.keep_checkpoints:
+            return 0
+        kept, dropped = rows[:self.keep_checkpoints], [row[0] for row in rows[self.keep_checkpoints:]]
+        keep_versions: Set[Tuple[str, str]] = set()
+        for _, type_, data in kept:
+            keep_versions.update((channel, str(version))
+                                 for channel, version in self._load(type_, data)["channel_versions"].items())
+
+        # Re-materialize kept deltas whose base is about to go, oldest first
+        deltas = conn.execute(
+            "SELECT channel, version, type, data FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND kind = 'delta' ORDER BY version",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        for channel, version, type_, data in deltas:
+            if (channel, version) in keep_versions and (channel, str(self._load(type_, data)["base"])) not in keep_versions:
+                value, _, found = self._load_value(conn, thread_id, checkpoint_ns, channel, version)
+                if found:
+                    conn.execute(
+                        "UPDATE blobs SET kind = 'value', type = ?, data = ? WHERE thread_id = ? "
+                        "AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                        (*self._dump(value), thread_id, checkpoint_ns, channel, version),
+                    )
+
+        stale = [
+            (channel, version) for channel, version in conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+            if (channel, version) not in keep_versions
+        ]
+        conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, channel, version) for channel, version in stale],
+        )
+        conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in dropped],
+        )
+        conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in dropped],
+        )
+        return len(dropped)
+
+    def compact(self, threads: Optional[Iterable[Tuple[str, str]]] = None) -> int:
+        """
+        Keep the newest `keep_checkpoints` checkpoints of each thread and delete the rest
+
+        :param threads: (thread_id, checkpoint_ns) pairs; those written since the last compaction when omitted
+        :return: Number of deleted checkpoints
+        """
+        if not self.compact_lock.acquire(blocking=False):
+            return 0
+        pending: List[Tuple[str, str]] = []
+        try:
+            with self.lock:
+                if threads is None:
+                    threads, self.touched = self.touched, set()
+            pending = list(threads)
+            conn = self._connection()
+            dropped = 0
+            while pending:
+                with conn:
+                    # Reads then writes: a deferred BEGIN cannot upgrade once another writer committed
+                    # in between ("database is locked"), while IMMEDIATE waits for the write lock up front
+                    conn.execute("BEGIN IMMEDIATE")
+                    dropped += self._compact_thread(conn, *pending[-1])
+                pending.pop()
+            if dropped:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                logger.info(f"Checkpoint compaction dropped {dropped} checkpoints")
+            return dropped
+        except sqlite3.Error as e:
+            logger.error(f"Checkpoint compaction failed: {e}")
+            return 0
+        finally:
+            if pending:
+                # Compacted by the next run instead
+                with self.lock:
+                    self.touched.update(pending)
+            self.compact_lock.release()
+
+    # Retention
+
+    @staticmethod
+    def _thread_sizes(conn: sqlite3.Connection, thread_ids: Optional[List[str]] = None) -> Dict[str, int]:
+        # Summed by SQLite; length() of a blob does not read its content
+        query = (
+            "SELECT thread_id, SUM(size) FROM ("
+            "SELECT thread_id, length(checkpoint) + length(metadata) AS size FROM checkpoints{where} "
+            "UNION ALL SELECT thread_id, IFNULL(length(data), 0) FROM blobs{where} "
+            "UNION ALL SELECT thread_id, length(data) FROM writes{where}"
+            ") GROUP BY thread_id"
+        )
+        if thread_ids is None:
+            return dict(conn.execute(query.format(where="")).fetchall())
+        sizes = {}
+        for start in range(0, len(thread_ids), 300):
+            chunk = thread_ids[start:start + 300]
+            where = f" WHERE thread_id IN ({','.join('?' * len(chunk))})"
+            sizes.update(conn.execute(query.format(where=where), chunk * 3).fetchall())
+        return sizes
+
+    def thread_usage(self) -> List[Tuple[str, str, int]]:
+        """(thread_id, timestamp of its latest checkpoint, stored bytes) for every thread"""
+        conn = self._connection()
+        sizes = self._thread_sizes(conn)
+        return [(thread_id, last_active, sizes.get(thread_id, 0))
+                for thread_id, last_active in conn.execute("SELECT thread_id, last_active FROM thread_activity")]
+
+    def idle_threads(self, cutoff: str) -> List[Tuple[str, str, int]]:
+        """
+        Like `thread_usage`, for threads whose latest checkpoint is older than `cutoff`
+
+        :param cutoff: UTC ISO timestamp, compared as text with the checkpoints' "ts"
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT thread_id, last_active FROM thread_activity WHERE last_active < ?", (cutoff,)).fetchall()
+        sizes = self._thread_sizes(conn, [thread_id for thread_id, _ in rows])
+        return [(thread_id, last_active, sizes.get(thread_id, 0)) for thread_id, last_active in rows]
+
+    def file_size(self) -> int:
+        return sum(os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path))
+
+    def vacuum(self) -> int:
+        """
+        Hand pages freed by deletions back to the filesystem
+
+        Files created before incremental auto-vacuum was enabled keep their size
+        and reuse the free pages instead.
+
+        :return: Bytes by which the database and its WAL shrank
+        """
+        before = self.file_size()
+        conn = self._connection()
+        try:
+            # Through executescript: execute() only steps incremental_vacuum once, freeing a single page
+            conn.executescript("PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);")
+        except sqlite3.Error as e:
+            logger.error(f"Checkpoint vacuum failed: {e}")
+        return max(0, before - self.file_size())
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connection()
+        (checkpoints,) = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()
+        (deltas,) = conn.execute("SELECT COUNT(*) FROM blobs WHERE kind = 'delta'").fetchone()
+        with self.lock:
+            return {
+                "checkpoints": checkpoints,
+                "delta_blobs": deltas,
+                "puts": self.puts,
+                "bytes_written": self.bytes_written,
+                "cached_threads": len(self.heads),
+            }
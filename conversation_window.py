@@ -0,0 +1,184 @@
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_KEEP_TURNS = 4
+# Rough per-message framing cost (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and Luna, a Vedic astrology priestess.
+Update the existing summary with the new messages. Keep the user's questions, personal details, concerns and any advice or favorable periods Luna mentioned.
+Write in the language of the conversation. Return only the updated summary, at most a few short paragraphs."""
+
+
+def approx_tokens(text: str) -> int:
+    """
+    Tokenizer-free token estimate
+
+    ASCII text averages ~4 characters per token, CJK ~1 character per token and
+    other scripts (Cyrillic, accented Latin) ~2 characters per token.
+
+    :param text: Text to measure
+    :return: Approximate token count
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    cjk_chars = len(_CJK_RE.findall(text)) if ascii_chars < len(text) else 0
+    other_chars = len(text) - ascii_chars - cjk_chars
+    return ascii_chars // 4 + other_chars // 2 + cjk_chars + 1
+
+
+def message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    # Multimodal content: keep only the text parts
+    return " ".join(
+        part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+    )
+
+
+def approx_message_tokens(message: BaseMessage) -> int:
+    return approx_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationWindow:
+    def __init__(
+        self,
+        get_llm: Callable[[], Any],
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        keep_turns: int = DEFAULT_KEEP_TURNS,
+    ):
+        """
+        Graph node that keeps the `messages` channel within a token budget
+
+        System messages and the last `keep_turns` turns are always kept. Older
+        messages are evicted from state once the budget is exceeded and folded
+        into the rolling `summary`, so each message is summarized exactly once.
+
+        :param get_llm: Returns the language model used to update the summary
+        :param token_budget: Default budget, overridable with `configurable.window_token_budget`
+        :param keep_turns: Default turn count, overridable with `configurable.window_keep_turns`
+        """
+        self.get_llm = get_llm
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+
+    def _summary_request(self, summary: str, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], str]:
+        transcript = "\n".join(f"{message.type}: {message_text(message)}" for message in messages)
+        request = [
+            SystemMessage(content=SUMMARY_INSTRUCTIONS),
+            HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"),
+        ]
+        return request, transcript
+
+    def summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        """
+        Fold evicted messages into the existing summary
+
+        :param summary: Current rolling summary (may be empty)
+        :param messages: Messages leaving the window, oldest first
+        :return: Updated summary
+        """
+        request, transcript = self._summary_request(summary, messages)
+        try:
+            # "nostream" keeps the summary out of the client's "messages" stream
+            return self.get_llm().invoke(request, config={"tags": ["nostream"]}).content
+        except Exception as e:
+            logger.error(f"Conversation summarization failed: {e}")
+            # Keep the evicted text rather than losing it
+            return f"{summary}\n{transcript}".strip()
+
+    async def asummarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        """Async variant of `summarize`"""
+        request, transcript = self._summary_request(summary, messages)
+        try:
+            return (await self.get_llm().ainvoke(request, config={"tags": ["nostream"]})).content
+        except Exception as e:
+            logger.error(f"Conversation summarization failed: {e}")
+            return f"{summary}\n{transcript}".strip()
+
+    def _protected_start(self, messages: List[BaseMessage], keep_turns: int) -> int:
+        # Index of the first message of the last `keep_turns` turns (a turn starts with a human message)
+        turns = 0
+        for index in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[index], HumanMessage):
+                turns += 1
+                if turns >= keep_turns:
+                    return index
+        return 0
+
+    def select_evicted(
+        self,
+        messages: List[BaseMessage],
+        summary: str,
+        token_budget: int,
+        keep_turns: int,
+    ) -> List[BaseMessage]:
+        """
+        Pick the oldest messages to evict so the window fits the budget
+
+        Whole turns are evicted so the remaining conversation still starts with
+        a user message.
+
+        :return: Messages to evict, oldest first
+        """
+        total = approx_tokens(summary) + sum(approx_message_tokens(message) for message in messages)
+        if total <= token_budget:
+            return []
+
+        evicted = []
+        for message in messages[:self._protected_start(messages, keep_turns)]:
+            if total <= token_budget and isinstance(message, HumanMessage):
+                break
+            if isinstance(message, SystemMessage):
+                continue
+            evicted.append(message)
+            total -= approx_message_tokens(message)
+        return evicted
+
+    def _select(self, state: Dict[str, Any], config: Optional[RunnableConfig]) -> Tuple[List[BaseMessage], str]:
+        configurable = (config or {}).get("configurable", {})
+        token_budget = configurable.get("window_token_budget", self.token_budget)
+        keep_turns = configurable.get("window_keep_turns", self.keep_turns)
+
+        messages = state.get("messages", [])
+        summary = state.get("summary", "")
+        evicted = self.select_evicted(messages, summary, token_budget, keep_turns)
+        if evicted:
+            logger.info(f"Windowing conversation: evicting {len(evicted)} of {len(messages)} messages")
+        return evicted, summary
+
+    def __call__(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        evicted, summary = self._select(state, config)
+        if not evicted:
+            return {}
+        return {
+            "messages": [RemoveMessage(id=message.id) for message in evicted],
+            "summary": self.summarize(summary, evicted),
+        }
+
+    async def acall(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        """Async variant of the node"""
+        evicted, summary = self._select(state, config)
+        if not evicted:
+            return {}
+        return {
+            "messages": [RemoveMessage(id=message.id) for message in evicted],
+            "summary": await self.asummarize(summary, evicted),
+        }
+
+
+def format_summary_section(summary: str) -> str:
+    if not summary:
+        return ""
+    return f"\n\nSummary of the earlier conversation with this user:\n{summary}"
@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+import providers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DISK_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 10_000
+# About 3 KiB per 768-dimensional vector
+DEFAULT_DISK_MAX_ENTRIES = 100_000
+# Recency on disk is only rewritten when older than this, so hot texts do not write on every hit
+DISK_TOUCH_INTERVAL_SECONDS = 3600
+# Disk size is checked every this many inserts
+DISK_EVICTION_CHECK_INTERVAL = 1000
+# Tasks a text is embedded for; models embed queries and documents differently
+DOCUMENT = "document"
+QUERY = "query"
+# Passed as `task_type` to models whose embed_documents accepts one (Gemini), so queries batch too
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+# How long the first request of a batch waits for others to join it
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_MAX_BATCH_SIZE = 100
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+# Caller-side latencies kept for percentiles
+LATENCY_SAMPLES = 2048
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _percentile_ms(samples: Sequence[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))] * 1e3
+
+
+class EmbeddingDiskCache:
+    def __init__(self, path: str = DEFAULT_DISK_PATH, max_entries: int = DEFAULT_DISK_MAX_ENTRIES):
+        """
+        On-disk embeddings keyed by content hash, shared by threads and worker processes
+
+        Evicted least-recently-used beyond `max_entries`.
+
+        :param path: SQLite database file
+        :param max_entries: Maximum number of stored vectors
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.inserts = 0
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+            if "last_used" not in columns:
+                # Files written before recency was tracked
+                conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors for whichever of `keys` are present"""
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        conn = self._connection()
+        now = time.time()
+        try:
+            rows = conn.execute(
+                f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            stale = [(now, key) for key, _, last_used in rows if now - last_used > DISK_TOUCH_INTERVAL_SECONDS]
+            if stale:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", stale)
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache lookup failed: {e}")
+            return {}
+        return {key: array("f", blob).tolist() for key, blob, _ in rows}
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = time.time()
+        try:
+            self._connection().executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()],
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache store failed: {e}")
+            return
+        with self.lock:
+            before = self.inserts
+            self.inserts += len(vectors)
+            check = before // DISK_EVICTION_CHECK_INTERVAL != self.inserts // DISK_EVICTION_CHECK_INTERVAL
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop least-recently-used vectors beyond `max_entries`
+
+        :return: Number of evicted vectors
+        """
+        conn = self._connection()
+        try:
+            (size,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            excess = size - self.max_entries
+            if excess <= 0:
+                return 0
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            logger.info(f"Embedding cache evicted {excess} vectors")
+            return excess
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache eviction failed: {e}")
+            return 0
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: Optional[str] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        disk_cache: Optional[EmbeddingDiskCache] = None,
+        batch_window: float = DEFAULT_BATCH_WINDOW,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_concurrent_batches: int = DEFAULT_MAX_CONCURRENT_BATCHES,
+    ):
+        """
+        Caching, batching front for an embeddings model
+
+        Texts are keyed by a hash of (model name, task, text) and looked up in
+        an in-memory LRU, then in `disk_cache`. Misses from every thread and
+        event loop go to one queue; a dispatcher collects them for up to
+        `batch_window` seconds and sends the documents of each batch as a single
+        `embed_documents` call. Queries keep their own task type: they go out
+        as one `embed_documents(..., task_type=QUERY_TASK_TYPE)` call when the
+        model takes a task type, else through `embed_query`. Identical texts
+        waiting at the same time share one embedding.
+
+        :param embeddings: Underlying embeddings model
+        :param model_name: Part of the cache key; defaults to the model's `model` attribute
+        :param max_entries: In-memory LRU size
+        :param disk_cache: Optional persistent second level
+        :param batch_window: Seconds a batch stays open for more requests
+        :param max_batch_size: Texts per `embed_documents` call
+        :param max_concurrent_batches: Batches in flight at once
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        try:
+            self.batches_queries = "task_type" in inspect.signature(embeddings.embed_documents).parameters
+        except (TypeError, ValueError):
+            self.batches_queries = False
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # Texts queued or being embedded, so concurrent duplicates share a future
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.queue: "queue.Queue[tuple]" = queue.Queue()
+        self.batches: "queue.Queue[List[tuple]]" = queue.Queue()
+        self.dispatcher: Optional[threading.Thread] = None
+        self.counters = {
+            "requests": 0,
+            "hits": 0,
+            "disk_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "batches": 0,
+            "embedded": 0,
+            "max_batch_size": 0,
+            "errors": 0,
+        }
+        self.embed_seconds = 0.0
+        self.latencies: "deque[float]" = deque(maxlen=LATENCY_SAMPLES)
+
+    def key(self, text: str, task: str = DOCUMENT) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{task}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _start(self):
+        # Called with the lock held. Long-lived workers rather than an executor, so that
+        # writes flushed at interpreter exit can still be embedded.
+        if self.dispatcher is None:
+            for index in range(self.max_concurrent_batches):
+                threading.Thread(target=self._work, name=f"embed-batch-{index}", daemon=True).start()
+            self.dispatcher = threading.Thread(target=self._dispatch, name="embed-dispatcher", daemon=True)
+            self.dispatcher.start()
+
+    def _submit(self, texts: List[str], task: str = DOCUMENT) -> List[Future]:
+        futures = []
+        with self.lock:
+            self.counters["requests"] += len(texts)
+            for text in texts:
+                key = self.key(text, task)
+                vector = self.cache.get(key)
+                if vector is not None:
+                    self.cache.move_to_end(key)
+                    self.counters["hits"] += 1
+                    future = Future()
+                    future.set_result(vector)
+                elif key in self.pending:
+                    self.counters["coalesced"] += 1
+                    future = self.pending[key]
+                else:
+                    future = self.pending[key] = Future()
+                    self._start()
+                    self.queue.put((key, text, task))
+                futures.append(future)
+        return futures
+
+    def _dispatch(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches.put(batch)
+
+    def _work(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # The worker must survive, and nobody may be left waiting on the batch
+                logger.error(f"Embedding batch of {len(batch)} failed: {e}")
+                self._fail(batch, e)
+
+    def _fail(self, batch: List[tuple], error: Exception):
+        with self.lock:
+            self.counters["errors"] += 1
+            futures = [self.pending.pop(key) for key, _, _ in batch if key in self.pending]
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _embed(self, texts: List[str], task: str) -> List[List[float]]:
+        if task == DOCUMENT:
+            vectors = self.embeddings.embed_documents(texts)
+        elif self.batches_queries:
+            vectors = self.embeddings.embed_documents(texts, task_type=QUERY_TASK_TYPE)
+        else:
+            vectors = [self.embeddings.embed_query(text) for text in texts]
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(texts)} texts")
+        return vectors
+
+    def _run_batch(self, batch: List[tuple]):
+        keys = [key for key, _, _ in batch]
+        found = self.disk_cache.get_many(keys) if self.disk_cache is not None else {}
+        missing = [(key, text, task) for key, text, task in batch if key not in found]
+        computed = {}
+        errors: Dict[str, Exception] = {}
+        if missing:
+            start = time.perf_counter()
+            for task in (DOCUMENT, QUERY):
+                group = [(key, text) for key, text, item_task in missing if item_task == task]
+                if not group:
+                    continue
+                try:
+                    vectors = self._embed([text for _, text in group], task)
+                    computed.update({key: list(vector) for (key, _), vector in zip(group, vectors)})
+                except Exception as e:
+                    logger.error(f"Embedding batch of {len(group)} {task}s failed: {e}")
+                    errors.update((key, e) for key, _ in group)
+            elapsed = time.perf_counter() - start
+            if computed and self.disk_cache is not None:
+                self.disk_cache.put_many(computed)
+
+        found.update(computed)
+        with self.lock:
+            self.counters["disk_hits"] += len(batch) - len(missing)
+            self.counters["misses"] += len(missing)
+            if missing:
+                self.counters["batches"] += 1
+                self.counters["embedded"] += len(missing)
+                self.counters["max_batch_size"] = max(self.counters["max_batch_size"], len(missing))
+                self.embed_seconds += elapsed
+            if errors:
+                self.counters["errors"] += 1
+            for key, vector in found.items():
+                self.cache[key] = vector
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+            futures = [(self.pending.pop(key), key) for key in keys]
+
+        for future, key in futures:
+            if key in found:
+                future.set_result(found[key])
+            else:
+                future.set_exception(errors.get(key) or RuntimeError(f"No embedding returned for {key}"))
+
+    def _record_latency(self, start: float):
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+
+    def _embed_all(self, texts: List[str], task: str) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = [future.result() for future in self._submit(texts, task)]
+        self._record_latency(start)
+        return vectors
+
+    async def _aembed_all(self, texts: List[str], task: str) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = await asyncio.gather(*[asyncio.wrap_future(future) for future in self._submit(texts, task)])
+        self._record_latency(start)
+        return list(vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_all(texts, DOCUMENT)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_all([text], QUERY)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_all(texts, DOCUMENT)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._aembed_all([text], QUERY))[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Cache hits, batch sizes and caller-side latency since start"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = list(self.latencies)
+            counters["size"] = len(self.cache)
+            counters["embed_seconds"] = self.embed_seconds
+        counters["mean_batch_size"] = counters["embedded"] / counters["batches"] if counters["batches"] else 0.0
+        counters["hit_rate"] = (
+            (counters["hits"] + counters["disk_hits"] + counters["coalesced"]) / counters["requests"]
+            if counters["requests"] else 0.0
+        )
+        counters["p50_ms"] = _percentile_ms(latencies, 50)
+        counters["p99_ms"] = _percentile_ms(latencies, 99)
+        return counters
+
+
+def build_embedding_disk_cache() -> Optional[EmbeddingDiskCache]:
+    # Disabled when EMBEDDING_CACHE_PATH is set to an empty string
+    return EmbeddingDiskCache(DEFAULT_DISK_PATH) if DEFAULT_DISK_PATH else None
+
+
+def get_embedding_disk_cache() -> Optional[EmbeddingDiskCache]:
+    """Process-wide disk cache at EMBEDDING_CACHE_PATH, shared by every CachedEmbeddings, or None when disabled"""
+    return providers.get("embedding_cache.disk", build_embedding_disk_cache)
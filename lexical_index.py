@@ -0,0 +1,211 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+DEFAULT_MAX_NAMESPACES = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Constant of reciprocal rank fusion; larger values flatten the rank curve
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def value_text(value: Any) -> str:
+    """All string and number leaves of a memory value, space separated"""
+    if isinstance(value, dict):
+        return " ".join(value_text(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(value_text(item) for item in value)
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value)
+    return ""
+
+
+class LexicalHit(NamedTuple):
+    key: str
+    score: float
+    # Share of the query's IDF weight found in the document, 0..1
+    coverage: float
+    value: Any
+
+
+class _Postings:
+    def __init__(self):
+        self.terms: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.values: Dict[str, Any] = {}
+        self.total_length = 0
+
+    def add(self, key: str, value: Any):
+        self.remove(key)
+        counts = Counter(tokenize(value_text(value)))
+        for term, count in counts.items():
+            self.terms.setdefault(term, {})[key] = count
+        length = sum(counts.values())
+        self.lengths[key] = length
+        self.values[key] = value
+        self.total_length += length
+
+    def remove(self, key: str):
+        if key not in self.lengths:
+            return
+        for term in set(tokenize(value_text(self.values[key]))):
+            postings = self.terms.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.terms[term]
+        self.total_length -= self.lengths.pop(key)
+        del self.values[key]
+
+    def idf(self, term: str) -> float:
+        df = len(self.terms.get(term, ()))
+        size = len(self.lengths)
+        return math.log(1 + (size - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int) -> List[LexicalHit]:
+        terms = set(tokenize(query))
+        if not terms or not self.lengths:
+            return []
+        average_length = self.total_length / len(self.lengths)
+        idfs = {term: self.idf(term) for term in terms}
+        query_weight = sum(idfs.values())
+        scores: Dict[str, float] = {}
+        matched: Dict[str, float] = {}
+        for term in terms:
+            for key, count in self.terms.get(term, {}).items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idfs[term] * count * (BM25_K1 + 1) / (count + norm)
+                matched[key] = matched.get(key, 0.0) + idfs[term]
+        ranked = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:limit]
+        return [
+            LexicalHit(key, score, matched[key] / query_weight if query_weight else 0.0, self.values[key])
+            for key, score in ranked
+        ]
+
+
+class LexicalIndex:
+    def __init__(
+        self,
+        load: Callable[[Tuple[str, ...]], Iterable[Tuple[str, Any]]],
+        max_namespaces: int = DEFAULT_MAX_NAMESPACES,
+    ):
+        """
+        In-memory BM25 inverted index per namespace
+
+        A namespace is loaded with `load` on first search and then kept current
+        with `add`/`remove`. At most `max_namespaces` stay in memory, least
+        recently used first out; an evicted namespace is reloaded on demand.
+        Loading happens outside the index lock: searches of other namespaces go
+        on meanwhile, concurrent searches of the same namespace wait for the one
+        load, and writes made during it are applied once it is done.
+
+        :param load: Returns (key, value) pairs of everything stored in a namespace
+        :param max_namespaces: Namespaces kept in memory
+        """
+        self.load = load
+        self.max_namespaces = max_namespaces
+        self.namespaces: "OrderedDict[Tuple[str, ...], _Postings]" = OrderedDict()
+        # Namespaces being loaded: the load's result and the (key, value or None) writes made meanwhile
+        self.loading: Dict[Tuple[str, ...], Tuple[Future, List[Tuple[str, Any]]]] = {}
+        self.lock = threading.RLock()
+
+    def is_loaded(self, namespace: Tuple[str, ...]) -> bool:
+        return namespace in self.namespaces
+
+    def ensure_loaded(self, namespace: Tuple[str, ...]) -> _Postings:
+        with self.lock:
+            postings = self.namespaces.get(namespace)
+            if postings is not None:
+                self.namespaces.move_to_end(namespace)
+                return postings
+            loading = self.loading.get(namespace)
+            if loading is None:
+                loading = self.loading[namespace] = (Future(), [])
+                leader = True
+            else:
+                leader = False
+        future, writes = loading
+        if not leader:
+            return future.result()
+
+        try:
+            postings = _Postings()
+            for key, value in self.load(namespace):
+                postings.add(key, value)
+        except BaseException as e:
+            with self.lock:
+                if self.loading.get(namespace) is loading:
+                    del self.loading[namespace]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            # Dropped meanwhile: serve this search, but the next one reloads
+            if self.loading.get(namespace) is loading:
+                del self.loading[namespace]
+                for key, value in writes:
+                    if value is None:
+                        postings.remove(key)
+                    else:
+                        postings.add(key, value)
+                self.namespaces[namespace] = postings
+                while len(self.namespaces) > self.max_namespaces:
+                    self.namespaces.popitem(last=False)
+        future.set_result(postings)
+        return postings
+
+    def _write(self, namespace: Tuple[str, ...], key: str, value: Any):
+        # `value` None removes the document
+        with self.lock:
+            postings = self.namespaces.get(namespace)
+            if postings is not None:
+                if value is None:
+                    postings.remove(key)
+                else:
+                    postings.add(key, value)
+            elif namespace in self.loading:
+                # The load may have read the store before this write
+                self.loading[namespace][1].append((key, value))
+
+    def add(self, namespace: Tuple[str, ...], key: str, value: Any):
+        """Index a new or updated document; namespaces not in memory pick it up when loaded"""
+        self._write(namespace, key, value)
+
+    def remove(self, namespace: Tuple[str, ...], key: str):
+        self._write(namespace, key, None)
+
+    def drop(self, namespace: Tuple[str, ...]):
+        """Forget a namespace so that it is reloaded from the store on next use"""
+        with self.lock:
+            self.namespaces.pop(namespace, None)
+            self.loading.pop(namespace, None)
+
+    def search(self, namespace: Tuple[str, ...], query: str, limit: int) -> List[LexicalHit]:
+        """
+        BM25 top hits for `query`
+
+        :param namespace: Namespace to search
+        :param query: Free-text query
+        :param limit: Number of hits
+        :return: Hits, best first
+        """
+        postings = self.ensure_loaded(namespace)
+        with self.lock:
+            return postings.search(query, limit)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Merge ranked key lists; a key's score is the sum of 1 / (k + rank) over the lists it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
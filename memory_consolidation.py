@@ -0,0 +1,231 @@
+"""
+Offline consolidation of long-lived users' memories
+
+Old memories of a user are clustered by embedding and each cluster is
+replaced by one LLM-written summary memory that records which memories it
+came from. Run periodically with `python memory_consolidation.py`; pass
+`--report` to only print memory counts.
+"""
+import argparse
+import json
+import logging
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langgraph.store.base import BaseStore, PutOp
+
+logger = logging.getLogger(__name__)
+
+MEMORY_NAMESPACE = "user_memories"
+# Originals of consolidated memories are kept here, unindexed, when retention is "archive"
+ARCHIVE_NAMESPACE = "user_memories_archive"
+DEFAULT_MIN_AGE_DAYS = 30
+DEFAULT_KEEP_RECENT = 50
+DEFAULT_CLUSTER_SIZE = 8
+RETENTION_POLICIES = ("archive", "delete")
+PAGE_SIZE = 1000
+
+
+def list_memories(store: BaseStore, namespace: Tuple[str, ...]) -> List[Any]:
+    """Every item stored directly under `namespace`"""
+    items, offset = [], 0
+    while True:
+        page = store.search(namespace, limit=PAGE_SIZE, offset=offset)
+        items.extend(item for item in page if item.namespace == namespace)
+        if len(page) < PAGE_SIZE:
+            return items
+        offset += PAGE_SIZE
+
+
+def memory_counts(store: BaseStore, user_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Memories per user: total, consolidated summaries among them, and archived originals
+
+    :param store: Memory store
+    :param user_ids: Users to count; every user with memories when omitted
+    """
+    if user_ids is None:
+        user_ids = sorted({
+            namespace[1] for namespace in store.list_namespaces(prefix=(MEMORY_NAMESPACE,), limit=1_000_000)
+            if len(namespace) == 2
+        })
+    counts = {}
+    for user_id in user_ids:
+        memories = list_memories(store, (MEMORY_NAMESPACE, user_id))
+        counts[user_id] = {
+            "memories": len(memories),
+            "summaries": sum(1 for item in memories if "consolidated" in item.value),
+            "archived": len(list_memories(store, (ARCHIVE_NAMESPACE, user_id))),
+        }
+    return counts
+
+
+def _memory_time(item) -> datetime:
+    # A summary dates from the newest memory it covers, not from when it was written
+    consolidated = item.value.get("consolidated")
+    moment = datetime.fromisoformat(consolidated["to"]) if consolidated else item.created_at
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _memory_start(item) -> datetime:
+    consolidated = item.value.get("consolidated")
+    return datetime.fromisoformat(consolidated["from"]) if consolidated else _memory_time(item)
+
+
+def _sources(item) -> List[str]:
+    # A summary being consolidated again passes on its own provenance
+    consolidated = item.value.get("consolidated")
+    return consolidated["sources"] if consolidated else [item.key]
+
+
+def _candidate_vectors(manager, namespace: Tuple[str, ...], candidates: List[Any]) -> np.ndarray:
+    # Embeddings the store already holds are reused; only memories stored without one are embedded
+    stored_vectors = getattr(manager.store, "stored_vectors", None)
+    found = stored_vectors(namespace, [item.key for item in candidates]) if stored_vectors else {}
+    missing = [item for item in candidates if item.key not in found]
+    if missing:
+        texts = [json.dumps(item.value.get("data"), ensure_ascii=False) for item in missing]
+        found.update(zip((item.key for item in missing), manager.embedding_model.embed_documents(texts)))
+    vectors = np.asarray([found[item.key] for item in candidates], dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def cluster_memories(vectors: np.ndarray, cluster_size: int) -> List[List[int]]:
+    """
+    Group similar memories, about `cluster_size` per group
+
+    :param vectors: One normalized embedding per memory
+    :return: Lists of row indices
+    """
+    from ann_index import IVFIndex
+
+    index = IVFIndex(lambda positions: vectors[positions], nlist=max(1, math.ceil(len(vectors) / cluster_size)))
+    index.build(vectors, np.arange(len(vectors)))
+    return [members for members in index.lists if members]
+
+
+def consolidate_user(
+    manager,
+    user_id: str,
+    min_age_days: float = DEFAULT_MIN_AGE_DAYS,
+    keep_recent: int = DEFAULT_KEEP_RECENT,
+    cluster_size: int = DEFAULT_CLUSTER_SIZE,
+    retention: str = "archive",
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Replace a user's old memories with per-cluster summaries
+
+    Memories younger than `min_age_days`, and the newest `keep_recent`, are
+    left alone. The rest are clustered by the embeddings the store already
+    holds; every cluster of two or more becomes one summary memory whose
+    "consolidated" field lists the original keys and time span. Originals are then archived (moved to an
+    unindexed namespace) or deleted, depending on `retention`. A cluster
+    whose summary fails is left untouched.
+
+    :param manager: MemoryManager providing the store, embeddings and LLM
+    :param user_id: User to consolidate
+    :param min_age_days: Minimum age of a memory to be consolidated
+    :param keep_recent: Number of newest memories never consolidated
+    :param cluster_size: Target memories per summary
+    :param retention: "archive" or "delete"
+    :param dry_run: Only count what would change
+    :return: Counts of consolidated memories and written summaries
+    """
+    if retention not in RETENTION_POLICIES:
+        raise ValueError(f"retention must be one of {RETENTION_POLICIES}, got {retention!r}")
+    if manager.write_queue is not None:
+        manager.write_queue.flush()
+
+    # 1. Pick memories old enough to consolidate
+    namespace = (MEMORY_NAMESPACE, user_id)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=min_age_days)
+    memories = sorted(list_memories(manager.store, namespace), key=_memory_time, reverse=True)
+    candidates = [item for item in memories[keep_recent:] if _memory_time(item) < cutoff]
+    result = {"candidates": len(candidates), "consolidated": 0, "summaries": 0, "failed_clusters": 0}
+    if len(candidates) < 2:
+        return result
+
+    # 2. Cluster them by embedding
+    vectors = _candidate_vectors(manager, namespace, candidates)
+    clusters = [members for members in cluster_memories(vectors, cluster_size) if len(members) > 1]
+
+    # 3. Summarize each cluster and swap it for the summary
+    for members in clusters:
+        items = [candidates[i] for i in members]
+        if dry_run:
+            result["consolidated"] += len(items)
+            result["summaries"] += 1
+            continue
+        try:
+            summary = manager.llm.invoke(manager._summarization_request([item.value.get("data") for item in items]))
+        except Exception as e:
+            logger.error(f"Consolidation summary for user {user_id} failed: {e}")
+            result["failed_clusters"] += 1
+            continue
+
+        newest = max(_memory_time(item) for item in items)
+        ops = [PutOp(namespace, str(uuid.uuid4()), {
+            "data": {"summary": summary.content},
+            "timestamp": newest.isoformat(),
+            "consolidated": {
+                "sources": [key for item in items for key in _sources(item)],
+                "from": min(_memory_start(item) for item in items).isoformat(),
+                "to": newest.isoformat(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            },
+        })]
+        for item in items:
+            if retention == "archive" and "consolidated" not in item.value:
+                ops.append(PutOp((ARCHIVE_NAMESPACE, user_id), item.key, item.value, index=False))
+            ops.append(PutOp(namespace, item.key, None))
+        manager.store.batch(ops)
+        if getattr(manager, "lexical", None) is not None:
+            manager.lexical.drop(namespace)
+        result["consolidated"] += len(items)
+        result["summaries"] += 1
+
+    logger.info(f"Consolidated {result['consolidated']} memories of user {user_id} into {result['summaries']} summaries")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--user", action="append", help="User to process (repeatable); all users by default")
+    parser.add_argument("--report", action="store_true", help="Only print memory counts")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be consolidated")
+    parser.add_argument("--min-age-days", type=float, default=DEFAULT_MIN_AGE_DAYS)
+    parser.add_argument("--keep-recent", type=int, default=DEFAULT_KEEP_RECENT)
+    parser.add_argument("--cluster-size", type=int, default=DEFAULT_CLUSTER_SIZE)
+    parser.add_argument("--retention", choices=RETENTION_POLICIES, default="archive")
+    args = parser.parse_args()
+
+    from ai_birthchart_memo_langBOT import build_memory_manager
+
+    # Always the local store: with MEMORY_SHARDS, run this once per shard with MEMORY_STORE_PATH pointing at it
+    manager = build_memory_manager()
+    if manager.write_queue is not None:
+        manager.write_queue.flush()
+    before = memory_counts(manager.store, args.user)
+    if not args.report:
+        for user_id in before:
+            outcome = consolidate_user(
+                manager, user_id, args.min_age_days, args.keep_recent, args.cluster_size, args.retention, args.dry_run
+            )
+            print(f"{user_id}: {json.dumps(outcome)}")
+    after = memory_counts(manager.store, list(before))
+
+    print(f"{'user':<36} {'before':>8} {'after':>8} {'summaries':>10} {'archived':>9}")
+    for user_id, counts in before.items():
+        print(f"{user_id:<36} {counts['memories']:>8} {after[user_id]['memories']:>8} "
+              f"{after[user_id]['summaries']:>10} {after[user_id]['archived']:>9}")
+    print(f"{'total':<36} {sum(c['memories'] for c in before.values()):>8} "
+          f"{sum(c['memories'] for c in after.values()):>8}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,171 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langgraph.store.base import BaseStore, PutOp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 64
+# How long a batch stays open for more writes before it is stored
+DEFAULT_FLUSH_INTERVAL = 0.05
+# A failed batch stays pending and is retried after 0.5 s, 1 s, 2 s, ... (capped), and is
+# dropped only once it has failed this many times
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 10.0
+
+_STOP = object()
+
+
+class MemoryWriteQueue:
+    def __init__(
+        self,
+        store: BaseStore,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        """
+        Write-behind queue in front of a LangGraph store
+
+        `put` returns immediately; a worker thread drains the queue and writes
+        up to `max_batch_size` items per `store.batch` call, so their
+        embeddings are computed together. Writes that arrive while a batch is
+        being stored make up the next one. Until an item has been written it
+        is readable through `pending_values`. A batch the store rejects stays
+        pending and is retried with exponential backoff, holding back later
+        writes so they still land in order; after `max_attempts` failures it
+        is dropped and logged as an error. Pending writes are flushed on
+        `close`, which also runs at interpreter exit.
+
+        :param store: Store receiving the writes
+        :param max_batch_size: Items per store batch
+        :param flush_interval: Seconds a batch stays open for more writes
+        :param max_attempts: Store calls per batch before its writes are dropped
+        :param retry_delay: Seconds before the first retry, doubled for each further one
+        """
+        self.store = store
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.queue: "queue.Queue[Any]" = queue.Queue()
+        # Writes enqueued but not yet in the store, per namespace
+        self.pending: Dict[Tuple[str, ...], Dict[str, Dict[str, Any]]] = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.counters = {"enqueued": 0, "written": 0, "failed": 0, "batches": 0, "retries": 0}
+        self.worker = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def put(self, namespace: Tuple[str, ...], key: str, value: Dict[str, Any]):
+        """
+        Enqueue a write and return without waiting for it
+
+        :param namespace: Store namespace
+        :param key: Item key
+        :param value: Item value
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Memory write queue is closed")
+            self.pending.setdefault(namespace, {})[key] = value
+            self.counters["enqueued"] += 1
+            self.queue.put(PutOp(namespace, key, value))
+
+    def pending_items(self, namespace: Tuple[str, ...]) -> List[Tuple[str, Dict[str, Any]]]:
+        """(key, value) pairs queued for `namespace` but not yet written, oldest first"""
+        with self.condition:
+            return list(self.pending.get(namespace, {}).items())
+
+    def pending_values(self, namespace: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """Values queued for `namespace` but not yet written, oldest first"""
+        return [value for _, value in self.pending_items(namespace)]
+
+    def flush(self, namespace: Optional[Tuple[str, ...]] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Block until pending writes have reached the store
+
+        :param namespace: Only wait for this namespace's writes
+        :param timeout: Seconds to wait at most
+        :return: False if the timeout expired first
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: namespace not in self.pending if namespace is not None else not self.pending,
+                timeout,
+            )
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush every pending write and stop the worker"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(_STOP)
+        self.worker.join(timeout)
+        atexit.unregister(self.close)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is _STOP:
+                break
+            batch: List[PutOp] = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                try:
+                    op = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is _STOP:
+                    # Everything enqueued before close() is already in the batch
+                    stopping = True
+                    break
+                batch.append(op)
+            self._write(batch)
+
+    def _write(self, batch: List[PutOp]):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.store.batch(batch)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    keys = ", ".join(f"{'/'.join(op.namespace)}/{op.key}" for op in batch)
+                    logger.error(f"Dropping {len(batch)} memory writes after {attempt} failed attempts: {e} ({keys})")
+                    self._settle(batch, written=False)
+                    return
+                delay = min(self.retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+                logger.warning(f"Memory write of {len(batch)} items failed (attempt {attempt}), "
+                               f"retrying in {delay:.1f}s: {e}")
+                with self.condition:
+                    self.counters["retries"] += 1
+                # The writes stay pending, and readable, while we back off
+                time.sleep(delay)
+            else:
+                self._settle(batch, written=True)
+                return
+
+    def _settle(self, batch: List[PutOp], written: bool):
+        with self.condition:
+            self.counters["batches"] += 1
+            self.counters["written" if written else "failed"] += len(batch)
+            for op in batch:
+                items = self.pending.get(op.namespace, {})
+                # A newer write under the same key stays pending
+                if items.get(op.key) is op.value:
+                    del items[op.key]
+                if not items:
+                    self.pending.pop(op.namespace, None)
+            self.condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {**self.counters, "pending": sum(len(items) for items in self.pending.values())}
@@ -0,0 +1,382 @@
+"""
+Sharded memory service for multi-process deployments
+
+Each shard server owns the memories of the users hashed to it and serves
+them over a Unix socket; every bot worker talks to all shards through a
+`ShardedMemoryManager`, so a user's memories are found whichever worker
+handles the turn. Start the shards with
+`python memory_shards.py --shards 4 --socket-dir /run/luna-memory` and point
+the workers at them with MEMORY_SHARDS=/run/luna-memory/shard-0.sock,...
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Points per shard on the hash ring; more points spread users more evenly
+DEFAULT_REPLICAS = 128
+# Connections each client keeps open per shard
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 30.0
+# Methods of the shard's MemoryManager callable over the socket
+SHARD_METHODS = ("store_memory", "retrieve_memories", "summarize_memories")
+# Methods safe to send again when the connection broke after the request went out
+IDEMPOTENT_METHODS = ("retrieve_memories", "summarize_memories", "stats", "flush")
+
+_HEADER = struct.Struct("!I")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, shards: Sequence[str], replicas: int = DEFAULT_REPLICAS):
+        """
+        Consistent hashing of keys to shards
+
+        Adding or removing a shard only moves the keys of the ring segments it
+        gains or loses, about 1/N of them.
+
+        :param shards: Shard names; positions on the ring depend on the names only
+        :param replicas: Points per shard
+        """
+        if not shards:
+            raise ValueError("HashRing needs at least one shard")
+        points = sorted((_hash(f"{shard}#{replica}"), shard) for shard in shards for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> str:
+        index = bisect.bisect(self.hashes, _hash(key)) % len(self.hashes)
+        return self.shards[index]
+
+
+def _send(sock: socket.socket, message: Any):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket) -> Optional[Any]:
+    """Next length-prefixed JSON message, or None when the peer closed the connection"""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+class _ShardHandler(socketserver.BaseRequestHandler):
+    # One thread per client connection, serving its requests in turn
+    def handle(self):
+        while True:
+            request = _recv(self.request)
+            if request is None:
+                return
+            try:
+                response = {"result": self.server.dispatch(request["method"], request.get("params", {}))}
+            except Exception as e:
+                logger.error(f"Shard request {request.get('method')} failed: {e}")
+                response = {"error": f"{type(e).__name__}: {e}"}
+            _send(self.request, response)
+
+
+class ShardServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every worker's pool connects at once on startup; the default backlog of 5 refuses them with EAGAIN
+    request_queue_size = 256
+
+    def __init__(self, path: str, manager):
+        """
+        Serves one shard's MemoryManager on a Unix socket
+
+        :param path: Socket path; a stale socket file is replaced
+        :param manager: MemoryManager owning this shard's store
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        self.manager = manager
+        self.requests = 0
+        super().__init__(path, _ShardHandler)
+
+    def dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        self.requests += 1
+        if method == "stats":
+            queue_stats = self.manager.write_queue.stats() if self.manager.write_queue is not None else {}
+            return {"requests": self.requests, "pid": os.getpid(), **queue_stats}
+        if method == "flush":
+            return self.manager.write_queue.flush(timeout=params.get("timeout")) \
+                if self.manager.write_queue is not None else True
+        if method not in SHARD_METHODS:
+            raise ValueError(f"Unknown shard method {method!r}")
+        return getattr(self.manager, method)(**params)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class ShardClient:
+    def __init__(self, path: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Pooled connections to one shard server, shared by threads
+
+        Up to `pool_size` connections are opened on demand and reused; callers
+        beyond that wait for a free one. A connection that fails is dropped
+        and the call retried once on a new one, provided the shard cannot have
+        run it: the request could not be sent, or the method is in
+        IDEMPOTENT_METHODS and the connection closed without a reply. A call
+        that timed out is never retried.
+
+        :param path: Socket path of the shard server
+        :param pool_size: Connections kept open at most
+        :param timeout: Seconds a call may take
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.idle: List[socket.socket] = []
+        self.opened = 0
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # Notified whenever a connection is returned or a pool slot frees up
+        self.available = threading.Condition(self.lock)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _acquire(self) -> socket.socket:
+        deadline = time.monotonic() + self.timeout
+        with self.lock:
+            while True:
+                if self.pid != os.getpid():
+                    # Connections must not be shared with a forked parent
+                    self.idle, self.opened, self.pid = [], 0, os.getpid()
+                if self.idle:
+                    return self.idle.pop()
+                if self.opened < self.pool_size:
+                    self.opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.available.wait(remaining):
+                    raise TimeoutError(f"No connection to shard {self.path} freed up within {self.timeout}s")
+        try:
+            return self._connect()
+        except OSError:
+            with self.lock:
+                self.opened -= 1
+                self.available.notify()
+            raise
+
+    def _release(self, sock: socket.socket):
+        with self.lock:
+            self.idle.append(sock)
+            self.available.notify()
+
+    def _discard(self, sock: socket.socket):
+        sock.close()
+        with self.lock:
+            self.opened -= 1
+            # A waiter may open a new connection in its place
+            self.available.notify()
+
+    def call(self, method: str, **params) -> Any:
+        """
+        Run `method` on the shard
+
+        :raises RuntimeError: The shard reported an error
+        :raises OSError: The shard could not be reached
+        """
+        for attempt in range(2):
+            sock = self._acquire()
+            try:
+                _send(sock, {"method": method, "params": params})
+            except OSError:
+                # Not delivered (typically a connection the shard closed while idle), so safe to send again
+                self._discard(sock)
+                if attempt:
+                    raise
+                continue
+            try:
+                response = _recv(sock)
+                if response is None:
+                    raise ConnectionResetError(f"Shard {self.path} closed the connection")
+            except OSError as e:
+                self._discard(sock)
+                # The shard may have run the request: sending it again would, e.g., store a memory twice
+                if attempt or method not in IDEMPOTENT_METHODS or isinstance(e, TimeoutError):
+                    raise
+                continue
+            self._release(sock)
+            if "error" in response:
+                raise RuntimeError(f"Shard {self.path}: {response['error']}")
+            return response["result"]
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sock in idle:
+            self._discard(sock)
+
+
+class ShardedMemoryManager:
+    def __init__(self, paths: Sequence[str], pool_size: int = DEFAULT_POOL_SIZE, replicas: int = DEFAULT_REPLICAS):
+        """
+        MemoryManager interface backed by shard servers
+
+        A user's memories live on the shard their user_id hashes to. Shards are
+        placed on the ring by socket file name (shard-0.sock, ...), so the
+        directory holding the sockets may change without moving users.
+
+        :param paths: Socket paths of the shard servers
+        :param pool_size: Connections per shard
+        :param replicas: Points per shard on the hash ring
+        """
+        self.clients = {os.path.basename(path): ShardClient(path, pool_size) for path in paths}
+        self.ring = HashRing(list(self.clients), replicas)
+        self.round_robin = itertools.cycle(list(self.clients))
+        # Memories are owned by the shards; these keep the MemoryManager attributes callers check
+        self.write_queue = None
+        self.lexical = None
+
+    def client_for(self, user_id: str) -> ShardClient:
+        return self.clients[self.ring.shard_for(user_id)]
+
+    def store_memory(self, user_id: str, memory_data: Dict):
+        """
+        Store a memory on the user's shard
+
+        :param user_id: Unique identifier for the user
+        :param memory_data: Memory content to store
+        """
+        try:
+            self.client_for(user_id).call("store_memory", user_id=user_id, memory_data=memory_data)
+        except Exception as e:
+            logger.error(f"Memory storage failed: {e}")
+
+    async def astore_memory(self, user_id: str, memory_data: Dict):
+        await asyncio.to_thread(self.store_memory, user_id, memory_data)
+
+    def retrieve_memories(self, user_id: str, query: str, top_k: int = 3) -> List[Dict]:
+        """
+        Retrieve most relevant memories for a user from their shard
+
+        :param user_id: Unique identifier for the user
+        :param query: Semantic search query
+        :param top_k: Number of memories to retrieve
+        :return: List of retrieved memories
+        """
+        try:
+            return self.client_for(user_id).call("retrieve_memories", user_id=user_id, query=query, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Memory retrieval failed: {e}")
+            return []
+
+    async def aretrieve_memories(self, user_id: str, query: str, top_k: int = 3) -> List[Dict]:
+        return await asyncio.to_thread(self.retrieve_memories, user_id, query, top_k)
+
+    def summarize_memories(self, memories: List[Dict]) -> str:
+        """Summarize memories on the next shard in turn, spreading the LLM calls"""
+        try:
+            return self.clients[next(self.round_robin)].call("summarize_memories", memories=memories)
+        except Exception as e:
+            logger.error(f"Memory summarization failed: {e}")
+            return "Unable to summarize memories."
+
+    async def asummarize_memories(self, memories: List[Dict]) -> str:
+        return await asyncio.to_thread(self.summarize_memories, memories)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every shard has written its queued memories"""
+        return all(client.call("flush", timeout=timeout) for client in self.clients.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: client.call("stats") for name, client in self.clients.items()}
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+
+def serve(path: str, store_path: str):
+    """Run one shard server until interrupted; its store lives in `store_path`"""
+    from ai_birthchart_memo_langBOT import build_memory_manager
+
+    manager = build_memory_manager(store_path)
+    with ShardServer(path, manager) as server:
+        logger.info(f"Memory shard serving {store_path or 'in-memory store'} on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if manager.write_queue is not None:
+                manager.write_queue.close()
+
+
+def main():
+    from ai_birthchart_memo_langBOT import MEMORY_STORE_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="Shard processes to start")
+    parser.add_argument("--socket-dir", default="/tmp/luna-memory", help="Directory for shard-<i>.sock")
+    parser.add_argument("--store-dir", default=MEMORY_STORE_PATH,
+                        help="Parent of each shard's store directory; empty keeps memories in memory")
+    args = parser.parse_args()
+
+    import multiprocessing
+
+    os.makedirs(args.socket_dir, exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(args.shards):
+        path = os.path.join(args.socket_dir, f"shard-{index}.sock")
+        store_path = os.path.join(args.store_dir, f"shard-{index}") if args.store_dir else ""
+        process = context.Process(target=serve, args=(path, store_path), name=f"memory-shard-{index}")
+        process.start()
+        processes.append((path, process))
+    print("MEMORY_SHARDS=" + ",".join(path for path, _ in processes))
+    try:
+        for _, process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for _, process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
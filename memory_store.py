@@ -0,0 +1,845 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import providers
+from ann_index import DEFAULT_NPROBE, IVFIndex
+from vector_quantization import DEFAULT_RERANK, DEFAULT_SUBSPACE_DIMS, make_codes
+from langgraph.store.base import (
+    BaseStore,
+    GetOp,
+    Item,
+    ListNamespacesOp,
+    Op,
+    PutOp,
+    Result,
+    SearchItem,
+    SearchOp,
+)
+
+logger = logging.getLogger(__name__)
+
+# Namespaces whose vector files stay mapped; the rest are paged out
+DEFAULT_MAX_ACTIVE_NAMESPACES = 256
+# Namespaces with fewer live vectors are searched exactly
+DEFAULT_ANN_MIN_SIZE = 2000
+DEFAULT_ANN_CONFIG = {"min_size": DEFAULT_ANN_MIN_SIZE, "nprobe": DEFAULT_NPROBE, "nlist": None, "rebuild_growth": 2.0}
+# In-memory codes searched instead of the float32 vectors; "type" is "int8" or "pq", "rerank" defaults
+# per type (see DEFAULT_RERANK). Product quantization
+# needs `min_size` vectors to train its codebooks and is retrained after `rebuild_growth`; smaller namespaces
+# are searched at full precision.
+DEFAULT_QUANTIZATION_CONFIG = {"type": "int8", "rerank": None, "subspace_dims": DEFAULT_SUBSPACE_DIMS,
+                               "min_size": 1024, "rebuild_growth": 2.0}
+NAMESPACE_SEPARATOR = "\x1f"
+# Threads training IVF indexes off the query path, shared by every namespace and store
+INDEX_BUILDER_THREADS = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    vector_row INTEGER,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS items_updated_at ON items (namespace, updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- Bumped by every write to a namespace, so processes notice that their mapped copy is stale
+CREATE TABLE IF NOT EXISTS namespace_versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def get_index_builder() -> ThreadPoolExecutor:
+    return providers.get("memory_store.index_builder", lambda: ThreadPoolExecutor(
+        max_workers=INDEX_BUILDER_THREADS, thread_name_prefix="vector-index"))
+
+
+def encode_namespace(namespace: Sequence[str]) -> str:
+    return NAMESPACE_SEPARATOR.join(namespace)
+
+
+def decode_namespace(namespace: str) -> Tuple[str, ...]:
+    return tuple(namespace.split(NAMESPACE_SEPARATOR))
+
+
+def extract_text(value: Dict[str, Any], fields: Sequence[str]) -> str:
+    """Text to embed for a value: "$" is the whole value, other fields are dotted paths"""
+    parts = []
+    for field in fields:
+        if field == "$":
+            parts.append(json.dumps(value, ensure_ascii=False))
+            continue
+        current: Any = value
+        for step in field.split("."):
+            current = current.get(step) if isinstance(current, dict) else None
+        if current is not None:
+            parts.append(current if isinstance(current, str) else json.dumps(current, ensure_ascii=False))
+    return "\n".join(parts)
+
+
+class NamespaceVectors:
+    def __init__(
+        self,
+        path: str,
+        dims: int,
+        keys: List[str],
+        rows: List[int],
+        ann_config: Optional[Dict[str, Any]] = None,
+        quantization: Optional[Dict[str, Any]] = None,
+        version: int = 0,
+    ):
+        """
+        Live vectors of one namespace, kept in sync with writes while the namespace is active
+
+        Positions index `keys`/`rows`; replaced and deleted keys leave dead positions
+        behind until the next compaction. Namespaces with at least
+        `ann_config["min_size"]` live vectors are searched through an IVF index.
+        With `quantization`, searches score compact in-memory codes and only
+        re-score the best `rerank` * k candidates with the float32 file. Indexes
+        and codes are built in the background; until they are ready (and while
+        grown ones are retrained) searches use the previous ones, or an exact
+        float32 scan.
+
+        :param path: The namespace's vector file
+        :param dims: Vector dimensionality
+        :param keys: Item key per position
+        :param rows: Row in the vector file per position
+        :param ann_config: IVF settings (min_size, nlist, nprobe, rebuild_growth), or None for exact search
+        :param quantization: Code settings (see DEFAULT_QUANTIZATION_CONFIG), or None for float32 only
+        :param version: Namespace version `keys`/`rows` were read at
+        """
+        self.path = path
+        self.dims = dims
+        self.version = version
+        self.keys: List[Optional[str]] = list(keys)
+        self.rows: List[int] = list(rows)
+        self.positions: Dict[str, int] = {key: position for position, key in enumerate(self.keys)}
+        self.ann_config = ann_config
+        self.ann: Optional[IVFIndex] = None
+        # Pending background training; `epoch` changes when compaction renumbers positions
+        self.rebuild: Optional[Future] = None
+        self.epoch = 0
+        self.quantization = quantization
+        self.codes = None
+        # Live vectors when the codes were built; product codes are retrained once it has grown enough
+        self.coded_size = 0
+        self.dead = 0
+        self.rows_array: Optional[np.ndarray] = None
+        self.alive_array: Optional[np.ndarray] = None
+        self.matrix: Optional[np.ndarray] = None
+        self.lock = threading.Lock()
+        self._remap()
+
+    def _remap(self):
+        # The file only grows; map it again when new rows were appended past the current map
+        row_count = os.path.getsize(self.path) // (4 * self.dims) if os.path.exists(self.path) else 0
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode="r", shape=(row_count, self.dims)) if row_count else None
+
+    def exact(self, positions: np.ndarray) -> np.ndarray:
+        """Full-precision vectors at `positions`"""
+        if self.rows_array is None:
+            self.rows_array = np.asarray(self.rows, dtype=np.int64)
+        return self.matrix[self.rows_array[positions]]
+
+    def fetch(self, positions: np.ndarray) -> np.ndarray:
+        """Vectors at `positions` as searched: decoded from the codes when quantized"""
+        return self.codes.decode(positions) if self.codes is not None else self.exact(positions)
+
+    def _codes_stale(self) -> bool:
+        config = self.quantization
+        if not config or self.matrix is None:
+            return False
+        live = len(self.positions)
+        if self.codes is None:
+            return live >= (config.get("min_size", 0) if config["type"] == "pq" else 0) and live > 0
+        return not self.codes.trained or (
+            config["type"] == "pq" and live >= self.coded_size * config.get("rebuild_growth", 2.0)
+        )
+
+    def _alive(self) -> np.ndarray:
+        if self.alive_array is None:
+            self.alive_array = np.fromiter(self.positions.values(), dtype=np.int64, count=len(self.positions))
+        return self.alive_array
+
+    def _compact(self):
+        if self.codes is not None:
+            self.codes.keep(np.asarray([position for position, key in enumerate(self.keys) if key is not None],
+                                       dtype=np.int64))
+        live = [(key, row) for key, row in zip(self.keys, self.rows) if key is not None]
+        self.keys = [key for key, _ in live]
+        self.rows = [row for _, row in live]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.dead = 0
+        self.ann = None
+        self.rows_array = self.alive_array = None
+        self.epoch += 1
+
+    def apply(self, removed: Iterable[str], added: List[Tuple[str, int, np.ndarray]]):
+        """
+        Mirror a committed write
+
+        :param removed: Keys whose previous vector is no longer valid
+        :param added: (key, file row, normalized vector) for each new vector
+        """
+        with self.lock:
+            for key in removed:
+                position = self.positions.pop(key, None)
+                if position is not None:
+                    self.keys[position] = None
+                    self.dead += 1
+            new_positions = []
+            for key, row, _ in added:
+                position = self.positions.pop(key, None)
+                if position is not None:
+                    self.keys[position] = None
+                    self.dead += 1
+                self.positions[key] = len(self.keys)
+                new_positions.append(len(self.keys))
+                self.keys.append(key)
+                self.rows.append(row)
+            self.rows_array = self.alive_array = None
+            if added and (self.matrix is None or max(row for _, row, _ in added) >= len(self.matrix)):
+                self._remap()
+            if self.codes is not None and added:
+                self.codes.append(np.stack([vector for _, _, vector in added]))
+            if self.ann is not None and added:
+                self.ann.add(np.stack([vector for _, _, vector in added]), np.asarray(new_positions))
+            if self.dead > len(self.positions):
+                self._compact()
+
+    def _index_stale(self) -> bool:
+        config = self.ann_config
+        return bool(config) and len(self.positions) >= config.get("min_size", DEFAULT_ANN_MIN_SIZE) and (
+            self.ann is None or self.ann.needs_rebuild)
+
+    def _schedule_rebuild(self):
+        # Under the lock. Training works on a snapshot of the positions; the previous codes and index keep serving
+        if self.rebuild is not None and not self.rebuild.done():
+            return
+        requantize = self._codes_stale()
+        # The IVF index clusters decoded vectors, so new codes come with a new index
+        reindex = self._index_stale() or (requantize and self.ann_config is not None and len(self.positions)
+                                          >= self.ann_config.get("min_size", DEFAULT_ANN_MIN_SIZE))
+        if not requantize and not reindex:
+            return
+        rows = np.asarray(self.rows, dtype=np.int64)
+        self.rebuild = get_index_builder().submit(
+            self._rebuild, self.epoch, len(self.keys), self._alive().copy(), rows, self.matrix, requantize, reindex)
+
+    def _rebuild(self, epoch: int, size: int, alive: np.ndarray, rows: np.ndarray, matrix: np.ndarray,
+                 requantize: bool, reindex: bool):
+        try:
+            # The file only grows, so the snapshot's map stays valid for its rows
+            exact = lambda positions: matrix[rows[positions]]
+            codes = self.codes
+            if requantize:
+                # Encodes every position, dead ones included, so that codes stay aligned with keys
+                codes = make_codes(self.quantization["type"], self.dims,
+                                   self.quantization.get("subspace_dims", DEFAULT_SUBSPACE_DIMS))
+                if not codes.trained:
+                    codes.train(exact(alive))
+                for start in range(0, size, 65536):
+                    codes.append(exact(np.arange(start, min(start + 65536, size))))
+
+            ann = None
+            if reindex:
+                config = self.ann_config
+                ann = IVFIndex(
+                    self.fetch,
+                    nlist=config.get("nlist"),
+                    nprobe=config.get("nprobe", DEFAULT_NPROBE),
+                    rebuild_growth=config.get("rebuild_growth", 2.0),
+                )
+                if codes is not None and not requantize:
+                    # Shared with searches, which append to it under the lock
+                    with self.lock:
+                        vectors = codes.decode(alive)
+                else:
+                    vectors = codes.decode(alive) if codes is not None else exact(alive)
+                ann.build(vectors, alive)
+
+            with self.lock:
+                if self.epoch != epoch:
+                    # Compacted meanwhile: the positions are stale; the next search starts over
+                    return
+                # Vectors appended while training
+                added = np.arange(size, len(self.keys))
+                if requantize:
+                    if len(added):
+                        codes.append(self.exact(added))
+                    self.codes, self.coded_size = codes, len(alive)
+                if ann is not None:
+                    if len(added):
+                        ann.add(self.fetch(added), added)
+                    self.ann = ann
+        except Exception:
+            logger.exception(f"Building the vector index of {self.path} failed")
+
+    def wait_for_rebuild(self, timeout: Optional[float] = None):
+        """Block until pending background training is in place; for benchmarks and tests"""
+        rebuild = self.rebuild
+        if rebuild is not None:
+            rebuild.result(timeout)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """
+        Top-k live keys by cosine similarity
+
+        :param query: Normalized query vector
+        :param k: Number of results
+        :return: (key, score) pairs, best first
+        """
+        with self.lock:
+            live = len(self.positions)
+            if not live or self.matrix is None:
+                return []
+            self._schedule_rebuild()
+            # Quantized scores pick candidates; the float32 vectors decide among them
+            wanted = k
+            if self.codes is not None:
+                wanted *= self.quantization.get("rerank") or DEFAULT_RERANK[self.quantization["type"]]
+
+            config = self.ann_config
+            if self.ann is not None and live >= config.get("min_size", DEFAULT_ANN_MIN_SIZE):
+                # Dead positions may still sit in the inverted lists
+                positions, scores = self.ann.search(query, wanted + min(self.dead, wanted))
+            else:
+                positions = self._alive()
+                scores = self.codes.scores(positions, query) if self.codes is not None else self.exact(positions) @ query
+                wanted = min(wanted, len(scores))
+                top = np.argpartition(-scores, wanted - 1)[:wanted]
+                top = top[np.argsort(-scores[top])]
+                positions, scores = positions[top], scores[top]
+            if self.codes is not None and len(positions):
+                scores = self.exact(positions) @ query
+                order = np.argsort(-scores)
+                positions, scores = positions[order], scores[order]
+
+            results = []
+            for position, score in zip(positions.tolist(), scores.tolist()):
+                key = self.keys[position]
+                if key is not None:
+                    results.append((key, score))
+            return results[:k]
+
+
+class PersistentVectorStore(BaseStore):
+    def __init__(
+        self,
+        path: str,
+        index: Optional[Dict[str, Any]] = None,
+        max_active_namespaces: int = DEFAULT_MAX_ACTIVE_NAMESPACES,
+        ann: Optional[Dict[str, Any]] = DEFAULT_ANN_CONFIG,
+        quantization: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Disk-backed store with semantic search, partitioned by namespace
+
+        Items live in a SQLite index; each namespace's embeddings are appended to
+        their own float32 file and memory-mapped only while the namespace is in
+        use, so startup reads nothing and the store can outgrow RAM.
+
+        Several processes may share a store: rows are appended while holding
+        SQLite's write lock, and a mapped namespace is reloaded once another
+        process has written to it.
+
+        The dimensionality is recorded in the index on first write. When
+        `index["dims"]` is None it is taken from there, or from the first
+        embedding; a model of a different dimensionality is refused.
+
+        :param path: Directory holding index.sqlite3 and vectors/
+        :param index: Same shape as InMemoryStore's: {"embed": Embeddings, "dims": int or None, "fields": [...]}
+        :param max_active_namespaces: Mapped namespaces kept in the LRU
+        :param ann: IVF index settings for large namespaces (see `NamespaceVectors`), or None for exact search
+        :param quantization: In-memory vector codes (see DEFAULT_QUANTIZATION_CONFIG), or None for float32 search
+        """
+        self.path = path
+        self.vector_dir = os.path.join(path, "vectors")
+        os.makedirs(self.vector_dir, exist_ok=True)
+        self.index_config = index
+        self.embeddings = index["embed"] if index else None
+        self.dims = index.get("dims") if index else None
+        self.fields = index.get("fields", ["$"]) if index else ["$"]
+        self.max_active_namespaces = max_active_namespaces
+        self.ann_config = ann
+        self.quantization = quantization
+
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.active: "OrderedDict[str, NamespaceVectors]" = OrderedDict()
+        self.active_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dims'").fetchone()
+        self.dims_recorded = row is not None
+        if row is not None:
+            self._check_dims(int(row[0]), stored=True)
+
+    def _check_dims(self, dims: int, stored: bool = False):
+        # Vector files are only readable at the dimensionality they were written with
+        if self.dims is not None and dims != self.dims:
+            source = "the store was created with" if stored else "the embedding model returns"
+            raise ValueError(f"Embedding dimensionality mismatch: {source} {dims}, expected {self.dims}")
+        self.dims = dims
+        if not self.dims_recorded:
+            self._connection().execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dims', ?)", (str(dims),))
+            self.dims_recorded = True
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), timeout=30, isolation_level=None)
+            # Only takes effect on a new file; lets `vacuum` hand freed pages back to the filesystem
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def vector_file(self, namespace: str) -> str:
+        digest = hashlib.sha1(namespace.encode("utf-8")).hexdigest()
+        return os.path.join(self.vector_dir, f"{digest}.f32")
+
+    # Vectors
+
+    def _append_vectors(self, namespace: str, vectors: np.ndarray) -> List[int]:
+        # Rows are appended, never rewritten; replaced and deleted rows are left as garbage.
+        # Callers hold SQLite's write lock (BEGIN IMMEDIATE), so no other process appends meanwhile.
+        path = self.vector_file(namespace)
+        row_bytes = 4 * self.dims
+        with open(path, "ab") as f:
+            size = f.seek(0, os.SEEK_END)
+            first_row = size // row_bytes
+            if size % row_bytes:
+                # Torn row of a writer that died mid-append; its transaction never committed
+                f.truncate(first_row * row_bytes)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        return list(range(first_row, first_row + len(vectors)))
+
+    def _namespace_version(self, namespace: str) -> int:
+        row = self._connection().execute(
+            "SELECT version FROM namespace_versions WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, namespace: str) -> Tuple[int, int]:
+        # Inside the write transaction; returns the versions before and after this write
+        previous = self._namespace_version(namespace)
+        self._connection().execute(
+            "INSERT INTO namespace_versions (namespace, version) VALUES (?, ?) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = excluded.version",
+            (namespace, previous + 1),
+        )
+        return previous, previous + 1
+
+    def _forget(self, namespace: str, loaded: NamespaceVectors):
+        with self.active_lock:
+            if self.active.get(namespace) is loaded:
+                del self.active[namespace]
+
+    def _load_namespace(self, namespace: str) -> NamespaceVectors:
+        with self.active_lock:
+            loaded = self.active.get(namespace)
+            if loaded is not None:
+                self.active.move_to_end(namespace)
+                return loaded
+
+        # Under the write lock so that `vacuum` cannot renumber rows between the read and the mapping
+        with self.write_lock:
+            conn = self._connection()
+            # One read transaction: the rows are exactly those of the recorded version
+            conn.execute("BEGIN")
+            try:
+                version = self._namespace_version(namespace)
+                rows = conn.execute(
+                    "SELECT key, vector_row FROM items WHERE namespace = ? AND vector_row IS NOT NULL",
+                    (namespace,),
+                ).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            loaded = NamespaceVectors(
+                self.vector_file(namespace),
+                self.dims,
+                [key for key, _ in rows],
+                [row for _, row in rows],
+                self.ann_config,
+                self.quantization,
+                version,
+            )
+
+            with self.active_lock:
+                loaded = self.active.setdefault(namespace, loaded)
+                self.active.move_to_end(namespace)
+                while len(self.active) > self.max_active_namespaces:
+                    self.active.popitem(last=False)
+        return loaded
+
+    def vacuum(self, min_garbage: float = 0.5) -> int:
+        """
+        Rewrite vector files that are mostly dead rows, delete those of emptied namespaces and shrink the index
+
+        Replaced and deleted vectors otherwise stay in the append-only files for
+        good. Other processes reload rewritten namespaces on their next search,
+        but one already mapping a namespace while it is rewritten may read the
+        old rows, so run it while the store is idle.
+
+        :param min_garbage: Share of dead rows above which a file is rewritten
+        :return: Bytes freed on disk
+        """
+        if self.dims is None:
+            return 0
+        row_bytes = 4 * self.dims
+        freed = 0
+        with self.write_lock:
+            conn = self._connection()
+            namespaces = {
+                self.vector_file(namespace): namespace
+                for (namespace,) in conn.execute("SELECT DISTINCT namespace FROM items WHERE vector_row IS NOT NULL")
+            }
+            for name in os.listdir(self.vector_dir):
+                path = os.path.join(self.vector_dir, name)
+                size = os.path.getsize(path)
+                namespace = namespaces.get(path)
+                if namespace is None:
+                    if name.endswith(".f32"):
+                        os.remove(path)
+                        freed += size
+                    continue
+                rows = conn.execute(
+                    "SELECT key, vector_row FROM items WHERE namespace = ? AND vector_row IS NOT NULL ORDER BY vector_row",
+                    (namespace,),
+                ).fetchall()
+                total = size // row_bytes
+                if total - len(rows) <= min_garbage * total:
+                    continue
+
+                vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(total, self.dims))
+                with open(f"{path}.tmp", "wb") as f:
+                    f.write(np.ascontiguousarray(vectors[[row for _, row in rows]]).tobytes())
+                del vectors
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "UPDATE items SET vector_row = ? WHERE namespace = ? AND key = ?",
+                        [(new_row, namespace, key) for new_row, (key, _) in enumerate(rows)],
+                    )
+                    self._bump_version(namespace)
+                    os.replace(f"{path}.tmp", path)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                with self.active_lock:
+                    self.active.pop(namespace, None)
+                freed += size - len(rows) * row_bytes
+
+            index_files = [os.path.join(self.path, name) for name in ("index.sqlite3", "index.sqlite3-wal")]
+            before = sum(os.path.getsize(path) for path in index_files if os.path.exists(path))
+            # Through executescript: execute() only steps incremental_vacuum once, freeing a single page
+            conn.executescript("PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);")
+            freed += max(0, before - sum(os.path.getsize(path) for path in index_files if os.path.exists(path)))
+        if freed:
+            logger.info(f"Memory store vacuum freed {freed} bytes")
+        return freed
+
+    def _apply_to_active(self, namespace: str, removed: List[str], added: List[Tuple[str, int, np.ndarray]],
+                         versions: Tuple[int, int]):
+        # Inactive namespaces are read from SQLite on their next search
+        with self.active_lock:
+            loaded = self.active.get(namespace)
+        if loaded is None:
+            return
+        previous, version = versions
+        if loaded.version != previous:
+            # Another process wrote in between; the mirror cannot be patched, so it is reloaded
+            self._forget(namespace, loaded)
+            return
+        loaded.apply(removed, added)
+        loaded.version = version
+
+    def stored_vectors(self, namespace: Tuple[str, ...], keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Normalized embeddings already stored for `keys`, read from the vector file instead of re-embedding
+
+        :param namespace: Namespace of the items
+        :param keys: Item keys; those stored without an embedding are left out
+        """
+        if self.dims is None:
+            return {}
+        encoded = encode_namespace(namespace)
+        # Under the write lock so that `vacuum` cannot renumber rows between the read and the mapping
+        with self.write_lock:
+            conn = self._connection()
+            rows = []
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"SELECT key, vector_row FROM items WHERE namespace = ? AND key IN ({placeholders}) "
+                    "AND vector_row IS NOT NULL",
+                    [encoded, *chunk],
+                ))
+            if not rows:
+                return {}
+            path = self.vector_file(encoded)
+            vectors = np.memmap(path, dtype=np.float32, mode="r",
+                                shape=(os.path.getsize(path) // (4 * self.dims), self.dims))
+            found = np.array(vectors[[row for _, row in rows]])
+            del vectors
+        return {key: vector for (key, _), vector in zip(rows, found)}
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        self._check_dims(len(vector))
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def vector_memory(self) -> Dict[str, int]:
+        """Bytes searched per query across active namespaces: the codes when quantized, else the float32 vectors"""
+        with self.active_lock:
+            loaded = list(self.active.values())
+        vectors = sum(len(namespace.positions) for namespace in loaded)
+        searched = sum(namespace.codes.nbytes if namespace.codes is not None else 4 * namespace.dims
+                       * len(namespace.positions) for namespace in loaded)
+        return {"namespaces": len(loaded), "vectors": vectors, "float32_bytes": 4 * (self.dims or 0) * vectors,
+                "searched_bytes": searched}
+
+    def namespace_usage(self, prefix: Tuple[str, ...]) -> Dict[Tuple[str, ...], Tuple[int, int]]:
+        """(items, bytes of values and vectors) per namespace under `prefix`, summed by SQLite without decoding"""
+        encoded = encode_namespace(prefix)
+        rows = self._connection().execute(
+            "SELECT namespace, COUNT(*), SUM(length(CAST(value AS BLOB)) "
+            "+ CASE WHEN vector_row IS NULL THEN 0 ELSE ? END) FROM items "
+            "WHERE namespace = ? OR substr(namespace, 1, ?) = ? GROUP BY namespace",
+            (4 * (self.dims or 0), encoded, len(encoded) + 1, encoded + NAMESPACE_SEPARATOR),
+        ).fetchall()
+        return {decode_namespace(namespace): (count, size) for namespace, count, size in rows}
+
+    def item_usage(self, namespace: Tuple[str, ...]) -> List[Tuple[str, datetime, int]]:
+        """(key, updated_at, bytes of value and vector) of every item directly in `namespace`, without decoding values"""
+        rows = self._connection().execute(
+            "SELECT key, updated_at, length(CAST(value AS BLOB)) + CASE WHEN vector_row IS NULL THEN 0 ELSE ? END "
+            "FROM items WHERE namespace = ?",
+            (4 * (self.dims or 0), encode_namespace(namespace)),
+        ).fetchall()
+        return [(key, datetime.fromisoformat(updated_at), size) for key, updated_at, size in rows]
+
+    # Operations
+
+    def _row_to_item(self, namespace: str, row) -> Item:
+        key, value, created_at, updated_at = row[:4]
+        return Item(
+            value=json.loads(value),
+            key=key,
+            namespace=decode_namespace(namespace),
+            created_at=datetime.fromisoformat(created_at),
+            updated_at=datetime.fromisoformat(updated_at),
+        )
+
+    def _get(self, op: GetOp) -> Optional[Item]:
+        namespace = encode_namespace(op.namespace)
+        row = self._connection().execute(
+            "SELECT key, value, created_at, updated_at FROM items WHERE namespace = ? AND key = ?",
+            (namespace, op.key),
+        ).fetchone()
+        return self._row_to_item(namespace, row) if row else None
+
+    def _put_all(self, ops: List[PutOp]):
+        # Embed every indexed value of the batch in one call
+        to_embed = [
+            op for op in ops
+            if op.value is not None and op.index is not False and self.embeddings is not None
+        ]
+        vectors: Dict[int, np.ndarray] = {}
+        if to_embed:
+            texts = [extract_text(op.value, op.index or self.fields) for op in to_embed]
+            embedded = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            self._check_dims(embedded.shape[1])
+            embedded /= np.maximum(np.linalg.norm(embedded, axis=1, keepdims=True), 1e-12)
+            vectors = {id(op): vector for op, vector in zip(to_embed, embedded)}
+
+        now = datetime.now(timezone.utc).isoformat()
+        with self.write_lock:
+            by_namespace: Dict[str, List[PutOp]] = {}
+            for op in ops:
+                by_namespace.setdefault(encode_namespace(op.namespace), []).append(op)
+
+            conn = self._connection()
+            # Takes SQLite's write lock before appending, which allocates vector rows across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for namespace, namespace_ops in by_namespace.items():
+                    indexed = [op for op in namespace_ops if id(op) in vectors]
+                    rows = dict(zip(
+                        map(id, indexed),
+                        self._append_vectors(namespace, np.stack([vectors[id(op)] for op in indexed]))
+                        if indexed else [],
+                    ))
+                    for op in namespace_ops:
+                        if op.value is None:
+                            conn.execute("DELETE FROM items WHERE namespace = ? AND key = ?", (namespace, op.key))
+                            continue
+                        conn.execute(
+                            "INSERT INTO items (namespace, key, value, created_at, updated_at, vector_row) "
+                            "VALUES (?, ?, ?, ?, ?, ?) "
+                            "ON CONFLICT(namespace, key) DO UPDATE SET "
+                            "value = excluded.value, updated_at = excluded.updated_at, vector_row = excluded.vector_row",
+                            (namespace, op.key, json.dumps(op.value, ensure_ascii=False), now, now, rows.get(id(op))),
+                        )
+                    self._apply_to_active(
+                        namespace,
+                        [op.key for op in namespace_ops],
+                        [(op.key, rows[id(op)], vectors[id(op)]) for op in indexed],
+                        self._bump_version(namespace),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                # Active namespaces may already mirror part of the batch
+                with self.active_lock:
+                    for namespace in by_namespace:
+                        self.active.pop(namespace, None)
+                raise
+
+    def _matching_namespaces(self, prefix: Tuple[str, ...]) -> List[str]:
+        encoded = encode_namespace(prefix)
+        rows = self._connection().execute(
+            "SELECT DISTINCT namespace FROM items WHERE namespace = ? OR substr(namespace, 1, ?) = ?",
+            (encoded, len(encoded) + 1, encoded + NAMESPACE_SEPARATOR),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _matches_filter(value: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+        return not filter or all(value.get(field) == expected for field, expected in filter.items())
+
+    def _fetch_items(self, namespace: str, keys: List[str]) -> Dict[str, Item]:
+        conn = self._connection()
+        items = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT key, value, created_at, updated_at FROM items WHERE namespace = ? AND key IN ({placeholders})",
+                [namespace, *chunk],
+            ):
+                items[row[0]] = self._row_to_item(namespace, row)
+        return items
+
+    def _vector_candidates(self, namespace: str, query_vector: np.ndarray, wanted: int) -> List[Tuple[str, float]]:
+        loaded = self._load_namespace(namespace)
+        # Ahead of the committed version only while a write of this process is committing
+        if loaded.version < self._namespace_version(namespace):
+            # Another process wrote to the namespace since it was mapped
+            self._forget(namespace, loaded)
+            loaded = self._load_namespace(namespace)
+        return loaded.search(query_vector, wanted)
+
+    def _search(self, op: SearchOp) -> List[SearchItem]:
+        namespaces = self._matching_namespaces(op.namespace_prefix)
+        wanted = op.offset + op.limit
+
+        if op.query and self.embeddings is not None:
+            skip = 0
+            query_vector = self._embed_query(op.query)
+            # Over-fetch so that filtered-out items do not starve the result
+            fetch = wanted * 4 if op.filter else wanted
+            scored = []
+            for namespace in namespaces:
+                candidates = self._vector_candidates(namespace, query_vector, fetch)
+                items = self._fetch_items(namespace, [key for key, _ in candidates])
+                scored.extend((score, items[key]) for key, score in candidates if key in items)
+            scored.sort(key=lambda pair: pair[0], reverse=True)
+        else:
+            conn = self._connection()
+            # Only a page is read and decoded: with one namespace and no filter SQLite skips `offset` rows
+            # itself, otherwise each namespace contributes at most its newest `wanted` matches
+            skip = op.offset if len(namespaces) == 1 and not op.filter else 0
+            scored = []
+            for namespace in namespaces:
+                matched = 0
+                for row in conn.execute(
+                    "SELECT key, value, created_at, updated_at FROM items WHERE namespace = ? "
+                    "ORDER BY updated_at DESC, key LIMIT ? OFFSET ?",
+                    (namespace, -1 if op.filter else wanted - skip, skip),
+                ):
+                    item = self._row_to_item(namespace, row)
+                    if not self._matches_filter(item.value, op.filter):
+                        continue
+                    scored.append((None, item))
+                    matched += 1
+                    if matched == wanted - skip:
+                        break
+            scored.sort(key=lambda pair: pair[1].updated_at, reverse=True)
+
+        results = [
+            SearchItem(
+                namespace=item.namespace,
+                key=item.key,
+                value=item.value,
+                created_at=item.created_at,
+                updated_at=item.updated_at,
+                score=score,
+            )
+            for score, item in scored
+            if self._matches_filter(item.value, op.filter)
+        ]
+        return results[op.offset - skip:op.offset - skip + op.limit]
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> List[Tuple[str, ...]]:
+        rows = self._connection().execute("SELECT DISTINCT namespace FROM items ORDER BY namespace").fetchall()
+        namespaces = set()
+        for (encoded,) in rows:
+            namespace = decode_namespace(encoded)
+            matches = True
+            for condition in op.match_conditions or ():
+                path = tuple(condition.path)
+                candidate = namespace[:len(path)] if condition.match_type == "prefix" else namespace[-len(path):]
+                if len(candidate) != len(path) or any(p != "*" and p != c for p, c in zip(path, candidate)):
+                    matches = False
+                    break
+            if matches:
+                namespaces.add(namespace[:op.max_depth] if op.max_depth else namespace)
+        return sorted(namespaces)[op.offset:op.offset + op.limit]
+
+    def batch(self, ops: Iterable[Op]) -> List[Result]:
+        ops = list(ops)
+        results: List[Result] = [None] * len(ops)
+        # Ops apply in order; consecutive puts share one embedding call and transaction
+        puts: List[PutOp] = []
+        for index, op in enumerate(ops):
+            if isinstance(op, PutOp):
+                puts.append(op)
+                continue
+            if puts:
+                self._put_all(puts)
+                puts = []
+            if isinstance(op, GetOp):
+                results[index] = self._get(op)
+            elif isinstance(op, SearchOp):
+                results[index] = self._search(op)
+            elif isinstance(op, ListNamespacesOp):
+                results[index] = self._list_namespaces(op)
+        if puts:
+            self._put_all(puts)
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> List[Result]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.batch, list(ops))
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+# Remote caches are kept alive a little longer than local entries so a
+# handle is never used after the provider has already expired it
+REMOTE_TTL_GRACE_SECONDS = 60
+
+
+class LocalPrefixBackend:
+    """
+    Keeps the prefix as a prebuilt SystemMessage and resends it with every call.
+
+    Saves prompt formatting per turn; used as the fallback for every other backend.
+    """
+
+    def create(self, system_text: str, ttl: float) -> Any:
+        return SystemMessage(content=system_text)
+
+    def prepare(self, handle: Any, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        return [handle] + list(messages), {}
+
+    def release(self, handle: Any):
+        pass
+
+
+class GeminiContextCacheBackend:
+    """
+    Stores the prefix as a Gemini cached content so each turn sends only the conversation.
+
+    Gemini rejects caches below its minimum token count; `PromptPrefixCache` then
+    falls back to `LocalPrefixBackend` for that prefix.
+    """
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+    def create(self, system_text: str, ttl: float) -> Any:
+        cached = self.genai.caching.CachedContent.create(
+            model=self.model_name,
+            system_instruction=system_text,
+            ttl=timedelta(seconds=ttl + REMOTE_TTL_GRACE_SECONDS),
+        )
+        return cached.name
+
+    def prepare(self, handle: Any, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        return list(messages), {"cached_content": handle}
+
+    def release(self, handle: Any):
+        try:
+            self.genai.caching.CachedContent.get(handle).delete()
+        except Exception as e:
+            logger.warning(f"Failed to delete cached content {handle}: {e}")
+
+
+class PromptPrefixCache:
+    def __init__(
+        self,
+        backend=None,
+        max_entries: int = 256,
+        ttl: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        LRU/TTL cache of reusable prompt prefixes (static instructions + chart block)
+
+        :param backend: Object with `create`, `prepare` and `release`; defaults to `LocalPrefixBackend`
+        :param max_entries: Maximum number of cached prefixes
+        :param ttl: Seconds a prefix stays valid after it was created
+        :param clock: Time source, injectable for tests
+        """
+        self.fallback = LocalPrefixBackend()
+        self.backend = backend or self.fallback
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: "OrderedDict[str, Tuple[Any, Any, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self, key: str):
+        backend, handle, _ = self.entries.pop(key)
+        self.evictions += 1
+        backend.release(handle)
+
+    def _lookup(self, key: str) -> Optional[Tuple[Any, Any]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] <= self.clock():
+                self._evict(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def _create(self, key: str, build: Callable[[], str]) -> Tuple[Any, Any]:
+        system_text = build()
+        backend = self.backend
+        try:
+            handle = backend.create(system_text, self.ttl)
+        except Exception as e:
+            if backend is self.fallback:
+                raise
+            logger.warning(f"Prefix cache backend failed, using local prefix: {e}")
+            backend = self.fallback
+            handle = backend.create(system_text, self.ttl)
+
+        with self.lock:
+            if key in self.entries:
+                self._evict(key)
+            self.entries[key] = (backend, handle, self.clock() + self.ttl)
+            while len(self.entries) > self.max_entries:
+                self._evict(next(iter(self.entries)))
+        return backend, handle
+
+    def prepare(
+        self,
+        key: str,
+        build: Callable[[], str],
+        messages: List[BaseMessage],
+    ) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        Prepare an LLM call that reuses the cached prefix for `key`
+
+        :param key: Prefix identity, e.g. the chart hash
+        :param build: Returns the full system prompt text; only called on a miss
+        :param messages: Conversation messages to send after the prefix
+        :return: Messages and extra keyword arguments for `llm.invoke`/`llm.stream`
+        """
+        entry = self._lookup(key)
+        backend, handle = entry if entry is not None else self._create(key, build)
+        return backend.prepare(handle, messages)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._evict(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.entries),
+            }
@@ -0,0 +1,84 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def register(name: str, factory: Callable[[], Any]):
+    """
+    Register a factory without calling it
+
+    :param name: Provider name, e.g. "chat:gemini-1.5-pro-002"
+    :param factory: Zero-argument callable building the instance on first use
+    """
+    with _lock:
+        _factories.setdefault(name, factory)
+
+
+def get(name: str, factory: Optional[Callable[[], Any]] = None) -> Any:
+    """
+    Return the shared instance for `name`, building it on first use
+
+    :param name: Provider name
+    :param factory: Registered on the fly if `name` has no factory yet
+    :return: The instance, built at most once per process
+    """
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _instances:
+            if factory is not None:
+                _factories.setdefault(name, factory)
+            if name not in _factories:
+                raise KeyError(f"No provider registered for {name!r}")
+            _instances[name] = _factories[name]()
+        return _instances[name]
+
+
+def override(name: str, instance: Any):
+    """Replace an instance, e.g. with a fake model in benchmarks"""
+    with _lock:
+        _instances[name] = instance
+
+
+def reset(name: Optional[str] = None):
+    """Forget built instances (all of them when `name` is None) so they are rebuilt on next use"""
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+
+def gemini_api_key() -> str:
+    gemini_api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("GEMINI_API_KEY environment variable not set.")
+    return gemini_api_key
+
+
+def chat_model(model_name: str):
+    """Shared Gemini chat client for `model_name`; identical concurrent calls share one request (see single_flight)"""
+    def build():
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        from single_flight import coalesced
+
+        return coalesced(ChatGoogleGenerativeAI(model=model_name, google_api_key=gemini_api_key()), model_name)
+
+    return get(f"chat:{model_name}", build)
+
+
+def embedding_model(model_name: str):
+    """Shared Gemini embeddings client for `model_name`"""
+    def build():
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=gemini_api_key())
+
+    return get(f"embeddings:{model_name}", build)
@@ -0,0 +1,405 @@
+"""
+Semantic cache of priestess replies to recurring first questions
+
+Many questions are near-duplicates ("what does my Moon in Bharni mean") asked
+against charts that agree on everything the question touches. A reply is
+stored under the embedding of its question, in a partition keyed by the reply
+language and a signature of the relevant chart rows (the planets the question
+names, or the Ascendant, Sun and Moon, plus the calendar rows selected for it).
+A later question in the same partition whose embedding is at least
+`threshold`-similar is answered from the cache.
+
+Only first questions are cached: once there is history or a summary, it shapes
+the answer. A sample of hits can be audited by generating a fresh reply anyway
+and comparing the two, which estimates the false-hit rate.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from astro_calendar import CalendarSelection, DateRange, mentioned_ranges
+from astro_encoding import PLANET_COLUMNS, EncodedChart
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity from which a stored question counts as the same question
+DEFAULT_THRESHOLD = 0.9
+# Seconds a reply is served after it was generated
+DEFAULT_TTL = 6 * 3600
+DEFAULT_MAX_ENTRIES = 10_000
+# Replies kept per (language, chart signature) partition; the oldest is dropped first
+DEFAULT_MAX_PARTITION_ENTRIES = 64
+# Share of hits that are audited (a fresh reply is generated and compared with the cached one)
+DEFAULT_AUDIT_RATE = 0.0
+# Audited replies less similar than this to the fresh reply count as false hits
+DEFAULT_AUDIT_THRESHOLD = 0.8
+# Audited hits kept for review
+AUDIT_LOG_SIZE = 256
+# Size of the local hashing embedding
+LOCAL_EMBEDDING_DIMS = 512
+# Rows standing for the chart when the question names no planet, sign or nakshatra
+CORE_PLANETS = ("Ascendant", "Sun", "Moon")
+# Columns identifying a planet row in a question; the degree is left out of the signature
+_MENTION_COLUMNS = tuple(PLANET_COLUMNS.index(column) for column in ("Name", "sign", "nakshatra"))
+_SIGNATURE_COLUMNS = tuple(index for index, column in enumerate(PLANET_COLUMNS) if column != "sign_degree")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Russian planet names (by stem, to cover their cases) and the chart's English names
+_PLANET_ALIASES = (
+    ("солн", "Sun"), ("лун", "Moon"), ("марс", "Mars"), ("меркур", "Mercury"), ("юпитер", "Jupiter"),
+    ("венер", "Venus"), ("сатурн", "Saturn"), ("раху", "Rahu"), ("кету", "Ketu"), ("асцендент", "Ascendant"),
+)
+
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dims: int = LOCAL_EMBEDDING_DIMS):
+        """
+        Local embedding of words, word pairs and character trigrams hashed into `dims` buckets
+
+        Lexical rather than semantic, but needs no model or network: questions
+        sharing most of their wording land close together. For tests and
+        benchmarks, and for deployments that cache only near-verbatim repeats.
+        """
+        self.dims = dims
+
+    def _features(self, text: str) -> Iterable[str]:
+        words = _WORD_RE.findall(unicodedata.normalize("NFC", text).lower())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f" {word} "
+            yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for feature in self._features(text):
+            bucket = zlib.crc32(feature.encode("utf-8"))
+            vector[bucket % self.dims] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def detect_script(text: str) -> str:
+    """
+    Dominant script of a text's letters ("latin", "cyrillic", ...), standing in for its language
+
+    Languages sharing a script share a partition unless the caller knows the language.
+    """
+    counts: Dict[str, int] = {}
+    for char in text:
+        if char.isalpha():
+            script = unicodedata.name(char, "UNKNOWN").split(" ", 1)[0].lower()
+            counts[script] = counts.get(script, 0) + 1
+    return max(counts, key=counts.get) if counts else "none"
+
+
+def _planet_rows(chart: EncodedChart) -> List[List[str]]:
+    rows, inside = [], False
+    for line in chart.head:
+        cells = line.split(" | ")
+        if line.startswith("Natal planets ("):
+            inside = True
+        elif inside and len(cells) == len(PLANET_COLUMNS):
+            rows.append(cells)
+        else:
+            inside = False
+    return rows
+
+
+def chart_signature(chart: Optional[EncodedChart], selection: Optional[CalendarSelection], question: str,
+                    *context: str) -> str:
+    """
+    Hash of the chart features a question depends on
+
+    Planet rows are those whose name, sign or nakshatra the question mentions
+    (Russian planet names included), else the Ascendant, Sun and Moon; degrees
+    are left out so charts differing only in them share replies. Today's date,
+    the periods the question mentions and the selected calendar rows are always
+    included, so "today" and "tomorrow" never share a reply.
+
+    :param chart: Encoded chart, or None when the thread has none
+    :param selection: Calendar rows selected for the question
+    :param question: The user's question
+    :param context: Further strings the reply depends on, e.g. model and prompt version
+    """
+    parts = list(context)
+    if chart is not None:
+        words = set(_WORD_RE.findall(question.lower()))
+        named = {name for stem, name in _PLANET_ALIASES if any(word.startswith(stem) for word in words)}
+        rows = _planet_rows(chart)
+        mentioned = [cells for cells in rows
+                     if cells[0] in named or any(cells[index].lower() in words for index in _MENTION_COLUMNS)]
+        for cells in mentioned or [cells for cells in rows if cells[0] in CORE_PLANETS]:
+            parts.append(" | ".join(cells[index] for index in _SIGNATURE_COLUMNS))
+        if selection is not None:
+            horizon = DateRange(chart.calendar.start, chart.calendar.end) if len(chart.calendar) else None
+            ranges, full = mentioned_ranges(question, selection.today, horizon)
+            parts.append(f"{selection.today.isoformat()} {ranges} {full}")
+            parts.extend(chart.calendar.lines[position] for position in selection.positions)
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("question", "reply", "created", "seconds")
+
+    def __init__(self, question: str, reply: str, created: float, seconds: float):
+        self.question = question
+        self.reply = reply
+        self.created = created
+        # Generation time, saved again on every hit
+        self.seconds = seconds
+
+
+class _Partition:
+    def __init__(self, dims: int):
+        self.vectors = np.empty((0, dims), dtype=np.float32)
+        self.entries: List[_Entry] = []
+
+    def keep(self, positions: List[int]):
+        self.vectors = self.vectors[positions]
+        self.entries = [self.entries[position] for position in positions]
+
+
+class CacheLookup(NamedTuple):
+    partition: str
+    question: str
+    vector: np.ndarray
+    # Cached reply to serve; None on a miss or an audited hit
+    reply: Optional[str]
+    similarity: float
+    # Entry matched by an audited hit, compared with the fresh reply by `record`
+    audited: Optional[_Entry]
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_partition_entries: int = DEFAULT_MAX_PARTITION_ENTRIES,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        audit_threshold: float = DEFAULT_AUDIT_THRESHOLD,
+        clock=time.monotonic,
+        seed: Optional[int] = None,
+    ):
+        """
+        Replies keyed by question embedding within (language, chart signature) partitions
+
+        Callers `lookup` a question, serve `reply` when it is set, and otherwise
+        generate one and pass it to `record`. Least recently used partitions are
+        dropped beyond `max_entries` replies.
+
+        :param embeddings: Embeds questions (and, when auditing, replies)
+        :param threshold: Minimum cosine similarity of a hit
+        :param ttl: Seconds a reply is served after it was generated
+        :param max_entries: Replies kept in total
+        :param max_partition_entries: Replies kept per partition
+        :param audit_rate: Share of hits regenerated to measure false hits
+        :param audit_threshold: Minimum similarity of cached and fresh replies for an audited hit to be correct
+        :param clock: Time source, injectable for tests
+        :param seed: Seed of the audit sampling
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_partition_entries = max_partition_entries
+        self.audit_rate = audit_rate
+        self.audit_threshold = audit_threshold
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.audits: "deque[Dict[str, Any]]" = deque(maxlen=AUDIT_LOG_SIZE)
+        self.counters = {
+            "lookups": 0, "hits": 0, "misses": 0, "bypasses": 0, "stores": 0, "expired": 0, "evictions": 0,
+            "audited": 0, "false_hits": 0, "errors": 0,
+        }
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def bypass(self):
+        """Count a request that was not eligible for caching (e.g. a follow-up question)"""
+        with self.lock:
+            self.counters["bypasses"] += 1
+
+    def _match(self, partition_key: str, question: str, vector: np.ndarray) -> CacheLookup:
+        now = self.clock()
+        with self.lock:
+            self.counters["lookups"] += 1
+            partition = self.partitions.get(partition_key)
+            similarity, entry = 0.0, None
+            if partition is not None:
+                self.partitions.move_to_end(partition_key)
+                live = [i for i, stored in enumerate(partition.entries) if now - stored.created < self.ttl]
+                if len(live) < len(partition.entries):
+                    self.counters["expired"] += len(partition.entries) - len(live)
+                    self.size -= len(partition.entries) - len(live)
+                    partition.keep(live)
+                if partition.entries and len(vector) == partition.vectors.shape[1]:
+                    scores = partition.vectors @ vector
+                    best = int(np.argmax(scores))
+                    similarity = float(scores[best])
+                    entry = partition.entries[best] if similarity >= self.threshold else None
+
+            if entry is None:
+                self.counters["misses"] += 1
+                return CacheLookup(partition_key, question, vector, None, similarity, None)
+            if self.audit_rate and self.random.random() < self.audit_rate:
+                self.counters["audited"] += 1
+                return CacheLookup(partition_key, question, vector, None, similarity, entry)
+            self.counters["hits"] += 1
+            self.latency_saved += entry.seconds
+            return CacheLookup(partition_key, question, vector, entry.reply, similarity, None)
+
+    def _failed(self, action: str, e: Exception):
+        # The cache only saves work; a failing embeddings model must not fail the reply
+        logger.error(f"Response cache {action} failed: {e}")
+        with self.lock:
+            self.counters["errors"] += 1
+
+    def lookup(self, partition: str, question: str) -> Optional[CacheLookup]:
+        """
+        Find a reply to an equivalent question
+
+        :param partition: Language and chart signature (see `chart_signature`)
+        :param question: The user's question
+        :return: Lookup whose `reply` is set on a hit (pass it to `record` otherwise), or None if embedding failed
+        """
+        try:
+            vector = self.embeddings.embed_query(question)
+        except Exception as e:
+            self._failed("lookup", e)
+            return None
+        return self._match(partition, question, self._normalize(vector))
+
+    async def alookup(self, partition: str, question: str) -> Optional[CacheLookup]:
+        """Async `lookup`"""
+        try:
+            vector = await self.embeddings.aembed_query(question)
+        except Exception as e:
+            self._failed("lookup", e)
+            return None
+        return self._match(partition, question, self._normalize(vector))
+
+    def _store(self, lookup: CacheLookup, reply: str, seconds: float):
+        with self.lock:
+            partition = self.partitions.get(lookup.partition)
+            if partition is None:
+                partition = self.partitions[lookup.partition] = _Partition(len(lookup.vector))
+            self.partitions.move_to_end(lookup.partition)
+            if len(lookup.vector) != partition.vectors.shape[1]:
+                return
+            partition.vectors = np.vstack([partition.vectors, lookup.vector[None, :]])
+            partition.entries.append(_Entry(lookup.question, reply, self.clock(), seconds))
+            self.size += 1
+            self.counters["stores"] += 1
+            if len(partition.entries) > self.max_partition_entries:
+                partition.keep(list(range(1, len(partition.entries))))
+                self.size -= 1
+                self.counters["evictions"] += 1
+            while self.size > self.max_entries:
+                _, oldest = self.partitions.popitem(last=False)
+                self.size -= len(oldest.entries)
+                self.counters["evictions"] += len(oldest.entries)
+
+    def _audit(self, lookup: CacheLookup, vectors: List[List[float]]) -> bool:
+        # True when the cached reply turned out wrong; it is then dropped
+        cached, fresh = (self._normalize(vector) for vector in vectors)
+        reply_similarity = float(cached @ fresh)
+        false_hit = reply_similarity < self.audit_threshold
+        with self.lock:
+            self.audits.append({
+                "question": lookup.question,
+                "cached_question": lookup.audited.question,
+                "similarity": lookup.similarity,
+                "reply_similarity": reply_similarity,
+                "false_hit": false_hit,
+            })
+            if not false_hit:
+                return False
+            self.counters["false_hits"] += 1
+            # Stop serving it; the fresh reply replaces it below
+            partition = self.partitions.get(lookup.partition)
+            if partition is not None and lookup.audited in partition.entries:
+                position = partition.entries.index(lookup.audited)
+                partition.keep([i for i in range(len(partition.entries)) if i != position])
+                self.size -= 1
+        logger.warning(f"Response cache false hit ({lookup.similarity:.3f}): "
+                       f"{lookup.question!r} was matched with {lookup.audited.question!r}")
+        return True
+
+    def record(self, lookup: CacheLookup, reply: str, seconds: float):
+        """
+        Store a generated reply, or check it against the cached one for an audited hit
+
+        :param lookup: The miss or audited hit `lookup` returned
+        :param reply: Reply generated by the model
+        :param seconds: Time the model took, counted as saved on later hits
+        """
+        if lookup.audited is None:
+            self._store(lookup, reply, seconds)
+            return
+        try:
+            vectors = self.embeddings.embed_documents([lookup.audited.reply, reply])
+        except Exception as e:
+            self._failed("audit", e)
+            return
+        if self._audit(lookup, vectors):
+            self._store(lookup, reply, seconds)
+
+    async def arecord(self, lookup: CacheLookup, reply: str, seconds: float):
+        """Async `record`"""
+        if lookup.audited is None:
+            self._store(lookup, reply, seconds)
+            return
+        try:
+            vectors = await self.embeddings.aembed_documents([lookup.audited.reply, reply])
+        except Exception as e:
+            self._failed("audit", e)
+            return
+        if self._audit(lookup, vectors):
+            self._store(lookup, reply, seconds)
+
+    def audit_log(self) -> List[Dict[str, Any]]:
+        """Recent audited hits, newest last"""
+        with self.lock:
+            return list(self.audits)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus hit rate (of eligible lookups), estimated false-hit rate and model time saved"""
+        with self.lock:
+            counters = dict(self.counters)
+            answered = counters["hits"] + counters["audited"]
+            return {
+                **counters,
+                "entries": self.size,
+                "partitions": len(self.partitions),
+                "hit_rate": answered / counters["lookups"] if counters["lookups"] else 0.0,
+                "false_hit_rate": counters["false_hits"] / counters["audited"] if counters["audited"] else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+            }
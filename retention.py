@@ -0,0 +1,396 @@
+"""
+Retention of conversation threads and stored memories
+
+Threads idle for longer than a TTL are deleted from the checkpointer, each
+user keeps at most a quota of memories (archived originals go first, then
+the oldest memories), and when checkpoints and memories together exceed a
+byte budget the least recently active threads and memories are evicted
+until they fit. Every limit is off by default and only applies once set.
+Works with `MemorySaver` or `SQLiteDeltaSaver` and with `InMemoryStore` or
+`PersistentVectorStore`; run it in the background with
+`RetentionSweeper.start` or once with `python retention.py`.
+
+A sweep only reads what its limits need: idle threads and per-user counts
+come from SQL aggregates of the SQLite backends, only users over the quota
+have their memories listed, and the full usage is only gathered for a byte
+budget. Values and checkpoints are never decoded for it.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from langgraph.store.base import BaseStore, PutOp
+
+from memory_consolidation import ARCHIVE_NAMESPACE, MEMORY_NAMESPACE, list_memories
+
+logger = logging.getLogger(__name__)
+
+# 0 disables each limit
+DEFAULT_THREAD_TTL_DAYS = 0
+DEFAULT_MEMORY_QUOTA = 0
+DEFAULT_BYTE_BUDGET = 0
+DEFAULT_SWEEP_INTERVAL = 600
+# Threads and memories touched this recently are never evicted for the byte budget
+DEFAULT_PROTECT_RECENT = 3600
+DELETE_BATCH_SIZE = 500
+
+
+class ThreadUsage(NamedTuple):
+    thread_id: str
+    last_active: datetime
+    bytes: int
+
+
+class MemoryUsage(NamedTuple):
+    namespace: Tuple[str, ...]
+    key: str
+    last_active: datetime
+    bytes: int
+
+
+def _as_utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _in_memory_thread_usage(saver) -> List[Tuple[str, str, int]]:
+    # MemorySaver keeps serialized (type, bytes) pairs; copy the dicts first since graphs write concurrently
+    sizes: Dict[str, int] = {}
+    for (thread_id, *_), (_, data) in list(saver.blobs.items()):
+        sizes[thread_id] = sizes.get(thread_id, 0) + len(data)
+    for (thread_id, *_), writes in list(saver.writes.items()):
+        sizes[thread_id] = sizes.get(thread_id, 0) + sum(len(write[2][1]) for write in list(writes.values()))
+    usage = []
+    for thread_id, namespaces in list(saver.storage.items()):
+        latest = None
+        for checkpoints in list(namespaces.values()):
+            for checkpoint_id, (checkpoint, metadata, _) in list(checkpoints.items()):
+                sizes[thread_id] = sizes.get(thread_id, 0) + len(checkpoint[1]) + len(metadata[1])
+                if latest is None or checkpoint_id > latest[0]:
+                    latest = (checkpoint_id, checkpoint)
+        if latest is not None:
+            usage.append((thread_id, saver.serde.loads_typed(latest[1])["ts"], sizes.get(thread_id, 0)))
+    return usage
+
+
+def thread_usage(checkpointer) -> List[ThreadUsage]:
+    """Last activity and stored bytes of every thread in `checkpointer`"""
+    if hasattr(checkpointer, "thread_usage"):
+        rows = checkpointer.thread_usage()
+    elif hasattr(checkpointer, "storage") and hasattr(checkpointer, "blobs"):
+        rows = _in_memory_thread_usage(checkpointer)
+    else:
+        raise TypeError(f"Retention does not support {type(checkpointer).__name__}")
+    return [ThreadUsage(thread_id, _as_utc(datetime.fromisoformat(ts)), size) for thread_id, ts, size in rows]
+
+
+def idle_threads(checkpointer, cutoff: datetime) -> List[ThreadUsage]:
+    """Threads of `checkpointer` whose latest checkpoint is older than `cutoff`"""
+    if hasattr(checkpointer, "idle_threads"):
+        rows = checkpointer.idle_threads(cutoff.astimezone(timezone.utc).isoformat(timespec="microseconds"))
+        return [ThreadUsage(thread_id, _as_utc(datetime.fromisoformat(ts)), size) for thread_id, ts, size in rows]
+    return [thread for thread in thread_usage(checkpointer) if thread.last_active < cutoff]
+
+
+def delete_threads(checkpointer, thread_ids: Iterable[str]):
+    thread_ids = set(thread_ids)
+    if not thread_ids:
+        return
+    if hasattr(checkpointer, "thread_usage") or not hasattr(checkpointer, "storage"):
+        for thread_id in thread_ids:
+            checkpointer.delete_thread(thread_id)
+        return
+    # MemorySaver.delete_thread scans every write and blob per thread; do all threads in one pass
+    for thread_id in thread_ids:
+        checkpointer.storage.pop(thread_id, None)
+    for table in (checkpointer.writes, checkpointer.blobs):
+        for key in [key for key in list(table.keys()) if key[0] in thread_ids]:
+            table.pop(key, None)
+
+
+def _user_namespaces(store: BaseStore, root: str) -> List[Tuple[str, ...]]:
+    return [namespace for namespace in store.list_namespaces(prefix=(root,), limit=1_000_000) if len(namespace) == 2]
+
+
+def memories_per_user(store: BaseStore) -> Dict[str, int]:
+    """Memories plus archived originals per user"""
+    counts: Dict[str, int] = {}
+    for root in (MEMORY_NAMESPACE, ARCHIVE_NAMESPACE):
+        if hasattr(store, "namespace_usage"):
+            sizes = {namespace: count for namespace, (count, _) in store.namespace_usage((root,)).items()
+                     if len(namespace) == 2}
+        else:
+            sizes = {namespace: len(list_memories(store, namespace)) for namespace in _user_namespaces(store, root)}
+        for namespace, count in sizes.items():
+            counts[namespace[1]] = counts.get(namespace[1], 0) + count
+    return counts
+
+
+def memory_usage(store: BaseStore, user_ids: Optional[Iterable[str]] = None) -> Dict[str, List[MemoryUsage]]:
+    """
+    Memories and archived originals per user, oldest first
+
+    Sizes count the JSON value plus, for indexed memories, one float32 vector.
+
+    :param store: Memory store
+    :param user_ids: Users to list; every user with memories when omitted
+    """
+    dims = getattr(store, "dims", None) or (getattr(store, "index_config", None) or {}).get("dims") or 0
+    users: Dict[str, List[MemoryUsage]] = {}
+    for root in (MEMORY_NAMESPACE, ARCHIVE_NAMESPACE):
+        namespaces = (_user_namespaces(store, root) if user_ids is None
+                      else [(root, user_id) for user_id in user_ids])
+        for namespace in namespaces:
+            if hasattr(store, "item_usage"):
+                rows = store.item_usage(namespace)
+            else:
+                vector_bytes = 4 * dims if root == MEMORY_NAMESPACE else 0
+                rows = [(item.key, item.updated_at,
+                         len(json.dumps(item.value, ensure_ascii=False).encode("utf-8")) + vector_bytes)
+                        for item in list_memories(store, namespace)]
+            if rows:
+                users.setdefault(namespace[1], []).extend(
+                    MemoryUsage(namespace, key, _as_utc(updated_at), size) for key, updated_at, size in rows)
+    for memories in users.values():
+        memories.sort(key=lambda memory: memory.last_active)
+    return users
+
+
+def _quota_victims(memories: List[MemoryUsage], quota: int) -> List[MemoryUsage]:
+    # Archived originals are not retrieved any more, so they go before live memories
+    excess = len(memories) - quota
+    if excess <= 0:
+        return []
+    ordered = sorted(memories, key=lambda memory: (memory.namespace[0] != ARCHIVE_NAMESPACE, memory.last_active))
+    return ordered[:excess]
+
+
+class RetentionSweeper:
+    def __init__(
+        self,
+        checkpointer=None,
+        store: Optional[BaseStore] = None,
+        thread_ttl_days: float = DEFAULT_THREAD_TTL_DAYS,
+        memory_quota: int = DEFAULT_MEMORY_QUOTA,
+        byte_budget: int = DEFAULT_BYTE_BUDGET,
+        interval: float = DEFAULT_SWEEP_INTERVAL,
+        protect_recent: float = DEFAULT_PROTECT_RECENT,
+        on_memories_deleted: Optional[Callable[[Tuple[str, ...]], None]] = None,
+        vacuum: bool = True,
+    ):
+        """
+        Expires threads and trims memories in the background
+
+        Either backend may be attached later with `attach`; a sweep skips the
+        ones that are missing. After deleting, backends that support it are
+        vacuumed so that the freed space goes back to the filesystem.
+
+        :param checkpointer: MemorySaver or SQLiteDeltaSaver
+        :param store: InMemoryStore or PersistentVectorStore holding the memories
+        :param thread_ttl_days: Idle days after which a thread is deleted; 0 keeps threads forever
+        :param memory_quota: Memories plus archived originals kept per user; 0 for no quota
+        :param byte_budget: Total bytes of checkpoints and memories; 0 for no budget
+        :param interval: Seconds between background sweeps
+        :param protect_recent: Seconds of inactivity before something may be evicted for the budget
+        :param on_memories_deleted: Called with every namespace that lost memories, e.g. to drop a search index
+        :param vacuum: Compact the backends' files after deleting
+        """
+        self.checkpointer = checkpointer
+        self.store = store
+        self.thread_ttl_days = thread_ttl_days
+        self.memory_quota = memory_quota
+        self.byte_budget = byte_budget
+        self.interval = interval
+        self.protect_recent = protect_recent
+        self.on_memories_deleted = on_memories_deleted
+        self.vacuum = vacuum
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.worker: Optional[threading.Thread] = None
+        self.counters = {
+            "sweeps": 0,
+            "threads_deleted": 0,
+            "memories_deleted": 0,
+            "reclaimed_bytes": 0,
+            "disk_bytes_freed": 0,
+            "errors": 0,
+        }
+        self.last_report: Dict[str, Any] = {}
+
+    def attach(self, checkpointer=None, store: Optional[BaseStore] = None,
+               on_memories_deleted: Optional[Callable[[Tuple[str, ...]], None]] = None):
+        """Set the backends to sweep; arguments left as None keep their current value"""
+        with self.lock:
+            self.checkpointer = checkpointer if checkpointer is not None else self.checkpointer
+            self.store = store if store is not None else self.store
+            self.on_memories_deleted = on_memories_deleted or self.on_memories_deleted
+
+    @property
+    def limited(self) -> bool:
+        """Whether any limit is set; without one a sweep deletes nothing"""
+        return bool(self.thread_ttl_days or self.memory_quota or self.byte_budget)
+
+    def start(self):
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name="retention-sweeper", daemon=True)
+                self.worker.start()
+
+    def close(self, timeout: Optional[float] = None):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+                with self.lock:
+                    self.counters["errors"] += 1
+
+    def _delete_memories(self, store: BaseStore, victims: List[MemoryUsage]):
+        for start in range(0, len(victims), DELETE_BATCH_SIZE):
+            store.batch([PutOp(memory.namespace, memory.key, None)
+                         for memory in victims[start:start + DELETE_BATCH_SIZE]])
+        if self.on_memories_deleted is not None:
+            for namespace in {memory.namespace for memory in victims}:
+                self.on_memories_deleted(namespace)
+
+    def sweep(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Run one retention pass
+
+        :param now: Reference time for ages; the current time when omitted
+        :return: What was deleted; the bytes before and after only when a byte budget is set
+        """
+        started = time.perf_counter()
+        now = now or datetime.now(timezone.utc)
+        checkpointer, store = self.checkpointer, self.store
+
+        # 1. Threads idle for longer than the TTL
+        expired = []
+        if self.thread_ttl_days and checkpointer is not None:
+            expired = idle_threads(checkpointer, now - timedelta(days=self.thread_ttl_days))
+
+        # 2. Memories beyond each user's quota; stores counting in SQL only list the users over it
+        trimmed = []
+        if self.memory_quota and store is not None:
+            users = (memory_usage(store, [user_id for user_id, count in memories_per_user(store).items()
+                                          if count > self.memory_quota])
+                     if hasattr(store, "namespace_usage") else memory_usage(store))
+            for memories in users.values():
+                trimmed.extend(_quota_victims(memories, self.memory_quota))
+
+        # 3. Least recently active threads and memories while over the byte budget
+        evicted_threads, evicted_memories = [], []
+        report: Dict[str, Any] = {"threads": None, "memories": None, "bytes_before": None}
+        remaining = None
+        if self.byte_budget:
+            threads = thread_usage(checkpointer) if checkpointer is not None else []
+            memories = [memory for memories in (memory_usage(store) if store is not None else {}).values()
+                        for memory in memories]
+            report = {
+                "threads": len(threads),
+                "memories": len(memories),
+                "bytes_before": sum(thread.bytes for thread in threads) + sum(memory.bytes for memory in memories),
+            }
+            gone_threads = {thread.thread_id for thread in expired}
+            gone_memories = {(memory.namespace, memory.key) for memory in trimmed}
+            threads = [thread for thread in threads if thread.thread_id not in gone_threads]
+            memories = [memory for memory in memories if (memory.namespace, memory.key) not in gone_memories]
+            remaining = sum(thread.bytes for thread in threads) + sum(memory.bytes for memory in memories)
+        if remaining is not None and remaining > self.byte_budget:
+            protected = now - timedelta(seconds=self.protect_recent)
+            candidates = sorted(
+                [thread for thread in threads if thread.last_active < protected]
+                + [memory for memory in memories if memory.last_active < protected],
+                # Archived originals first, then everything else by age
+                key=lambda entry: (not (isinstance(entry, MemoryUsage) and entry.namespace[0] == ARCHIVE_NAMESPACE),
+                                   entry.last_active),
+            )
+            for entry in candidates:
+                if remaining <= self.byte_budget:
+                    break
+                (evicted_memories if isinstance(entry, MemoryUsage) else evicted_threads).append(entry)
+                remaining -= entry.bytes
+            if remaining > self.byte_budget:
+                logger.warning(f"Retention budget of {self.byte_budget} bytes exceeded by recently active data "
+                               f"({remaining} bytes)")
+
+        deleted_threads = expired + evicted_threads
+        deleted_memories = trimmed + evicted_memories
+        if deleted_threads:
+            delete_threads(checkpointer, [thread.thread_id for thread in deleted_threads])
+        if deleted_memories:
+            self._delete_memories(store, deleted_memories)
+
+        # 4. Give the space back
+        disk_freed = 0
+        if self.vacuum and (deleted_threads or deleted_memories):
+            for backend in (checkpointer, store):
+                if backend is not None and hasattr(backend, "vacuum"):
+                    disk_freed += backend.vacuum()
+
+        reclaimed = sum(thread.bytes for thread in deleted_threads) + sum(memory.bytes for memory in deleted_memories)
+        report.update({
+            "expired_threads": len(expired),
+            "evicted_threads": len(evicted_threads),
+            "trimmed_memories": len(trimmed),
+            "evicted_memories": len(evicted_memories),
+            "reclaimed_bytes": reclaimed,
+            "disk_bytes_freed": disk_freed,
+            "bytes_after": remaining,
+            "seconds": time.perf_counter() - started,
+        })
+        with self.lock:
+            self.counters["sweeps"] += 1
+            self.counters["threads_deleted"] += len(deleted_threads)
+            self.counters["memories_deleted"] += len(deleted_memories)
+            self.counters["reclaimed_bytes"] += reclaimed
+            self.counters["disk_bytes_freed"] += disk_freed
+            self.last_report = report
+        if deleted_threads or deleted_memories:
+            logger.info(f"Retention deleted {len(deleted_threads)} threads and {len(deleted_memories)} memories, "
+                        f"reclaiming {reclaimed} bytes")
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals since start plus the figures of the last sweep"""
+        with self.lock:
+            return {**self.counters, "last_sweep": dict(self.last_report)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="Only report usage")
+    parser.add_argument("--thread-ttl-days", type=float, default=DEFAULT_THREAD_TTL_DAYS)
+    parser.add_argument("--memory-quota", type=int, default=DEFAULT_MEMORY_QUOTA)
+    parser.add_argument("--byte-budget", type=int, default=DEFAULT_BYTE_BUDGET)
+    args = parser.parse_args()
+
+    from ai_birthchart_memo_langBOT import build_checkpointer, build_memory_manager
+
+    manager = build_memory_manager()
+    if manager.write_queue is not None:
+        manager.write_queue.flush()
+    checkpointer = build_checkpointer()
+    if args.dry_run:
+        threads = thread_usage(checkpointer)
+        users = memory_usage(manager.store)
+        print(f"threads: {len(threads)} ({sum(thread.bytes for thread in threads)} bytes)")
+        print(f"memories: {sum(len(m) for m in users.values())} of {len(users)} users "
+              f"({sum(memory.bytes for m in users.values() for memory in m)} bytes)")
+        return
+    sweeper = RetentionSweeper(checkpointer, manager.store, args.thread_ttl_days, args.memory_quota, args.byte_budget,
+                               on_memories_deleted=manager.lexical.drop if manager.lexical is not None else None)
+    print(json.dumps(sweeper.sweep(), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
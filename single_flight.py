@@ -0,0 +1,406 @@
+"""
+Single-flight coalescing of identical in-flight LLM calls
+
+When many clients send byte-identical prompts at once (a push campaign asking
+every translator for the same daily forecast), only the first call goes
+upstream; the others attach to it and receive the same chunks as they arrive.
+Calls are keyed by model name plus a hash of every message and call argument,
+so they are only shared when the model would see exactly the same request.
+Nothing is kept once a call finishes: this is not a cache.
+
+Threads and event loops share one registry, so a sync caller can follow a call
+started by an async one and vice versa. Every model built by
+`providers.chat_model` is wrapped in `SingleFlightChatModel`; set
+LLM_SINGLE_FLIGHT=0 to call the model directly.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Set to "0" to send every call upstream
+ENABLED = os.environ.get("LLM_SINGLE_FLIGHT", "1") != "0"
+# The upstream call is detached from the first caller's callbacks; every caller's own run reports the chunks
+UPSTREAM_CONFIG = {"callbacks": []}
+# Seconds a follower waits for the next chunk before it gives up on the call, and how often
+# it checks meanwhile whether the event loop running the call has been closed
+FOLLOW_TIMEOUT = float(os.environ.get("LLM_SINGLE_FLIGHT_FOLLOW_TIMEOUT", "300"))
+STALL_CHECK_INTERVAL = 1.0
+
+
+class StalledFlightError(RuntimeError):
+    pass
+
+
+class _Flight:
+    def __init__(self):
+        """One upstream call and the chunks it has produced so far"""
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # Callers attached after the first one and still reading
+        self.followers = 0
+        # The first caller stopped reading while others followed
+        self.leader_gone = False
+        self.cancelled = False
+        self.last_chunk = time.monotonic()
+        self.condition = threading.Condition()
+        # Async followers, woken through their own event loop
+        self.events: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        # Task of an async upstream call, referenced so it is not collected while running, and its loop
+        self.task: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, chunk: Any = None, done: bool = False, error: Optional[BaseException] = None):
+        with self.condition:
+            if self.done:
+                return
+            if not done:
+                self.chunks.append(chunk)
+                self.last_chunk = time.monotonic()
+            else:
+                self.done, self.error = True, error
+            self.condition.notify_all()
+            events = list(self.events)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, event in events:
+            if loop is current:
+                # Same loop: set directly rather than through the loop's self-pipe, once per follower
+                event.set()
+            else:
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # That loop was closed; nobody is waiting on it any more
+                    pass
+
+    def stalled(self) -> Optional[StalledFlightError]:
+        """Why waiting for this call is pointless, or None while it may still produce chunks"""
+        if self.loop is not None and self.loop.is_closed():
+            return StalledFlightError("The event loop running the shared call was closed")
+        if time.monotonic() - self.last_chunk > FOLLOW_TIMEOUT:
+            return StalledFlightError(f"The shared call produced nothing for {FOLLOW_TIMEOUT:.0f}s")
+        return None
+
+    def cancel(self):
+        """Stop the upstream call once nobody reads it any more"""
+        self.cancelled = True
+        if self.task is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                # The loop is closed, and the task with it
+                pass
+
+    def follow(self) -> Iterator[Any]:
+        """Every chunk, blocking until the next one arrives; re-raises the upstream error"""
+        index = 0
+        while True:
+            with self.condition:
+                while index == len(self.chunks) and not self.done:
+                    if not self.condition.wait(STALL_CHECK_INTERVAL):
+                        error = self.stalled()
+                        if error is not None:
+                            raise error
+                chunks, finished = self.chunks[index:], self.done
+            index += len(chunks)
+            yield from chunks
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def afollow(self) -> AsyncIterator[Any]:
+        """Async `follow`"""
+        event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        waiter = (loop, event)
+        with self.condition:
+            self.events.append(waiter)
+        # Wakes us now and then to check that the call is still alive; re-armed only once it fired
+        timer = None
+        try:
+            index = 0
+            while True:
+                with self.condition:
+                    chunks, finished = self.chunks[index:], self.done
+                    if not chunks and not finished:
+                        # Cleared under the lock, so a chunk published after the check still wakes us
+                        event.clear()
+                if not chunks and not finished:
+                    error = self.stalled()
+                    if error is not None:
+                        raise error
+                    if timer is None or timer.when() <= loop.time():
+                        timer = loop.call_later(STALL_CHECK_INTERVAL, event.set)
+                    await event.wait()
+                    continue
+                index += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self.condition:
+                self.events.remove(waiter)
+
+
+class SingleFlight:
+    def __init__(self):
+        """Registry of in-flight calls by key, shared by all threads and event loops of a process"""
+        self.flights: Dict[str, _Flight] = {}
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "upstream": 0, "coalesced": 0}
+
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        with self.lock:
+            self.counters["calls"] += 1
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.counters["coalesced"] += 1
+                return flight, False
+            flight = self.flights[key] = _Flight()
+            self.counters["upstream"] += 1
+            return flight, True
+
+    def _finish(self, key: str, flight: _Flight, error: Optional[BaseException] = None):
+        # Callers arriving from now on start a new call
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.publish(done=True, error=error)
+
+    def _abandon(self, key: str, flight: _Flight) -> bool:
+        # The first caller stopped reading; the call can only be dropped if nobody else follows it
+        with self.lock:
+            if flight.followers:
+                flight.leader_gone = True
+                return False
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            return True
+
+    def _leave(self, key: str, flight: _Flight):
+        # A follower stopped reading; once the first caller has too, nobody needs the call any more
+        with self.lock:
+            flight.followers -= 1
+            orphaned = not flight.followers and flight.leader_gone and not flight.done
+            if orphaned and self.flights.get(key) is flight:
+                del self.flights[key]
+        if orphaned:
+            flight.publish(done=True, error=RuntimeError("Call abandoned by its callers"))
+            flight.cancel()
+
+    def _follow(self, key: str, flight: _Flight) -> Iterator[Any]:
+        try:
+            yield from flight.follow()
+        except StalledFlightError as e:
+            # Fail the other followers too, and let new callers start a fresh call
+            self._finish(key, flight, e)
+            raise
+        finally:
+            self._leave(key, flight)
+
+    def stream(self, key: str, start: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        Chunks of `start()`, shared with every concurrent caller using the same key
+
+        The first caller runs `start` in its own thread; later ones replay the
+        chunks produced so far and then wait for the rest. If the first caller
+        stops reading while others follow, a background thread reads the rest
+        for them. Callers must not mutate the chunks.
+
+        :param key: Identity of the call (see `message_key`)
+        :param start: Starts the upstream call
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            yield from self._follow(key, flight)
+            return
+
+        upstream = iter(())
+        try:
+            upstream = start()
+            for chunk in upstream:
+                flight.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            if self._abandon(key, flight):
+                flight.publish(done=True, error=RuntimeError("Call abandoned by its caller"))
+                getattr(upstream, "close", lambda: None)()
+            else:
+                # Finish the call for the callers sharing it, without holding up the caller that left
+                threading.Thread(target=self._drain, args=(key, flight, upstream),
+                                 name="single-flight-drain", daemon=True).start()
+            raise
+        except BaseException as e:
+            self._finish(key, flight, e)
+            raise
+        self._finish(key, flight)
+
+    def _drain(self, key: str, flight: _Flight, upstream: Iterator[Any]):
+        try:
+            for chunk in upstream:
+                if flight.cancelled:
+                    getattr(upstream, "close", lambda: None)()
+                    return
+                flight.publish(chunk)
+        except Exception as e:
+            self._finish(key, flight, e)
+            return
+        self._finish(key, flight)
+
+    async def astream(self, key: str, start: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Async `stream`
+
+        The upstream call runs in a task of its own, so cancelling the first
+        caller does not cancel it for the others; it is cancelled once every
+        caller has left. Followers on other event loops or threads fail with
+        StalledFlightError if the first caller's loop is closed under the call.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            async def pump():
+                try:
+                    async for chunk in start():
+                        flight.publish(chunk)
+                except asyncio.CancelledError:
+                    # Followers see an error of their own, not a cancellation of their task
+                    self._finish(key, flight, RuntimeError("The shared call was cancelled"))
+                    raise
+                except BaseException as e:
+                    self._finish(key, flight, e)
+                else:
+                    self._finish(key, flight)
+
+            flight.loop = asyncio.get_running_loop()
+            flight.task = asyncio.ensure_future(pump())
+
+        finished = False
+        try:
+            async for chunk in flight.afollow():
+                yield chunk
+            finished = True
+        except StalledFlightError as e:
+            self._finish(key, flight, e)
+            raise
+        finally:
+            if not leader:
+                self._leave(key, flight)
+            elif not finished and not flight.done and self._abandon(key, flight):
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.counters, "in_flight": len(self.flights)}
+
+
+def message_key(model_name: str, messages: List[BaseMessage], **kwargs: Any) -> str:
+    """
+    Hash of everything the model sees: its name, each message's role, name,
+    content and tool calls, and the call arguments; message IDs are ignored
+    """
+    request = {
+        "model": model_name,
+        "messages": [(message.type, message.name, message.content, getattr(message, "tool_calls", None),
+                      getattr(message, "tool_call_id", None)) for message in messages],
+        "kwargs": kwargs,
+    }
+    encoded = json.dumps(request, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide registry shared by every wrapped model"""
+    return _single_flight
+
+
+class SingleFlightChatModel(BaseChatModel):
+    """
+    Chat model front that coalesces identical concurrent calls to `model`
+
+    Upstream calls are always streamed, so invoke and stream callers of the
+    same request share one call; every caller gets its own copies of the
+    chunks, and its own callbacks see them as they arrive.
+    """
+    model: BaseChatModel
+    model_name: str
+    flights: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"single-flight-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, **self.model._identifying_params}
+
+    def _registry(self) -> SingleFlight:
+        return self.flights or get_single_flight()
+
+    @staticmethod
+    def _own(chunk: BaseMessage) -> ChatGenerationChunk:
+        # A copy without the upstream run's ID, so each caller's run assigns its own
+        if isinstance(chunk, BaseMessageChunk):
+            return ChatGenerationChunk(message=chunk.model_copy(update={"id": None}))
+        # Models without native streaming yield their whole reply as one message
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content=chunk.content, additional_kwargs=chunk.additional_kwargs, response_metadata=chunk.response_metadata,
+            usage_metadata=getattr(chunk, "usage_metadata", None),
+        ))
+
+    def _result(self, chunks: List[Any]) -> ChatResult:
+        # Models without native streaming yield their whole reply once: it is copied rather than merged from chunks
+        if len(chunks) == 1 and not isinstance(chunks[0], BaseMessageChunk):
+            return ChatResult(generations=[ChatGeneration(message=chunks[0].model_copy(update={"id": None}))])
+        return generate_from_stream(self._own(chunk) for chunk in chunks)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = message_key(self.model_name, messages, stop=stop, **kwargs)
+        start = lambda: self.model.stream(messages, UPSTREAM_CONFIG, stop=stop, **kwargs)
+        for chunk in self._registry().stream(key, start):
+            yield self._own(chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = message_key(self.model_name, messages, stop=stop, **kwargs)
+        start = lambda: self.model.astream(messages, UPSTREAM_CONFIG, stop=stop, **kwargs)
+        async for chunk in self._registry().astream(key, start):
+            yield self._own(chunk)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        key = message_key(self.model_name, messages, stop=stop, **kwargs)
+        start = lambda: self.model.stream(messages, UPSTREAM_CONFIG, stop=stop, **kwargs)
+        return self._result(list(self._registry().stream(key, start)))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        key = message_key(self.model_name, messages, stop=stop, **kwargs)
+        start = lambda: self.model.astream(messages, UPSTREAM_CONFIG, stop=stop, **kwargs)
+        return self._result([chunk async for chunk in self._registry().astream(key, start)])
+
+
+def coalesced(model: BaseChatModel, model_name: str) -> BaseChatModel:
+    """`model` behind the shared single-flight registry, or unchanged when LLM_SINGLE_FLIGHT=0"""
+    return SingleFlightChatModel(model=model, model_name=model_name) if ENABLED else model
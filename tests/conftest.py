@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+from typing import Annotated, Any, Callable, Dict, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from typing_extensions import TypedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Graphs run against fake models; the key only satisfies validation and every store stays in memory
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("CHART_REGISTRY_PATH", "")
+os.environ.setdefault("TRANSLATION_MEMORY_PATH", "")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+import providers  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_providers():
+    # Every test builds its own models, caches and graphs
+    providers.reset()
+    yield
+    providers.reset()
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+# Shared fakes; tests import them from here rather than from the benchmarks script
+
+SAMPLE_PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "suerdata.json")
+SAMPLE_REPLY = (
+    "Your Moon in Bharni speaks of a heart that carries great creative force, "
+    "and this lunar day invites you to rest before you begin something new. "
+    "What would feel nourishing to you this week?"
+)
+
+
+def load_sample_payload(path: str = SAMPLE_PAYLOAD_PATH) -> Dict[str, Any]:
+    # suerdata.json holds an example payload followed by its schema; use the example
+    with open(path, encoding="utf-8") as f:
+        payload, _ = json.JSONDecoder().raw_decode(f.read())
+    return payload
+
+
+def synthetic_payload(days: int, start: str = "2025-01-01") -> Dict[str, Any]:
+    """The sample chart with a calendar of `days` consecutive days"""
+    payload = load_sample_payload()
+    first = date.fromisoformat(start)
+    payload["data"]["dates"] = [
+        {"lunarDay": day % 30 + 1, "date": (first + timedelta(days=day)).isoformat(),
+         "nakshatra": str(day % 27 + 1), "holidays": "Ekadashi" if day % 15 == 10 else None}
+        for day in range(days)
+    ]
+    return payload
+
+
+class StreamingFakeChatModel(GenericFakeChatModel):
+    delay: float = 0.0
+
+    def _stream(self, *args, **kwargs):
+        for chunk in super()._stream(*args, **kwargs):
+            time.sleep(self.delay)
+            yield chunk
+
+
+def fake_chat_model(reply: str = SAMPLE_REPLY, token_delay: float = 0.0) -> StreamingFakeChatModel:
+    """Chat model that streams `reply` word by word, sleeping `token_delay` per chunk"""
+    def replies():
+        while True:
+            yield AIMessage(content=reply)
+
+    return StreamingFakeChatModel(messages=replies(), delay=token_delay)
+
+
+class SleepyChatModel(BaseChatModel):
+    """Chat model whose calls take `delay` seconds and are counted; `reply_for` builds replies from the prompt"""
+    delay: float = 0.0
+    reply: str = SAMPLE_REPLY
+    reply_for: Any = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "sleepy-fake"
+
+    def _result(self, messages) -> ChatResult:
+        self.calls += 1
+        reply = self.reply_for(messages) if self.reply_for is not None else self.reply
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.delay)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self._result(messages)
+
+
+def sleepy_chat_model(delay: float, reply: str = SAMPLE_REPLY,
+                      reply_for: Optional[Callable[[list], str]] = None) -> SleepyChatModel:
+    return SleepyChatModel(delay=delay, reply=reply, reply_for=reply_for)
+
+
+class ReplyState(TypedDict):
+    messages: Annotated[List, add_messages]
+
+
+def reply_graph(checkpointer):
+    """One-node message graph that answers every turn with SAMPLE_REPLY"""
+    builder = StateGraph(ReplyState)
+    builder.add_node("priestess", lambda state: {"messages": [AIMessage(content=SAMPLE_REPLY)]})
+    builder.add_edge(START, "priestess")
+    builder.add_edge("priestess", END)
+    return builder.compile(checkpointer=checkpointer)
@@ -0,0 +1,81 @@
+from datetime import date
+
+import pytest
+
+from astro_calendar import DateRange, mentioned_lunar_days, mentioned_ranges
+from astro_encoding import encode_chart
+from conftest import synthetic_payload
+
+TODAY = date(2025, 1, 10)
+HORIZON = DateRange(date(2025, 1, 1), date(2025, 2, 9))
+
+
+def days(first, last=None):
+    return DateRange(date(2025, *first), date(2025, *(last or first)))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I sleep 7.5 hours a night", []),
+    ("3/4 of the month is gone", []),
+    ("I lost 2.5 kg", []),
+    ("What does 15.01 hold for me?", [days((1, 15))]),
+    ("Is it good to travel on 5.2?", [days((2, 5))]),
+    ("And 5/2/2025?", [days((2, 5))]),
+    ("2025-01-12 to 2025-01-14", [days((1, 12), (1, 14))]),
+    ("from 12.01 to 14.01", [days((1, 12), (1, 14))]),
+    ("between Jan 12 and Jan 14", [days((1, 12), (1, 14))]),
+    ("between 12 and 14 January", [days((1, 12), (1, 14))]),
+    ("Jan 12 and Jan 14", [days((1, 12)), days((1, 14))]),
+    ("What happens on the 20th?", [days((1, 20))]),
+    ("Should I sign it by the 5th?", [days((2, 5))]),
+    ("Что будет 20 числа?", [days((1, 20))]),
+    ("What does lunar day 15 mean?", []),
+    ("May I ask about my Moon?", []),
+    ("How is February for love?", [days((2, 1), (2, 28))]),
+    ("tomorrow", [days((1, 11))]),
+])
+def test_mentioned_ranges(text, expected):
+    assert mentioned_ranges(text, TODAY, HORIZON) == (expected, False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("What does lunar day 15 mean?", [15]),
+    ("the 3rd lunar day and moon day 4", [3, 4]),
+    ("Что значит 15-й лунный день?", [15]),
+    ("лунный день 29", [29]),
+    ("on the 20th", []),
+])
+def test_mentioned_lunar_days(text, expected):
+    assert mentioned_lunar_days(text) == expected
+
+
+@pytest.fixture
+def calendar():
+    # lunarDay is (row % 30) + 1, starting 2025-01-01
+    return encode_chart(synthetic_payload(40)).calendar
+
+
+WINDOW = tuple(range(6, 13))
+
+
+@pytest.mark.parametrize("text, positions", [
+    ("", WINDOW),
+    ("I sleep 7.5 hours, is that fine?", WINDOW),
+    ("What does lunar day 15 mean?", tuple(sorted(WINDOW + (14,)))),
+    ("between Jan 20 and Jan 21", WINDOW + (19, 20)),
+    ("on the 5th", WINDOW + (35,)),
+])
+def test_selection(calendar, text, positions):
+    selection = calendar.select(text, today=TODAY)
+    assert selection.positions == positions and not selection.full
+
+
+@pytest.mark.parametrize("text, window", [
+    ("Show me the whole calendar", 3),
+    ("How do this month and next month look?", 3),
+    ("Anything for tomorrow?", None),
+])
+def test_selection_falls_back_to_the_full_calendar(calendar, text, window):
+    selection = calendar.select(text, today=TODAY, window=window)
+    assert selection.full and selection.key == "all"
+    assert len(calendar.render("Calendar", selection)) == len(calendar) + 1
@@ -0,0 +1,111 @@
+import io
+import json
+import sys
+from datetime import date
+
+import pytest
+
+import astro_parser
+from astro_parser import ChartValidationError, load_chart, parse_chart, parse_chart_stream
+from conftest import SAMPLE_PAYLOAD_PATH, load_sample_payload, synthetic_payload
+
+
+def holiday_payload():
+    payload = synthetic_payload(40)
+    payload["data"]["dates"][3]["holidays"] = "Дивали"
+    payload["data"]["dates"][4]["holidays"] = ["Ekadashi", "Пурнима"]
+    return payload
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, astro_parser.DEFAULT_CHUNK_SIZE])
+def test_streaming_matches_the_one_shot_parse(chunk_size):
+    payload = holiday_payload()
+    expected = parse_chart(payload).to_dict()
+
+    text = json.dumps(payload, ensure_ascii=False, indent=1)
+    assert parse_chart_stream(text, chunk_size).to_dict() == expected
+    assert parse_chart_stream(io.BytesIO(text.encode("utf-8")), chunk_size).to_dict() == expected
+    assert parse_chart_stream(json.dumps(payload["data"]).encode("utf-8"), chunk_size).to_dict() == expected
+
+
+def test_content_after_the_payload_is_ignored():
+    with open(SAMPLE_PAYLOAD_PATH, "rb") as f:
+        streamed = parse_chart_stream(f, chunk_size=256)
+    with open(SAMPLE_PAYLOAD_PATH, "rb") as f:
+        loaded = load_chart(f.read())
+    assert streamed.to_dict() == loaded.to_dict() == parse_chart(load_sample_payload()).to_dict()
+
+
+def test_records_are_typed_and_compact():
+    chart = parse_chart(holiday_payload())
+
+    sun = chart.planets[0]
+    assert (sun.name, sun.house, sun.retrograde) == ("Sun", 6, False)
+    assert sun.sign_degree == 15 * 3600 + 11 * 60 + 15 and sun.degrees == pytest.approx(15.1875)
+    assert sun.sign is sys.intern("Capricorn")
+
+    dates = chart.dates
+    assert (dates.ordinals.typecode, dates.lunar_days.typecode, dates.nakshatras.typecode) == ("i", "b", "b")
+    assert dates.holidays == {3: "Дивали", 4: ["Ekadashi", "Пурнима"], 10: "Ekadashi", 25: "Ekadashi"}
+    assert dates[3] == (date(2025, 1, 4), 4, 4, "Дивали")
+    assert dates.find(date(2025, 1, 5)) == 4 and dates.find(date(2024, 12, 31)) is None
+    assert chart.keys == ("nathal", "additionals", "dates")
+
+
+def with_planet(**fields):
+    payload = load_sample_payload()
+    nathal = json.loads(payload["data"]["nathal"])
+    nathal["planets_position"][1].update(fields)
+    payload["data"]["nathal"] = nathal
+    return payload
+
+
+def with_date(**fields):
+    payload = synthetic_payload(2)
+    payload["data"]["dates"][1].update(fields)
+    return payload
+
+
+@pytest.mark.parametrize("payload, message", [
+    (with_planet(House="9"), r"planets_position\[1\]\.House has the wrong type"),
+    (with_planet(IsRetro=0), r"planets_position\[1\]\.IsRetro has the wrong type"),
+    (with_planet(sign_degree="19.5"), r"planets_position\[1\]\.sign_degree must look like"),
+    (with_planet(Name=None), r"planets_position\[1\]\.Name has the wrong type"),
+    (with_date(nakshatra=4), r"dates\[1\]\.nakshatra has the wrong type"),
+    (with_date(nakshatra="Bharni"), r"dates\[1\]\.nakshatra must be a number from 1 to 27"),
+    (with_date(lunarDay=31), r"dates\[1\]\.lunarDay out of range"),
+    (with_date(date="05.01.2025"), r"dates\[1\]\.date must be an ISO date"),
+    ({"data": {"nathal": "{not json"}}, "nathal is not valid JSON"),
+    ({"data": {"dates": {"2025-01-01": 1}}}, "dates must be a list"),
+    ({"data": {"additionals": {"soul": 1}}}, "additionals values must be strings"),
+    ({"data": []}, "astro_data.data must be an object"),
+])
+def test_schema_errors_name_the_field(payload, message):
+    with pytest.raises(ChartValidationError, match=message):
+        parse_chart(payload)
+    with pytest.raises(ChartValidationError, match=message):
+        parse_chart_stream(json.dumps(payload), chunk_size=16)
+
+
+@pytest.mark.parametrize("text, message", [
+    ('{"data": {"dates": [{"lunarDay": 1,', "ended unexpectedly|Invalid JSON"),
+    ('{"data": {"dates": [{"lunarDay": 1, "date": "2025-01-01", "nakshatra": "1"},]}}', "Trailing comma"),
+    ('["data"]', "astro_data must be an object"),
+])
+def test_malformed_json_is_a_validation_error(text, message):
+    with pytest.raises(ChartValidationError, match=message):
+        parse_chart_stream(text, chunk_size=8)
+    with pytest.raises(ChartValidationError):
+        load_chart(text)
+
+
+def test_only_files_and_large_payloads_are_streamed(monkeypatch):
+    streamed = []
+    monkeypatch.setattr(astro_parser, "parse_chart_stream", lambda source: streamed.append(source) or "streamed")
+    text = json.dumps(load_sample_payload())
+
+    assert load_chart(text).to_dict() == parse_chart(load_sample_payload()).to_dict()
+    assert load_chart(io.BytesIO(text.encode("utf-8"))) == "streamed"
+    monkeypatch.setattr(astro_parser, "STREAM_MIN_BYTES", len(text))
+    assert load_chart(text) == "streamed"
+    assert len(streamed) == 2
@@ -0,0 +1,122 @@
+import asyncio
+import copy
+import json
+import threading
+
+import pytest
+
+import chart_registry
+import providers
+from astro_parser import ChartValidationError
+from chart_registry import ChartRegistry, ChartTooLargeError
+from conftest import load_sample_payload, synthetic_payload
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registry(request, tmp_path):
+    return ChartRegistry(str(tmp_path / "charts.sqlite3") if request.param == "sqlite" else "")
+
+
+def test_registered_charts_are_served_by_id(registry, tmp_path):
+    payload = load_sample_payload()
+    chart_id = registry.register(payload)
+
+    registered = registry.get(chart_id)
+    assert registered.chart_id == chart_id
+    assert [planet.name for planet in registered.chart.planets][:2] == ["Sun", "Moon"]
+    assert registered.chart.to_dict()["data"]["nathal"] == json.loads(payload["data"]["nathal"])
+    if registry.path:
+        # Another process (or a restart) loads it from storage
+        assert ChartRegistry(registry.path).get(chart_id).chart.to_dict() == registered.chart.to_dict()
+
+
+def test_resent_payloads_are_a_lookup(registry, monkeypatch):
+    payload = load_sample_payload()
+    chart_id = registry.register(payload)
+
+    def parse_chart(astro_data):
+        raise AssertionError("a resent payload was parsed again")
+
+    monkeypatch.setattr(chart_registry, "parse_chart", parse_chart)
+    assert registry.register(copy.deepcopy(payload)) == chart_id
+    assert registry.stats()["registered"] == 1 and registry.stats()["duplicates"] == 1
+
+
+def test_the_same_chart_in_another_form_gets_the_same_id(registry):
+    payload = load_sample_payload()
+    decoded = copy.deepcopy(payload)
+    decoded["data"]["nathal"] = json.loads(decoded["data"]["nathal"])
+
+    assert registry.register(decoded["data"]) == registry.register(payload)
+    assert registry.stats()["registered"] == 1
+
+
+def test_unknown_ids_are_refused(registry):
+    with pytest.raises(KeyError, match="register it first"):
+        registry.get("0" * 40)
+
+
+def test_oversized_and_malformed_charts_are_refused(registry, monkeypatch):
+    monkeypatch.setattr(chart_registry, "MAX_CHART_BYTES", 1024)
+    with pytest.raises(ChartTooLargeError):
+        registry.register(synthetic_payload(30))
+    with pytest.raises(ChartValidationError, match="lunarDay"):
+        registry.register({"data": {"dates": [{"date": "2025-01-01", "lunarDay": 40, "nakshatra": "3"}]}})
+    assert registry.stats()["registered"] == 0
+
+
+def test_off_schema_charts_stay_inline():
+    import ai_birthchart
+
+    providers.override("ai_birthchart.chart_registry", ChartRegistry(""))
+    payload = synthetic_payload(3)
+    payload["data"]["dates"][0]["nakshatra"] = 4
+    state = {"messages": [], "astro_data": payload}
+
+    update = ai_birthchart.attach_chart(state)
+    assert list(update) == ["chart_key"]
+    state.update(update)
+    assert ai_birthchart.chart_context(state).chart is not None
+
+
+def test_refused_payloads_are_remembered(registry, monkeypatch):
+    payload = synthetic_payload(2)
+    payload["data"]["dates"][1]["nakshatra"] = 4
+    with pytest.raises(ChartValidationError, match="nakshatra"):
+        registry.register(payload)
+
+    monkeypatch.setattr(chart_registry, "parse_chart", None)
+    with pytest.raises(ChartValidationError, match="nakshatra"):
+        registry.register(copy.deepcopy(payload))
+
+
+def test_turns_with_a_chart_id_do_not_serialize_the_chart(monkeypatch):
+    import ai_birthchart
+
+    providers.override("ai_birthchart.chart_registry", ChartRegistry(""))
+    update = ai_birthchart.attach_chart({"astro_data": load_sample_payload()})
+
+    def serialize(astro_data):
+        raise AssertionError("the chart was serialized")
+
+    monkeypatch.setattr(ai_birthchart, "payload_digest", serialize)
+    state = {"messages": [], **update}
+    assert ai_birthchart.attach_chart(state) == {}
+    assert ai_birthchart.chart_context(state).key == update["chart_id"]
+
+
+def test_inline_charts_register_off_the_event_loop():
+    import ai_birthchart
+
+    threads = []
+
+    class RecordingRegistry(ChartRegistry):
+        def register(self, astro_data, digest=None):
+            threads.append(threading.current_thread())
+            return super().register(astro_data, digest)
+
+    providers.override("ai_birthchart.chart_registry", RecordingRegistry(""))
+    update = asyncio.run(ai_birthchart.aattach_chart({"astro_data": load_sample_payload()}))
+
+    assert update["astro_data"] == {} and update["chart_id"]
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+
+from conftest import reply_graph
+from checkpoint_store import SQLiteDeltaSaver
+
+
+def saver_with_threads(tmp_path, threads, turns=4):
+    saver = SQLiteDeltaSaver(str(tmp_path / "checkpoints.sqlite3"), keep_checkpoints=2, compact_every=0)
+    graph = reply_graph(saver)
+    for thread in threads:
+        for turn in range(turns):
+            graph.invoke({"messages": [HumanMessage(content=f"Turn {turn}")]}, {"configurable": {"thread_id": thread}})
+    return saver
+
+
+def test_compaction_waits_for_a_concurrent_writer(tmp_path):
+    saver = saver_with_threads(tmp_path, ["a"])
+    connected, go = threading.Event(), threading.Event()
+    outcome = []
+
+    def compact():
+        saver._connection()
+        connected.set()
+        go.wait(5)
+        outcome.append(saver.compact())
+
+    compaction = threading.Thread(target=compact)
+    compaction.start()
+    assert connected.wait(5)
+    writer = sqlite3.connect(saver.path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO writes VALUES ('other', '', '1', 'task', 0, 'messages', 'null', x'', '')")
+    go.set()
+    # Compaction has read the thread by now and needs the write lock
+    time.sleep(0.2)
+    writer.execute("COMMIT")
+    compaction.join(5)
+
+    assert outcome[0] > 0 and not saver.touched
+
+
+def test_unfinished_threads_are_compacted_next_time(tmp_path, monkeypatch):
+    saver = saver_with_threads(tmp_path, ["a", "b", "c"])
+    compact_thread = saver._compact_thread
+    calls = []
+
+    def failing(conn, thread_id, checkpoint_ns):
+        calls.append(thread_id)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        return compact_thread(conn, thread_id, checkpoint_ns)
+
+    monkeypatch.setattr(saver, "_compact_thread", failing)
+    assert saver.compact() == 0
+    assert saver.touched == {(thread, "") for thread in ("a", "b", "c")} - {(calls[0], "")}
+
+    monkeypatch.setattr(saver, "_compact_thread", compact_thread)
+    assert saver.compact() > 0 and not saver.touched
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Annotated, List
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from typing_extensions import TypedDict
+
+from conftest import fake_chat_model
+from conversation_window import ConversationWindow, approx_message_tokens, approx_tokens
+
+
+class RecordingLLM:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.requests = []
+
+    def invoke(self, request, config=None):
+        self.requests.append((request, config))
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return AIMessage(content=f"summary #{len(self.requests)}")
+
+    async def ainvoke(self, request, config=None):
+        return self.invoke(request, config)
+
+
+def conversation(turns: int, words: int = 40) -> List:
+    messages = [SystemMessage(content="You are Luna", id="system")]
+    for turn in range(turns):
+        messages.append(HumanMessage(content=" ".join(["question"] * words), id=f"h{turn}"))
+        messages.append(AIMessage(content=" ".join(["answer"] * words), id=f"a{turn}"))
+    return messages
+
+
+def test_token_estimate_by_script():
+    assert approx_tokens("") == 0
+    assert approx_tokens("a" * 40) == 11
+    assert approx_tokens("я" * 40) == 21
+    assert approx_tokens("月" * 40) == 41
+
+
+def test_a_window_within_budget_is_left_alone():
+    llm = RecordingLLM()
+    messages = conversation(3)
+    budget = sum(approx_message_tokens(message) for message in messages)
+    assert ConversationWindow(lambda: llm, token_budget=budget)({"messages": messages}) == {}
+    assert llm.requests == []
+
+
+def test_whole_turns_are_evicted_oldest_first():
+    llm = RecordingLLM()
+    messages = conversation(6)
+    per_turn = approx_message_tokens(messages[1]) + approx_message_tokens(messages[2])
+    # Room for the system prompt and three and a half turns
+    window = ConversationWindow(lambda: llm, token_budget=approx_message_tokens(messages[0]) + int(per_turn * 3.5),
+                                keep_turns=2)
+
+    update = window({"messages": messages})
+    removed = [message.id for message in update["messages"]]
+    assert all(isinstance(message, RemoveMessage) for message in update["messages"])
+    assert removed == ["h0", "a0", "h1", "a1", "h2", "a2"]
+    assert update["summary"] == "summary #1"
+
+
+def test_recent_turns_are_kept_over_budget():
+    window = ConversationWindow(RecordingLLM, token_budget=1, keep_turns=2)
+    update = window({"messages": conversation(3)})
+    assert [message.id for message in update["messages"]] == ["h0", "a0"]
+
+
+def test_the_summary_is_folded_in_once_and_kept_out_of_the_stream():
+    llm = RecordingLLM()
+    window = ConversationWindow(lambda: llm, token_budget=1, keep_turns=1)
+    update = window({"messages": conversation(2), "summary": "User is a Capricorn Sun"})
+
+    request, config = llm.requests[0]
+    assert config == {"tags": ["nostream"]}
+    assert "User is a Capricorn Sun" in request[1].content
+    assert "human: question" in request[1].content and "You are Luna" not in request[1].content
+    assert asyncio.run(window.acall({"messages": conversation(2), "summary": update["summary"]}))["summary"] == "summary #2"
+    assert "summary #1" in llm.requests[1][0][1].content
+
+
+def test_a_failed_summary_keeps_the_evicted_text():
+    window = ConversationWindow(lambda: RecordingLLM(fail=True), token_budget=1, keep_turns=1)
+    update = window({"messages": conversation(2, words=2), "summary": "earlier"})
+    assert update["summary"] == "earlier\nhuman: question question\nai: answer answer"
+
+
+class WindowState(TypedDict):
+    messages: Annotated[List, add_messages]
+    summary: str
+
+
+def test_summary_tokens_do_not_reach_the_messages_stream():
+    summarizer = fake_chat_model(reply="SUMMARY TEXT")
+    window = ConversationWindow(lambda: summarizer, token_budget=1, keep_turns=1)
+    builder = StateGraph(WindowState)
+    builder.add_node("window", window)
+    builder.add_edge(START, "window")
+    builder.add_edge("window", END)
+    graph = builder.compile()
+
+    chunks = list(graph.stream({"messages": conversation(2)}, stream_mode="messages"))
+    assert not any("SUMMARY" in str(chunk.content) for chunk, _ in chunks)
+    assert graph.invoke({"messages": conversation(2)})["summary"] == "SUMMARY TEXT"
@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_cache
+import providers
+from embedding_cache import CachedEmbeddings, EmbeddingDiskCache
+
+
+class RecordingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(("documents", list(texts)))
+        return [[float(len(text)), 0.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(("query", [text]))
+        return [float(len(text)), 1.0]
+
+
+class TaskTypedEmbeddings(RecordingEmbeddings):
+    def embed_documents(self, texts, task_type=None):
+        self.calls.append((task_type or "documents", list(texts)))
+        return [[float(len(text)), 1.0 if task_type else 0.0] for text in texts]
+
+
+def test_queries_use_the_query_path_and_their_own_keys():
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, model_name="fake")
+
+    assert cached.embed_documents(["moon"]) == [[4.0, 0.0]]
+    assert cached.embed_query("moon") == [4.0, 1.0]
+    assert asyncio.run(cached.aembed_query("moon")) == [4.0, 1.0]
+    assert model.calls == [("documents", ["moon"]), ("query", ["moon"])]
+    assert cached.key("moon") != cached.key("moon", embedding_cache.QUERY)
+
+
+def test_queries_batch_with_a_task_type_when_the_model_takes_one():
+    model = TaskTypedEmbeddings()
+    cached = CachedEmbeddings(model, model_name="fake")
+    assert cached.embed_query("sun") == [3.0, 1.0]
+    assert model.calls == [(embedding_cache.QUERY_TASK_TYPE, ["sun"])]
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "DISK_EVICTION_CHECK_INTERVAL", 1)
+    path = str(tmp_path / "embeddings.sqlite3")
+    disk = EmbeddingDiskCache(path, max_entries=2)
+    for index, key in enumerate(["a", "b", "c"]):
+        disk.put_many({key: [float(index)]})
+        with sqlite3.connect(path) as conn:
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (index, key))
+
+    assert set(disk.get_many(["a", "b", "c"])) == {"b", "c"}
+
+
+def test_disk_cache_is_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "DEFAULT_DISK_PATH", str(tmp_path / "embeddings.sqlite3"))
+    assert embedding_cache.get_embedding_disk_cache() is embedding_cache.get_embedding_disk_cache()
+    monkeypatch.setattr(embedding_cache, "DEFAULT_DISK_PATH", "")
+    providers.reset()
+    assert embedding_cache.get_embedding_disk_cache() is None
+
+
+class ShortEmbeddings(RecordingEmbeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0]]
+
+
+def test_a_short_reply_fails_the_call_instead_of_returning_none():
+    cached = CachedEmbeddings(ShortEmbeddings(), model_name="fake")
+    with pytest.raises(ValueError, match="1 vectors for 2 texts"):
+        cached.embed_documents(["a", "b"])
+    assert cached.stats()["errors"] == 1
+
+
+def test_a_crashing_batch_fails_its_callers_and_keeps_the_workers(tmp_path):
+    class BrokenDisk(EmbeddingDiskCache):
+        def get_many(self, keys):
+            raise OSError("disk gone")
+
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, model_name="fake", disk_cache=BrokenDisk(str(tmp_path / "e.sqlite3")),
+                              max_concurrent_batches=1)
+    for _ in range(3):
+        with pytest.raises(OSError, match="disk gone"):
+            cached.embed_documents(["moon"])
+    cached.disk_cache = None
+    assert cached.embed_documents(["moon"]) == [[4.0, 0.0]]
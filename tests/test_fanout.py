@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import providers
+import translator_engine
+from translator_engine import FanoutLimits
+
+
+class InFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+@pytest.fixture
+def in_flight(monkeypatch):
+    tracker = InFlight()
+
+    def translate_text(text, language):
+        with tracker:
+            time.sleep(0.02)
+        return f"{language}:{text}"
+
+    async def atranslate_text(text, language):
+        with tracker:
+            await asyncio.sleep(0.02)
+        return f"{language}:{text}"
+
+    monkeypatch.setattr(translator_engine, "translate_text", translate_text)
+    monkeypatch.setattr(translator_engine, "atranslate_text", atranslate_text)
+    providers.override(f"translator.fanout_limits:{translator_engine.MODEL_NAME}", FanoutLimits(3))
+    return tracker
+
+
+def test_concurrent_fan_outs_share_one_limit(in_flight):
+    languages = list(translator_engine.LANGUAGES)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        outcomes = list(callers.map(lambda i: translator_engine.fan_out_translate(f"text {i}", languages), range(4)))
+
+    assert in_flight.peak == 3
+    for i, (translations, missing) in enumerate(outcomes):
+        assert missing == []
+        assert translations == {language: f"{language}:text {i}" for language in languages}
+
+
+def test_concurrent_async_fan_outs_share_one_limit(in_flight):
+    languages = list(translator_engine.LANGUAGES)
+
+    async def run():
+        return await asyncio.gather(*(translator_engine.afan_out_translate(f"text {i}", languages) for i in range(4)))
+
+    outcomes = asyncio.run(run())
+    assert in_flight.peak == 3
+    assert all(missing == [] for _, missing in outcomes)
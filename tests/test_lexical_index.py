@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lexical_index import LexicalIndex
+
+SLOW = ("memories", "slow")
+FAST = ("memories", "fast")
+
+
+def test_a_slow_load_blocks_neither_other_namespaces_nor_writes():
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load(namespace):
+        loads.append(namespace)
+        if namespace == SLOW:
+            started.set()
+            release.wait(5)
+            return [("old", "the moon in bharni")]
+        return [("sun", "sun in leo")]
+
+    index = LexicalIndex(load)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        searches = [pool.submit(index.search, SLOW, "moon", 5) for _ in range(2)]
+        assert started.wait(5)
+        # Served while the other namespace is still loading
+        assert [hit.key for hit in index.search(FAST, "sun", 5)] == ["sun"]
+        index.add(SLOW, "new", "a new moon ritual")
+        release.set()
+        results = [future.result(5) for future in searches]
+
+    assert loads.count(SLOW) == 1
+    assert all(sorted(hit.key for hit in hits) == ["new", "old"] for hits in results)
+    assert index.is_loaded(SLOW)
+
+
+def test_a_namespace_dropped_while_loading_is_reloaded():
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load(namespace):
+        loads.append(namespace)
+        started.set()
+        release.wait(5)
+        return [("a", "moon")]
+
+    index = LexicalIndex(load)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        search = pool.submit(index.search, SLOW, "moon", 5)
+        assert started.wait(5)
+        index.drop(SLOW)
+        release.set()
+        assert [hit.key for hit in search.result(5)] == ["a"]
+    assert not index.is_loaded(SLOW)
+    index.search(SLOW, "moon", 5)
+    assert len(loads) == 2
@@ -0,0 +1,95 @@
+import logging
+import threading
+
+from langgraph.store.base import PutOp
+
+from memory_queue import MemoryWriteQueue
+
+NAMESPACE = ("memories", "user-1")
+
+
+class RecordingStore:
+    """Records every batch; fails the first `failures` calls and blocks while `gate` is clear"""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def batch(self, ops):
+        self.gate.wait()
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("store unavailable")
+        assert all(isinstance(op, PutOp) for op in ops)
+        self.batches.append([(op.key, op.value) for op in ops])
+        return [None] * len(ops)
+
+
+def test_writes_arriving_together_share_a_batch():
+    store = RecordingStore()
+    writes = MemoryWriteQueue(store, max_batch_size=3, flush_interval=1.0)
+    for index in range(5):
+        writes.put(NAMESPACE, f"m{index}", {"data": index})
+
+    assert writes.flush(timeout=5)
+    assert [[key for key, _ in batch] for batch in store.batches] == [["m0", "m1", "m2"], ["m3", "m4"]]
+    assert writes.stats() == {"enqueued": 5, "written": 5, "failed": 0, "batches": 2, "retries": 0, "pending": 0}
+    writes.close()
+
+
+def test_queued_writes_are_readable_until_stored():
+    store = RecordingStore()
+    store.gate.clear()
+    writes = MemoryWriteQueue(store, flush_interval=0.0)
+    writes.put(NAMESPACE, "moon", {"data": "first"})
+    writes.put(NAMESPACE, "moon", {"data": "second"})
+    writes.put(NAMESPACE, "sun", {"data": "other"})
+
+    assert writes.pending_items(NAMESPACE) == [("moon", {"data": "second"}), ("sun", {"data": "other"})]
+    assert writes.pending_values(("memories", "user-2")) == []
+    store.gate.set()
+    assert writes.flush(NAMESPACE, timeout=5)
+    assert writes.pending_values(NAMESPACE) == []
+    writes.close()
+
+
+def test_a_failed_batch_stays_pending_and_is_retried():
+    store = RecordingStore(failures=2)
+    writes = MemoryWriteQueue(store, flush_interval=0.0, retry_delay=0.2)
+    writes.put(NAMESPACE, "moon", {"data": "Moon in Bharni"})
+
+    assert not writes.flush(timeout=0.1)
+    assert writes.pending_values(NAMESPACE) == [{"data": "Moon in Bharni"}]
+    assert writes.flush(timeout=5)
+    assert store.batches == [[("moon", {"data": "Moon in Bharni"})]]
+    stats = writes.stats()
+    assert (stats["written"], stats["failed"], stats["retries"]) == (1, 0, 2)
+    writes.close()
+
+
+def test_a_batch_is_dropped_loudly_after_its_last_attempt(caplog):
+    store = RecordingStore(failures=10)
+    writes = MemoryWriteQueue(store, flush_interval=0.0, max_attempts=3, retry_delay=0.01)
+    with caplog.at_level(logging.WARNING, logger="memory_queue"):
+        writes.put(NAMESPACE, "moon", {"data": "lost"})
+        assert writes.flush(timeout=5)
+
+    assert store.calls == 3 and store.batches == []
+    assert writes.pending_values(NAMESPACE) == []
+    assert writes.stats()["failed"] == 1
+    errors = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1 and "memories/user-1/moon" in errors[0]
+    writes.close()
+
+
+def test_close_flushes_an_open_batch():
+    store = RecordingStore()
+    writes = MemoryWriteQueue(store, flush_interval=60.0)
+    writes.put(NAMESPACE, "moon", {"data": "kept"})
+    writes.close(timeout=5)
+
+    assert store.batches == [[("moon", {"data": "kept"})]]
+    assert not writes.worker.is_alive()
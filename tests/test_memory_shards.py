@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from memory_shards import ShardClient, ShardServer
+
+
+class CountingManager:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.stored = 0
+        self.retrieved = 0
+        self.write_queue = None
+
+    def store_memory(self, user_id, memory_data):
+        self.stored += 1
+        time.sleep(self.delay)
+
+    def retrieve_memories(self, user_id, query, top_k=3):
+        self.retrieved += 1
+        return [{"memory": query}]
+
+
+@pytest.fixture
+def shard(tmp_path):
+    servers = []
+
+    def start(manager):
+        server = ShardServer(str(tmp_path / "shard.sock"), manager)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_a_timed_out_store_is_not_sent_twice(shard):
+    manager = CountingManager(delay=0.3)
+    server = shard(manager)
+    client = ShardClient(server.server_address, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        client.call("store_memory", user_id="u", memory_data={"a": 1})
+    time.sleep(0.5)
+    assert manager.stored == 1
+
+
+def test_a_connection_closed_while_idle_is_replaced(shard):
+    manager = CountingManager()
+    server = shard(manager)
+    client = ShardClient(server.server_address, pool_size=1)
+    assert client.call("retrieve_memories", user_id="u", query="moon") == [{"memory": "moon"}]
+    # The shard drops the idle connection, e.g. on restart
+    client.idle[0].shutdown(2)
+    client.call("store_memory", user_id="u", memory_data={"a": 1})
+    assert manager.stored == 1
+
+
+def test_discarding_a_connection_wakes_a_waiter(shard):
+    server = shard(CountingManager())
+    client = ShardClient(server.server_address, pool_size=1, timeout=5)
+    held = client._acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(client._acquire()))
+    waiter.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    client._discard(held)
+    waiter.join(5)
+    assert acquired and time.monotonic() - started < 1
+    client._release(acquired[0])
+    client.close()
+    assert client.opened == 0
@@ -0,0 +1,163 @@
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langgraph.store.base import GetOp, PutOp
+
+import providers
+from memory_consolidation import MEMORY_NAMESPACE, consolidate_user
+from memory_store import NamespaceVectors, PersistentVectorStore
+from response_cache import HashingEmbeddings
+
+NAMESPACE = ("memories", "user-1")
+
+
+def open_store(path):
+    return PersistentVectorStore(str(path), index={"embed": HashingEmbeddings(64), "dims": None, "fields": ["data"]})
+
+
+def search_keys(store, query, limit=3):
+    return [item.key for item in store.search(NAMESPACE, query=query, limit=limit)]
+
+
+def test_batch_applies_ops_in_order(tmp_path):
+    store = open_store(tmp_path)
+    results = store.batch([
+        GetOp(NAMESPACE, "a"),
+        PutOp(NAMESPACE, "a", {"data": "first"}),
+        GetOp(NAMESPACE, "a"),
+        PutOp(NAMESPACE, "a", {"data": "second"}),
+        PutOp(NAMESPACE, "b", {"data": "other"}),
+        GetOp(NAMESPACE, "a"),
+    ])
+    assert results[0] is None
+    assert results[2].value == {"data": "first"}
+    assert results[5].value == {"data": "second"}
+
+
+def test_writes_of_another_store_are_seen_by_a_mapped_namespace(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    first.put(NAMESPACE, "moon", {"data": "my moon sign worries me"})
+    assert search_keys(first, "moon sign") == ["moon"]
+
+    second.put(NAMESPACE, "sister", {"data": "my sister is visiting next week"})
+    first.put(NAMESPACE, "job", {"data": "a new job offer arrived"})
+
+    assert search_keys(first, "sister visiting", limit=1) == ["sister"]
+    assert search_keys(first, "new job offer", limit=1) == ["job"]
+    assert search_keys(second, "moon sign worries", limit=1) == ["moon"]
+
+
+def _put_many(path, worker, count):
+    store = open_store(path)
+    for index in range(count):
+        store.put(NAMESPACE, f"{worker}-{index}", {"data": f"note {index} from worker {worker} about planet {worker}"})
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_processes_appending_to_one_namespace_get_distinct_rows(tmp_path):
+    open_store(tmp_path).put(NAMESPACE, "seed", {"data": "seed"})
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_put_many, args=(str(tmp_path), worker, 20)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    assert all(process.exitcode == 0 for process in workers)
+
+    conn = open_store(tmp_path)._connection()
+    rows = [row for (row,) in conn.execute("SELECT vector_row FROM items WHERE vector_row IS NOT NULL")]
+    assert len(rows) == len(set(rows)) == 61
+    store = open_store(tmp_path)
+    for item in store.search(NAMESPACE, query="note 7 from worker 2 about planet 2", limit=1):
+        assert item.key == "2-7"
+
+
+def _namespace_file(tmp_path, size, dims=32):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    path = str(tmp_path / "vectors.f32")
+    vectors.tofile(path)
+    return path, vectors
+
+
+def test_index_trains_in_the_background_while_exact_search_serves(tmp_path):
+    path, vectors = _namespace_file(tmp_path, 400)
+    gate = threading.Event()
+    builder = ThreadPoolExecutor(max_workers=1)
+    builder.submit(gate.wait)
+    providers.override("memory_store.index_builder", builder)
+    namespace = NamespaceVectors(path, 32, [str(i) for i in range(400)], list(range(400)),
+                                 {"min_size": 100, "nprobe": 64, "nlist": 8, "rebuild_growth": 2.0})
+
+    # The builder is busy: exact search answers and the index is not there yet
+    assert namespace.search(vectors[5], 1)[0][0] == "5"
+    assert namespace.ann is None
+    gate.set()
+    namespace.wait_for_rebuild()
+    assert namespace.ann is not None
+    assert namespace.search(vectors[7], 1)[0][0] == "7"
+    builder.shutdown()
+
+
+def test_product_codes_train_in_the_background(tmp_path):
+    path, vectors = _namespace_file(tmp_path, 400)
+    gate = threading.Event()
+    builder = ThreadPoolExecutor(max_workers=1)
+    builder.submit(gate.wait)
+    providers.override("memory_store.index_builder", builder)
+    namespace = NamespaceVectors(path, 32, [str(i) for i in range(400)], list(range(400)), None,
+                                 {"type": "pq", "rerank": None, "subspace_dims": 4, "min_size": 100,
+                                  "rebuild_growth": 2.0})
+
+    assert namespace.search(vectors[3], 1)[0][0] == "3"
+    assert namespace.codes is None
+    gate.set()
+    namespace.wait_for_rebuild()
+    assert namespace.codes is not None
+    assert namespace.search(vectors[9], 1)[0][0] == "9"
+    builder.shutdown()
+
+
+def test_listing_pages_through_every_item_once(tmp_path):
+    store = open_store(tmp_path)
+    store.batch([PutOp(NAMESPACE, f"m{index}", {"data": f"memory {index}"}) for index in range(25)])
+    store.put((*NAMESPACE, "archive"), "old", {"data": "archived"})
+
+    pages = [store.search(NAMESPACE, limit=10, offset=offset) for offset in (0, 10, 20, 30)]
+    keys = [item.key for page in pages for item in page]
+    assert len(keys) == len(set(keys)) == 26
+    assert [len(page) for page in pages] == [10, 10, 6, 0]
+    assert [item.key for item in store.search(NAMESPACE, filter={"data": "memory 3"})] == ["m3"]
+    archive = (*NAMESPACE, "archive")
+    assert [item.key for item in store.search(archive, offset=0)] == ["old"]
+    assert store.search(archive, offset=1) == []
+
+
+def test_stored_vectors_are_the_indexed_embeddings(tmp_path):
+    store = open_store(tmp_path)
+    store.put(NAMESPACE, "moon", {"data": "my moon sign worries me"})
+    store.put(NAMESPACE, "plain", {"data": "not indexed"}, index=False)
+
+    found = store.stored_vectors(NAMESPACE, ["moon", "plain", "absent"])
+    assert list(found) == ["moon"]
+    expected = store._embed_query("my moon sign worries me")
+    assert np.allclose(found["moon"], expected, atol=1e-6)
+
+
+def test_consolidation_clusters_stored_vectors_without_embedding(tmp_path):
+    class NoEmbedding(HashingEmbeddings):
+        def embed_documents(self, texts):
+            raise AssertionError("memories were embedded again")
+
+    store = open_store(tmp_path)
+    namespace = (MEMORY_NAMESPACE, "user-1")
+    store.batch([PutOp(namespace, f"m{index}", {"data": f"my moon sign note {index % 2}"}) for index in range(6)])
+    manager = SimpleNamespace(store=store, embedding_model=NoEmbedding(64), write_queue=None)
+
+    result = consolidate_user(manager, "user-1", min_age_days=-1, keep_recent=0, cluster_size=3, dry_run=True)
+    assert result["candidates"] == 6 and result["summaries"] >= 1
@@ -0,0 +1,89 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import providers
+from conftest import fake_chat_model, load_sample_payload
+from prompt_cache import LocalPrefixBackend, PromptPrefixCache
+
+
+class RecordingBackend(LocalPrefixBackend):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+        self.released = []
+
+    def create(self, system_text, ttl):
+        if self.fail:
+            raise RuntimeError("cache rejected")
+        self.created.append(system_text)
+        return f"handle-{len(self.created)}"
+
+    def prepare(self, handle, messages):
+        return list(messages), {"cached_content": handle}
+
+    def release(self, handle):
+        self.released.append(handle)
+
+
+def test_miss_builds_prefix_then_hits_reuse_it(clock):
+    cache = PromptPrefixCache(clock=clock)
+    builds = []
+    build = lambda: builds.append(1) or "instructions"
+    question = [HumanMessage(content="hi")]
+
+    first, kwargs = cache.prepare("chart", build, question)
+    second, _ = cache.prepare("chart", build, question)
+
+    assert len(builds) == 1
+    assert kwargs == {}
+    assert isinstance(first[0], SystemMessage) and first[0].content == "instructions"
+    assert second[0] is first[0]
+    assert second[1:] == question
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_entries_expire_after_ttl(clock):
+    backend = RecordingBackend()
+    cache = PromptPrefixCache(backend, ttl=60, clock=clock)
+    cache.prepare("chart", lambda: "v1", [])
+
+    clock.now += 59
+    assert cache.prepare("chart", lambda: "v2", [])[1] == {"cached_content": "handle-1"}
+    clock.now += 1
+    assert cache.prepare("chart", lambda: "v2", [])[1] == {"cached_content": "handle-2"}
+
+    assert backend.created == ["v1", "v2"]
+    assert backend.released == ["handle-1"]
+    assert cache.stats()["misses"] == 2 and cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_prefix_is_evicted_and_released(clock):
+    backend = RecordingBackend()
+    cache = PromptPrefixCache(backend, max_entries=2, clock=clock)
+    cache.prepare("a", lambda: "a", [])
+    cache.prepare("b", lambda: "b", [])
+    cache.prepare("a", lambda: "a", [])
+    cache.prepare("c", lambda: "c", [])
+
+    assert list(cache.entries) == ["a", "c"]
+    assert backend.released == ["handle-2"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_failing_backend_falls_back_to_local_prefix(clock):
+    cache = PromptPrefixCache(RecordingBackend(fail=True), clock=clock)
+    messages, kwargs = cache.prepare("chart", lambda: "instructions", [HumanMessage(content="hi")])
+    assert kwargs == {}
+    assert messages[0].content == "instructions"
+
+
+def test_priestess_turns_of_one_chart_share_a_prefix():
+    import ai_birthchart
+
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", fake_chat_model())
+    graph = ai_birthchart.build_graph()
+    payload = load_sample_payload()
+    for _ in range(3):
+        graph.invoke({"messages": [HumanMessage(content="What does my Moon in Bharni mean?")], "astro_data": payload})
+
+    stats = ai_birthchart.get_prefix_cache().stats()
+    assert (stats["misses"], stats["hits"]) == (1, 2)
@@ -0,0 +1,33 @@
+from langchain_core.messages import HumanMessage
+
+import providers
+import translator_engine
+from conftest import sleepy_chat_model
+
+
+def test_instances_are_built_once_and_rebuilt_after_reset():
+    built = []
+    providers.register("test.thing", lambda: built.append(object()) or built[-1])
+
+    first = providers.get("test.thing")
+    assert providers.get("test.thing") is first and len(built) == 1
+    providers.override("test.thing", "fake")
+    assert providers.get("test.thing") == "fake"
+    providers.reset("test.thing")
+    assert providers.get("test.thing") is built[-1] is not first
+
+
+def test_override_and_reset_swap_the_model_under_a_built_graph():
+    name = f"chat:{translator_engine.MODEL_NAME}"
+    graph = translator_engine.graph
+    messages = {"messages": [HumanMessage(content="Hello")]}
+
+    providers.override(name, sleepy_chat_model(0, reply="first"))
+    assert graph.invoke(messages)["messages"][-1].content == "first"
+    providers.override(name, sleepy_chat_model(0, reply="second"))
+    assert graph.invoke(messages)["messages"][-1].content == "second"
+
+    providers.reset(name)
+    # The real client is built again on next use, without a request being made
+    assert type(translator_engine.get_model()).__name__ != "SleepyChatModel"
+    assert translator_engine.graph is graph
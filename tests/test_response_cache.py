@@ -0,0 +1,148 @@
+import asyncio
+from datetime import date
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import providers
+from astro_encoding import encode_chart
+from conftest import load_sample_payload, sleepy_chat_model, synthetic_payload
+from response_cache import HashingEmbeddings, SemanticResponseCache, chart_signature, detect_script
+
+QUESTION = "What does my Moon in Bharni mean?"
+PARAPHRASE = "what does my moon in Bharni mean"
+
+
+@pytest.fixture
+def cache(clock):
+    return SemanticResponseCache(HashingEmbeddings(), threshold=0.9, ttl=3600, clock=clock, seed=0)
+
+
+def store(cache, partition, question, reply, seconds=1.0):
+    lookup = cache.lookup(partition, question)
+    assert lookup.reply is None
+    cache.record(lookup, reply, seconds)
+
+
+def test_similar_question_hits_and_counts_time_saved(cache):
+    store(cache, "latin:chart", QUESTION, "reply", seconds=2.5)
+
+    assert cache.lookup("latin:chart", PARAPHRASE).reply == "reply"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["latency_saved_seconds"] == 2.5
+
+
+def test_question_below_threshold_misses(cache):
+    store(cache, "latin:chart", QUESTION, "reply")
+    lookup = cache.lookup("latin:chart", "Is today good for starting something?")
+    assert lookup.reply is None
+    assert lookup.similarity < cache.threshold
+
+
+def test_partitions_never_share_replies(cache):
+    store(cache, "latin:chart-a", QUESTION, "reply")
+    assert cache.lookup("latin:chart-b", QUESTION).reply is None
+    assert cache.lookup("cyrillic:chart-a", QUESTION).reply is None
+    assert cache.lookup("latin:chart-a", QUESTION).reply == "reply"
+
+
+def test_replies_expire_after_ttl(cache, clock):
+    store(cache, "latin:chart", QUESTION, "reply")
+    clock.now += 3599
+    assert cache.lookup("latin:chart", QUESTION).reply == "reply"
+    clock.now += 1
+    assert cache.lookup("latin:chart", QUESTION).reply is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_audit_drops_a_false_hit_and_keeps_the_fresh_reply(clock):
+    cache = SemanticResponseCache(HashingEmbeddings(), threshold=0.5, audit_rate=1.0, clock=clock, seed=0)
+    store(cache, "latin:chart", "Is today good for starting something?", "Yes, begin the project today")
+
+    audited = cache.lookup("latin:chart", "Is today good for ending something?")
+    assert audited.reply is None and audited.audited is not None
+    cache.record(audited, "Let things rest: endings can wait for the waning Moon", 1.0)
+
+    stats = cache.stats()
+    assert (stats["audited"], stats["false_hits"], stats["false_hit_rate"]) == (1, 1, 1.0)
+    assert cache.audit_log()[-1]["false_hit"]
+    assert [entry.reply for entry in cache.partitions["latin:chart"].entries] == [
+        "Let things rest: endings can wait for the waning Moon"]
+
+
+def test_audit_confirms_a_correct_hit(clock):
+    cache = SemanticResponseCache(HashingEmbeddings(), audit_rate=1.0, clock=clock, seed=0)
+    store(cache, "latin:chart", QUESTION, "Your Moon in Bharni carries deep feeling")
+
+    audited = cache.lookup("latin:chart", PARAPHRASE)
+    cache.record(audited, "Your Moon in Bharni carries deep feeling", 1.0)
+    assert cache.stats()["false_hits"] == 0
+    assert not cache.audit_log()[-1]["false_hit"]
+
+
+def test_async_lookup_and_record(cache):
+    async def run():
+        lookup = await cache.alookup("latin:chart", QUESTION)
+        await cache.arecord(lookup, "reply", 1.0)
+        return await cache.alookup("latin:chart", PARAPHRASE)
+
+    assert asyncio.run(run()).reply == "reply"
+
+
+def test_failing_embeddings_disable_the_lookup_instead_of_failing():
+    class Broken(HashingEmbeddings):
+        def embed_query(self, text):
+            raise RuntimeError("quota exceeded")
+
+    cache = SemanticResponseCache(Broken())
+    assert cache.lookup("latin:chart", QUESTION) is None
+    assert cache.stats()["errors"] == 1
+
+
+def test_signature_follows_the_chart_rows_the_question_names():
+    chart = encode_chart(synthetic_payload(30))
+    selection = chart.calendar.select("", today=date(2025, 1, 10))
+    signature = lambda question: chart_signature(chart, selection, question)
+
+    assert signature("What does my Moon mean?") == signature("Что значит моя Луна?")
+    assert signature("What does my Moon mean?") != signature("What does my Sun mean?")
+    assert signature("Is today good?") != signature("Is tomorrow good?")
+
+
+def test_signature_ignores_degrees():
+    payload = load_sample_payload()
+    moved = load_sample_payload()
+    moved["data"]["nathal"] = moved["data"]["nathal"].replace('"19:52:45"', '"3:1:1"')
+    assert moved != payload
+    charts = [encode_chart(data) for data in (payload, moved)]
+    selections = [chart.calendar.select("", today=date(2025, 1, 10)) for chart in charts]
+    assert chart_signature(charts[0], selections[0], QUESTION) == chart_signature(charts[1], selections[1], QUESTION)
+
+
+def test_detect_script():
+    assert detect_script(QUESTION) == "latin"
+    assert detect_script("Что значит моя Луна?") == "cyrillic"
+
+
+def test_priestess_answers_repeated_first_questions_and_bypasses_follow_ups():
+    import ai_birthchart
+
+    model = sleepy_chat_model(0, reply="cached reply")
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", model)
+    cache = SemanticResponseCache(HashingEmbeddings())
+    providers.override("ai_birthchart.response_cache", cache)
+    graph = ai_birthchart.build_graph()
+    chart_id = ai_birthchart.register_chart(load_sample_payload())
+
+    for question in (QUESTION, PARAPHRASE):
+        state = graph.invoke({"messages": [HumanMessage(content=question)], "chart_id": chart_id})
+        assert state["messages"][-1].content == "cached reply"
+    follow_up = [HumanMessage(content="Hello"), AIMessage(content="Welcome"), HumanMessage(content=QUESTION)]
+    graph.invoke({"messages": follow_up, "chart_id": chart_id})
+
+    assert model.calls == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypasses"]) == (1, 1, 1)
@@ -0,0 +1,64 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from langchain_core.messages import HumanMessage
+from langgraph.store.base import PutOp
+
+import ai_birthchart_memo_langBOT
+import retention
+from conftest import reply_graph
+from checkpoint_store import SQLiteDeltaSaver
+from memory_consolidation import ARCHIVE_NAMESPACE, MEMORY_NAMESPACE
+from memory_store import PersistentVectorStore
+from response_cache import HashingEmbeddings
+from retention import RetentionSweeper
+
+
+def saver_with_threads(path, threads):
+    saver = SQLiteDeltaSaver(str(path), compact_every=0)
+    graph = reply_graph(saver)
+    for thread in threads:
+        graph.invoke({"messages": [HumanMessage(content="Hello")]}, {"configurable": {"thread_id": thread}})
+    return saver
+
+
+def test_limits_are_off_and_the_sweeper_idle_by_default():
+    sweeper = ai_birthchart_memo_langBOT.get_retention_sweeper()
+    assert not sweeper.limited and sweeper.worker is None
+    assert RetentionSweeper().limited is False
+
+
+def test_idle_threads_come_from_the_activity_table(tmp_path):
+    path = tmp_path / "checkpoints.sqlite3"
+    saver = saver_with_threads(path, ["a", "b"])
+    assert {thread for thread, _, _ in saver.thread_usage()} == {"a", "b"}
+    later = datetime.now(timezone.utc) + timedelta(days=2)
+    idle = retention.idle_threads(saver, later)
+    assert sorted(thread.thread_id for thread in idle) == ["a", "b"] and all(thread.bytes > 0 for thread in idle)
+    assert retention.idle_threads(saver, later - timedelta(days=4)) == []
+
+    result = RetentionSweeper(saver, thread_ttl_days=1).sweep(later)
+    assert result["expired_threads"] == 2 and result["bytes_before"] is None
+    assert saver.thread_usage() == []
+
+
+def test_activity_is_filled_in_for_older_files(tmp_path):
+    path = tmp_path / "checkpoints.sqlite3"
+    saver_with_threads(path, ["a"])
+    with sqlite3.connect(path) as conn:
+        conn.execute("DELETE FROM thread_activity")
+        conn.execute("PRAGMA user_version = 0")
+    assert [thread for thread, _, _ in SQLiteDeltaSaver(str(path)).thread_usage()] == ["a"]
+
+
+def test_quota_trims_only_users_over_it(tmp_path):
+    store = PersistentVectorStore(str(tmp_path), index={"embed": HashingEmbeddings(16), "dims": None, "fields": ["data"]})
+    store.batch([PutOp((MEMORY_NAMESPACE, "big"), f"m{index}", {"data": f"memory {index}"}) for index in range(5)]
+                + [PutOp((ARCHIVE_NAMESPACE, "big"), "old", {"data": "archived"}, index=False),
+                   PutOp((MEMORY_NAMESPACE, "small"), "m0", {"data": "memory"})])
+    assert retention.memories_per_user(store) == {"big": 6, "small": 1}
+
+    result = RetentionSweeper(store=store, memory_quota=3, vacuum=False).sweep()
+    assert result["trimmed_memories"] == 3
+    assert retention.memories_per_user(store) == {"big": 3, "small": 1}
+    assert store.get((ARCHIVE_NAMESPACE, "big"), "old") is None
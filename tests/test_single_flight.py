@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+import single_flight
+from conftest import fake_chat_model, sleepy_chat_model
+from single_flight import SingleFlight, SingleFlightChatModel, StalledFlightError
+
+
+def slow_chunks(count, delay, started=None):
+    def start():
+        if started is not None:
+            started.set()
+        for index in range(count):
+            time.sleep(delay)
+            yield index
+    return start
+
+
+def test_a_leader_that_stops_reading_returns_at_once():
+    flights = SingleFlight()
+    started = threading.Event()
+    leader = flights.stream("key", slow_chunks(10, 0.05, started))
+    assert next(leader) == 0
+    follower = []
+    reader = threading.Thread(target=lambda: follower.extend(flights.stream("key", slow_chunks(0, 0))))
+    reader.start()
+    while not flights.flights["key"].followers:
+        time.sleep(0.001)
+
+    closing = time.perf_counter()
+    leader.close()
+    assert time.perf_counter() - closing < 0.05
+    reader.join(5)
+    assert follower == list(range(10))
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_concurrent_invokes_share_one_call():
+    model = sleepy_chat_model(0.05, reply="forecast")
+    flights = SingleFlight()
+    coalesced = SingleFlightChatModel(model=model, model_name="fake", flights=flights)
+    messages = [HumanMessage(content="Daily forecast")]
+
+    async def burst():
+        return await asyncio.gather(*(coalesced.ainvoke(messages) for _ in range(20)))
+
+    replies = asyncio.run(burst())
+    assert model.calls == 1
+    assert {reply.content for reply in replies} == {"forecast"}
+    assert len({reply.id for reply in replies}) == 20
+    assert coalesced.invoke(messages).content == "forecast"
+
+
+def test_invoke_merges_streamed_chunks():
+    streaming = SingleFlightChatModel(model=fake_chat_model(reply="Hello, bright world"), model_name="fake",
+                                      flights=SingleFlight())
+    messages = [HumanMessage(content="Hello")]
+    assert streaming.invoke(messages).content == "Hello, bright world"
+    assert asyncio.run(streaming.ainvoke(messages)).content == "Hello, bright world"
+
+    whole = SingleFlightChatModel(model=sleepy_chat_model(0, reply="whole reply"), model_name="fake",
+                                  flights=SingleFlight())
+    assert whole.invoke(messages).content == "whole reply"
+
+
+class HangingChatModel(BaseChatModel):
+    """Streams one chunk, then hangs on its first `hang` calls; records calls that were cancelled"""
+    hang: int = 1
+    calls: int = 0
+    cancelled: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "hanging-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        yield ChatGenerationChunk(message=AIMessageChunk(content="first "))
+        try:
+            if self.calls <= self.hang:
+                await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        yield ChatGenerationChunk(message=AIMessageChunk(content="last"))
+
+
+def test_the_call_is_cancelled_once_every_caller_has_left():
+    model = HangingChatModel()
+    flights = SingleFlight()
+    coalesced = SingleFlightChatModel(model=model, model_name="fake", flights=flights)
+    messages = [HumanMessage(content="Daily forecast")]
+
+    async def scenario():
+        leader = asyncio.ensure_future(coalesced.ainvoke(messages))
+        await asyncio.sleep(0.02)
+        follower = asyncio.ensure_future(coalesced.ainvoke(messages))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        await asyncio.sleep(0.02)
+        assert model.cancelled == 0
+        follower.cancel()
+        await asyncio.sleep(0.02)
+        assert model.cancelled == 1
+
+    asyncio.run(scenario())
+    assert flights.stats() == {"calls": 2, "upstream": 1, "coalesced": 1, "in_flight": 0}
+
+
+# The leader's generator and task die with its loop, which Python reports when it collects them
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnraisableExceptionWarning")
+@pytest.mark.filterwarnings("ignore:coroutine .* was never awaited:RuntimeWarning")
+def test_followers_fail_when_the_leaders_event_loop_is_closed(monkeypatch):
+    monkeypatch.setattr(single_flight, "STALL_CHECK_INTERVAL", 0.02)
+    model = HangingChatModel()
+    flights = SingleFlight()
+    coalesced = SingleFlightChatModel(model=model, model_name="fake", flights=flights)
+    messages = [HumanMessage(content="Daily forecast")]
+    started, joined = threading.Event(), threading.Event()
+
+    def leader():
+        loop = asyncio.new_event_loop()
+        stream = coalesced.astream(messages)
+        loop.run_until_complete(stream.__anext__())
+        started.set()
+        joined.wait(5)
+        # Torn down with the shared call still running
+        loop.close()
+
+    errors = []
+
+    def follower():
+        try:
+            coalesced.invoke(messages)
+        except StalledFlightError as e:
+            errors.append(e)
+
+    threading.Thread(target=leader).start()
+    assert started.wait(5)
+    reader = threading.Thread(target=follower)
+    reader.start()
+    while flights.stats()["coalesced"] == 0:
+        time.sleep(0.001)
+    joined.set()
+    reader.join(5)
+
+    assert not reader.is_alive() and "event loop" in str(errors[0])
+    # The next caller starts a fresh call
+    assert asyncio.run(coalesced.ainvoke(messages)).content == "first last"
+
+
+def test_followers_give_up_on_a_call_that_stops_producing(monkeypatch):
+    monkeypatch.setattr(single_flight, "STALL_CHECK_INTERVAL", 0.02)
+    monkeypatch.setattr(single_flight, "FOLLOW_TIMEOUT", 0.1)
+    flights = SingleFlight()
+    started = threading.Event()
+    leader = flights.stream("key", slow_chunks(2, 0.5, started))
+    threading.Thread(target=lambda: list(leader)).start()
+    assert started.wait(5)
+
+    with pytest.raises(StalledFlightError, match="produced nothing"):
+        list(flights.stream("key", slow_chunks(0, 0)))
+    assert flights.stats()["in_flight"] == 0
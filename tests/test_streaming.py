@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+
+import providers
+from conftest import SAMPLE_REPLY, fake_chat_model, load_sample_payload
+
+TOKEN_DELAY = 0.02
+
+
+def build_graph():
+    import ai_birthchart
+
+    providers.override(f"chat:{ai_birthchart.MODEL_NAME}", fake_chat_model(token_delay=TOKEN_DELAY))
+    return ai_birthchart.build_graph()
+
+
+def request():
+    return {"messages": [HumanMessage(content="What does my Moon in Bharni mean?")], "astro_data": load_sample_payload()}
+
+
+def test_priestess_streams_tokens_before_the_reply_is_complete():
+    start = time.perf_counter()
+    arrivals, chunks = [], []
+    for chunk, metadata in build_graph().stream(request(), stream_mode="messages"):
+        arrivals.append(time.perf_counter() - start)
+        chunks.append(chunk)
+        assert metadata["langgraph_node"] == "priestess"
+
+    assert len(chunks) > 10
+    assert "".join(chunk.content for chunk in chunks) == SAMPLE_REPLY
+    # The first token arrives long before the last one
+    assert arrivals[0] < arrivals[-1] / 4
+
+
+def test_priestess_streams_tokens_async():
+    async def collect():
+        return [chunk async for chunk, _ in build_graph().astream(request(), stream_mode="messages")]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 10
+    assert "".join(chunk.content for chunk in chunks) == SAMPLE_REPLY
+
+
+def test_streamed_reply_is_stored_as_one_message():
+    state = build_graph().invoke(request())
+    assert state["messages"][-1].content == SAMPLE_REPLY
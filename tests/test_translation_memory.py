@@ -0,0 +1,65 @@
+import sqlite3
+
+import translation_memory
+from translation_memory import TranslationMemory
+
+
+def shared_counters(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+
+
+def test_lookups_only_read_until_a_flush(tmp_path):
+    path = str(tmp_path / "tm.sqlite3")
+    memory = TranslationMemory(path)
+    memory.put("Hello  world", "fr", "v1", "Bonjour le monde")
+
+    assert memory.get("Hello world", "fr", "v1") == "Bonjour le monde"
+    assert memory.get("Goodbye", "fr", "v1") is None
+    assert shared_counters(path) == {}
+
+    memory.flush()
+    assert shared_counters(path) == {"hits": 1, "misses": 1}
+    stats = memory.stats()
+    assert (stats["hits"], stats["total_hits"], stats["total_misses"]) == (1, 1, 1)
+
+
+def test_stale_recency_is_touched_in_the_batch(tmp_path):
+    path = str(tmp_path / "tm.sqlite3")
+    memory = TranslationMemory(path)
+    memory.put("Hello", "de", "v1", "Hallo")
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE translations SET last_used = 0")
+
+    memory.get("Hello", "de", "v1")
+    assert list(memory.pending_touches) == [memory.make_key("Hello", "de", "v1")]
+    memory.flush()
+    with sqlite3.connect(path) as conn:
+        (last_used,) = conn.execute("SELECT last_used FROM translations").fetchone()
+    assert last_used > 0 and not memory.pending_touches
+
+
+def test_flush_happens_once_the_batch_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(translation_memory, "FLUSH_BATCH_SIZE", 1)
+    path = str(tmp_path / "tm.sqlite3")
+    memory = TranslationMemory(path)
+    memory.put("Hello", "it", "v1", "Ciao")
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE translations SET last_used = 0")
+
+    memory.get("Hello", "it", "v1")
+    assert shared_counters(path) == {"hits": 1}
+
+
+def test_disabled_memory_is_shared_as_none(monkeypatch):
+    monkeypatch.setattr(translation_memory, "DEFAULT_PATH", "")
+    assert translation_memory.get_translation_memory() is None
+
+
+def test_line_breaks_survive_normalization(tmp_path):
+    assert translation_memory.normalize_text(" Moon \t in\r\n\r\n  Bharni ") == "Moon in\nBharni"
+
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    memory.put("Rest today.\nBegin tomorrow.", "fr", "v1", "Reposez-vous.\nCommencez demain.")
+    assert memory.get("Rest today. Begin tomorrow.", "fr", "v1") is None
+    assert memory.get("Rest today.\n\nBegin tomorrow.", "fr", "v1") == "Reposez-vous.\nCommencez demain."
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import providers
+import translator_engine
+from conftest import sleepy_chat_model
+from conversation_window import approx_tokens, message_text
+from translator_engine import SEGMENT_RE, pack_segments, parse_batch_response
+
+
+def test_packs_fill_the_budget_in_order():
+    segments = {str(index): "x" * 40 for index in range(7)}
+    # 10 tokens of text plus 8 of markup per segment
+    packs = pack_segments(segments, token_budget=40)
+    assert [list(pack) for pack in packs] == [["0", "1"], ["2", "3"], ["4", "5"], ["6"]]
+    assert all(sum(approx_tokens(text) + 8 for text in pack.values()) <= 40 for pack in packs)
+
+
+def test_an_oversized_segment_gets_a_pack_of_its_own():
+    packs = pack_segments({"a": "short", "b": "x" * 400, "c": "short"}, token_budget=40)
+    assert [list(pack) for pack in packs] == [["a"], ["b"], ["c"]]
+    assert pack_segments({}) == []
+
+
+@pytest.mark.parametrize("content, translations, failed", [
+    ('<seg id="a">Hola</seg>\n<seg id="b">Adiós</seg>', {"a": "Hola", "b": "Adiós"}, []),
+    ('<seg id="b">Adiós</seg><seg id="a">\n Hola \n</seg>', {"a": "Hola", "b": "Adiós"}, []),
+    ('<seg id="a">Hola</seg>', {"a": "Hola"}, ["b"]),
+    ('<seg id="a">Hola</seg><seg id="b">Adiós', {"a": "Hola"}, ["b"]),
+    ('<seg id="a">Hola</seg><seg id="a">Ola</seg><seg id="b">Adiós</seg>', {"b": "Adiós"}, ["a"]),
+    ('<seg id="a"></seg><seg id="b">Adiós</seg><seg id="c">?</seg>', {"b": "Adiós"}, ["a"]),
+    ("Hola, adiós", {}, ["a", "b"]),
+])
+def test_parse_batch_response(content, translations, failed):
+    assert parse_batch_response(content, {"a": "Hello", "b": "Goodbye"}) == (translations, failed)
+
+
+def fake_translator(drop=()):
+    """Model answering batches with one <seg> per input segment, leaving out the IDs in `drop`"""
+    def reply_for(messages):
+        body = message_text(messages[-1])
+        if "Batch Mode" not in message_text(messages[0]):
+            return f"[tr] {body}"
+        return "\n".join(f'<seg id="{segment_id}">[tr] {text}</seg>'
+                         for segment_id, text in SEGMENT_RE.findall(body) if segment_id not in drop)
+
+    model = sleepy_chat_model(0, reply_for=reply_for)
+    providers.override(f"chat:{translator_engine.MODEL_NAME}", model)
+    return model
+
+
+def test_missing_segments_are_retried_one_by_one():
+    model = fake_translator(drop={"1"})
+    result = translator_engine.translate_batch(["Hello", "Goodbye", "Moon"], "fr", token_budget=1000)
+
+    assert result == {"fr": {"0": "[tr] Hello", "1": "[tr] Goodbye", "2": "[tr] Moon"}}
+    # One batch request and one retry for the dropped segment
+    assert model.calls == 2
+
+
+def test_async_batches_cover_every_language_and_retry_missing_segments():
+    model = fake_translator(drop={"b"})
+    segments = {"a": "Hello", "b": "Goodbye", "c": "Moon", "d": "Sun"}
+    result = asyncio.run(translator_engine.atranslate_batch(segments, ["fr", "de"], token_budget=20))
+
+    assert {language: list(translations) for language, translations in result.items()} == {
+        "fr": ["a", "b", "c", "d"], "de": ["a", "b", "c", "d"]}
+    assert result["de"]["b"] == "[tr] Goodbye"
+    # Two packs per language, one retry per language for "b"
+    assert model.calls == 6
+
+
+def test_a_failed_batch_call_falls_back_to_single_translations():
+    model = fake_translator()
+    calls = []
+
+    def reply_for(messages):
+        calls.append(messages)
+        if "Batch Mode" in message_text(messages[0]):
+            raise RuntimeError("model overloaded")
+        return f"[tr] {message_text(messages[-1])}"
+
+    model.reply_for = reply_for
+    result = translator_engine.translate_batch({"a": "Hello", "b": "Moon"}, "fr")
+
+    assert result == {"fr": {"a": "[tr] Hello", "b": "[tr] Moon"}}
+    assert isinstance(calls[0][0], SystemMessage) and isinstance(calls[1][-1], HumanMessage)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("name, language", sorted(translator_engine.GRAPH_ALIASES.items()))
+def test_legacy_graph_names_route_to_their_language(name, language):
+    prompts = {translator_engine.load_prompt(code): code for code in translator_engine.LANGUAGES}
+    fake = sleepy_chat_model(0, reply_for=lambda messages: prompts[messages[0].content])
+    providers.override(f"chat:{translator_engine.MODEL_NAME}", fake)
+
+    graph = getattr(translator_engine, name)
+    assert graph is getattr(translator_engine, name)
+    state = graph.invoke({"messages": [HumanMessage(content="Hello")]})
+    assert state["messages"][-1].content == language
+    # A language in the state wins over the one the graph name pins
+    state = graph.invoke({"messages": [HumanMessage(content="Hello")], "target_language": "ru"})
+    assert state["messages"][-1].content == "ru"
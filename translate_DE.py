@@ -1,73 +0,0 @@
-import os
-import getpass
-import json
-from typing import Annotated, Dict, List, Any, Union # More flexible typing
-from typing_extensions import TypedDict
-
-from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import add_messages
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage # Explicitly import message types
-
-
-gemini_api_key = os.environ.get("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY environment variable not set.")
-model = ChatGoogleGenerativeAI(model="gemini-2.0-flash-thinking-exp-01-21", google_api_key=gemini_api_key)
-
-class State(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages] # Use BaseMessage for message flexibility
-
-graph_builder = StateGraph(State)
-
-llm = model
-
-# System Instruction Prompt (Customize this as needed for tone/persona)
-SYSTEM_INSTRUCTIONS = """
-**Übersetze den bereitgestellten Text (aus jeder beliebigen Ausgangssprache) ins Deutsche**, und achte dabei besonders auf die Wahrung der Nuancen der östlichen (vedischen) Astrologie sowie auf die korrekte Verwendung der entsprechenden astrologischen Fachbegriffe. Stelle sicher, dass die Übersetzung so nah wie möglich am ursprünglichen Sinn bleibt.
-
-### Schritte
-
-1. Lies den Originaltext sorgfältig durch.  
-2. Identifiziere die in der östlichen (vedischen) Astrologie gebräuchlichen Begriffe und Ausdrücke.  
-3. Übersetze den Text ins Deutsche und verwende dabei korrekt die Fachterminologie der vedischen Astrologie, ohne den ursprünglichen Sinn zu verfälschen.  
-4. Achte darauf, dass die Übersetzung die Feinheiten der vedischen Astrologie berücksichtigt und ihre Konzepte genau wiedergibt.  
-5. Überprüfe die Übersetzung auf Genauigkeit und Kohärenz.
-
-### Ausgabeformat
-
-- Sämtliche Textinhalte, unabhängig von ihrem Umfang (von einem einzelnen Wort bis hin zu einem ganzen Text), müssen übersetzt werden.  
-- Erhalte die Struktur und konzeptionelle Konsistenz des Originaltextes bei.  
-- Verwende die korrekten Begriffe der östlichen (vedischen) Astrologie.  
-- **Füge in der finalen Antwort nichts anderes hinzu als die eigentliche Übersetzung.**
-
-"""
-
-
-def translator(state: State):
-    # 1. Extract User Message and Astro Data from State
-    user_messages = state.get("messages", [])
-
-    
-    # 3. Create system message with just the instructions and astro data
-    system_message = SYSTEM_INSTRUCTIONS
-
-    # 4. Format messages for Gemini - keeping user conversation separate from system context
-    formatted_messages = [system_message]  # System instructions first
-    if user_messages:  # Then add any user messages
-        formatted_messages.extend(user_messages)
-
-    # 5. Invoke Gemini with the formatted messages
-    response = llm.invoke(formatted_messages)
-
-    # 6. Return AI Response
-    return {"messages": [response]}
-
-
-graph_builder.add_node("translator", translator)
-graph_builder.add_edge(START, "translator")
-graph_builder.add_edge("translator", END)
-
-graph = graph_builder.compile()
-
-
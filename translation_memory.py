@@ -0,0 +1,245 @@
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+import providers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", ".translation_memory.sqlite3")
+DEFAULT_MAX_ENTRIES = 200_000
+# Recency is only rewritten when older than this, so hot phrases do not write on every hit
+TOUCH_INTERVAL_SECONDS = 300
+# Hit/miss counters and recency updates are kept in memory and written in one transaction
+# once this old, or once this many entries are waiting
+FLUSH_INTERVAL_SECONDS = 10
+FLUSH_BATCH_SIZE = 1000
+# Size is checked every this many inserts
+EVICTION_CHECK_INTERVAL = 500
+
+# Runs of spaces and tabs collapse to one space; line breaks (and any blanks around them)
+# collapse to one newline, so texts that differ only in their line structure stay apart
+_BLANKS_RE = re.compile(r"[^\S\n]+")
+_LINE_BREAK_RE = re.compile(r" ?\n[\n ]*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    key TEXT PRIMARY KEY,
+    language TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    source TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivially different inputs share an entry"""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return _LINE_BREAK_RE.sub("\n", _BLANKS_RE.sub(" ", text)).strip()
+
+
+class TranslationMemory:
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        On-disk translation memory shared by all threads and worker processes
+
+        Entries are keyed by (normalized source text, target language, prompt
+        version) and evicted least-recently-used beyond `max_entries`. SQLite in
+        WAL mode lets several processes read and write the same file.
+
+        :param path: SQLite database file
+        :param max_entries: Maximum number of stored translations
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        # Not yet written to the shared counters and recency column
+        self.pending_counts = {"hits": 0, "misses": 0}
+        self.pending_touches: Dict[str, float] = {}
+        self.last_flush = time.monotonic()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        atexit.register(self.flush)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(text: str, language: str, prompt_version: str) -> str:
+        raw = f"{language}\x00{prompt_version}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, language: str, prompt_version: str) -> Optional[str]:
+        """
+        Look up a stored translation
+
+        :param text: Source text
+        :param language: Target language code
+        :param prompt_version: Version of the translation prompt
+        :return: Stored translation, or None on a miss
+        """
+        key = self.make_key(text, language, prompt_version)
+        try:
+            row = self._connection().execute(
+                "SELECT translation, last_used FROM translations WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory lookup failed: {e}")
+            row = None
+
+        # A lookup only reads; counters and recency are written later in batches (see `flush`)
+        now = time.time()
+        with self.lock:
+            if row is not None:
+                self.hits += 1
+                self.pending_counts["hits"] += 1
+                if now - row[1] > TOUCH_INTERVAL_SECONDS:
+                    self.pending_touches[key] = now
+            else:
+                self.misses += 1
+                self.pending_counts["misses"] += 1
+            due = (len(self.pending_touches) >= FLUSH_BATCH_SIZE
+                   or time.monotonic() - self.last_flush >= FLUSH_INTERVAL_SECONDS)
+        if due:
+            self.flush()
+        return row[0] if row is not None else None
+
+    def flush(self):
+        """Write pending counters and recency updates in one transaction; kept for the next flush if it fails"""
+        with self.lock:
+            counts, touches = self.pending_counts, self.pending_touches
+            self.pending_counts, self.pending_touches = {"hits": 0, "misses": 0}, {}
+            self.last_flush = time.monotonic()
+        if not touches and not any(counts.values()):
+            return
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Never moves recency backwards past a newer write from another process
+                conn.executemany("UPDATE translations SET last_used = MAX(last_used, ?) WHERE key = ?",
+                                 [(used, key) for key, used in touches.items()])
+                conn.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    [(name, value) for name, value in counts.items() if value],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory flush failed: {e}")
+            with self.lock:
+                for name, value in counts.items():
+                    self.pending_counts[name] += value
+                for key, used in touches.items():
+                    self.pending_touches.setdefault(key, used)
+
+    def put(self, text: str, language: str, prompt_version: str, translation: str):
+        """
+        Store a translation
+
+        :param text: Source text
+        :param language: Target language code
+        :param prompt_version: Version of the translation prompt
+        :param translation: Translated text
+        """
+        key = self.make_key(text, language, prompt_version)
+        conn = self._connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (key, language, prompt_version, source, translation, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, language, prompt_version, normalize_text(text), translation, time.time()),
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory store failed: {e}")
+            return
+
+        with self.lock:
+            self.inserts += 1
+            check = self.inserts % EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop least-recently-used entries beyond `max_entries`
+
+        :return: Number of evicted entries
+        """
+        # Evict by up-to-date recency
+        self.flush()
+        conn = self._connection()
+        try:
+            (size,) = conn.execute("SELECT COUNT(*) FROM translations").fetchone()
+            excess = size - self.max_entries
+            if excess <= 0:
+                return 0
+            conn.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (excess,),
+            )
+            logger.info(f"Translation memory evicted {excess} entries")
+            return excess
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory eviction failed: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for this process plus the totals shared by all processes"""
+        self.flush()
+        conn = self._connection()
+        totals = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        (size,) = conn.execute("SELECT COUNT(*) FROM translations").fetchone()
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "total_hits": totals.get("hits", 0),
+                "total_misses": totals.get("misses", 0),
+                "total_evictions": totals.get("evictions", 0),
+                "size": size,
+            }
+
+
+def build_translation_memory() -> Optional[TranslationMemory]:
+    # Disabled when TRANSLATION_MEMORY_PATH is set to an empty string
+    return TranslationMemory(DEFAULT_PATH) if DEFAULT_PATH else None
+
+
+def get_translation_memory() -> Optional[TranslationMemory]:
+    """Process-wide translation memory, or None when disabled"""
+    return providers.get("translation_memory", build_translation_memory)
@@ -0,0 +1,508 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Annotated, Any, Callable, Dict, List, Optional, Tuple, Union
+from typing_extensions import TypedDict
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+import providers
+from conversation_window import approx_tokens, message_text
+from graph_node import GraphNode
+from translation_memory import get_translation_memory
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_NAME = "gemini-2.0-flash-thinking-exp-01-21"
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translator_prompts")
+DEFAULT_LANGUAGE = "en"
+# Approximate input tokens per batched translation request
+DEFAULT_BATCH_TOKEN_BUDGET = 3000
+# Fan-out: in-flight model calls shared by every concurrent fan-out to the model, and seconds
+# before partial results are returned
+DEFAULT_FANOUT_CONCURRENCY = 8
+DEFAULT_FANOUT_TIMEOUT = 60.0
+
+# Graph names previously served by the translate_*.py modules -> target language
+GRAPH_ALIASES = {
+    "translator_en": "en",
+    "translator_es": "es",
+    "translator_fr": "fr",
+    "translator_it": "it",
+    "translator_de": "de",
+    "translator_pt": "pt",
+    "translator_RU": "ru",
+    "translate_CH_Simple": "zh_hans",
+    "translate_CH_Traditional": "zh_hant",
+}
+
+# Target language code -> prompt template in translator_prompts/
+LANGUAGES = {
+    "en": "en.md",
+    "es": "es.md",
+    "fr": "fr.md",
+    "it": "it.md",
+    "de": "de.md",
+    "pt": "pt.md",
+    "ru": "ru.md",
+    "zh_hans": "zh_hans.md",
+    "zh_hant": "zh_hant.md",
+}
+
+
+BATCH_INSTRUCTIONS = """
+
+### Batch Mode
+
+The input contains several independent segments, each wrapped as <seg id="...">...</seg>.
+Translate every segment separately, following the instructions above.
+Answer with exactly one <seg> per input segment, keeping the same id attributes, and nothing outside the tags.
+"""
+
+SEGMENT_RE = re.compile(r'<seg id="([^"]+)">(.*?)</seg>', re.DOTALL)
+
+
+class State(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages] # Use BaseMessage for message flexibility
+    target_language: str # Optional; falls back to configurable.target_language
+
+
+class BatchState(TypedDict):
+    segments: Dict[str, str] # Segment ID -> source text
+    target_languages: List[str]
+    translations: Dict[str, Dict[str, str]] # Language -> segment ID -> translation
+
+
+class FanoutState(TypedDict):
+    text: str # Text to translate, e.g. a priestess reply
+    target_languages: List[str] # Optional; defaults to every supported language
+    translations: Dict[str, str] # Language -> translation
+    missing: List[str] # Languages that failed or did not finish before the timeout
+
+
+@lru_cache(maxsize=None)
+def load_prompt(language: str) -> str:
+    """
+    Load the translation instructions for a target language on first use
+
+    :param language: Target language code, one of LANGUAGES
+    :return: System instructions for that language
+    """
+    if language not in LANGUAGES:
+        raise ValueError(f"Unsupported target language: {language!r}")
+    with open(os.path.join(PROMPT_DIR, LANGUAGES[language]), encoding="utf-8") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def prompt_version(language: str) -> str:
+    """Short hash of a language's instructions; editing a prompt invalidates its cached translations"""
+    return hashlib.sha1(load_prompt(language).encode("utf-8")).hexdigest()[:12]
+
+
+def get_model():
+    """Shared chat model for every target language, created on first use"""
+    return providers.chat_model(MODEL_NAME)
+
+
+def resolve_language(state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> str:
+    configurable = (config or {}).get("configurable", {})
+    return state.get("target_language") or configurable.get("target_language") or DEFAULT_LANGUAGE
+
+
+def prepare_messages(state: State, config: Optional[RunnableConfig] = None) -> List[BaseMessage]:
+    # 1. Pick the target language and its instructions
+    system_message = SystemMessage(content=load_prompt(resolve_language(state, config)))
+
+    # 2. System instructions first, then the text(s) to translate
+    return [system_message] + list(state.get("messages", []))
+
+
+def cacheable_text(state: State) -> Optional[str]:
+    # Only a single source text maps onto a translation memory entry
+    messages = state.get("messages", [])
+    if len(messages) == 1 and isinstance(messages[0], HumanMessage):
+        return message_text(messages[0])
+    return None
+
+
+def lookup_memory(text: Optional[str], language: str) -> Optional[str]:
+    memory = get_translation_memory()
+    if text is None or memory is None:
+        return None
+    return memory.get(text, language, prompt_version(language))
+
+
+def remember(text: Optional[str], language: str, translation: str):
+    memory = get_translation_memory()
+    if text is not None and memory is not None and translation:
+        memory.put(text, language, prompt_version(language), translation)
+
+
+def translator(state: State, config: RunnableConfig):
+    # Exact translation memory hits skip the LLM entirely
+    language = resolve_language(state, config)
+    text = cacheable_text(state)
+    cached = lookup_memory(text, language)
+    if cached is not None:
+        return {"messages": [AIMessage(content=cached)]}
+
+    response = get_model().invoke(prepare_messages(state, config))
+    remember(text, language, message_text(response))
+    return {"messages": [response]}
+
+
+async def atranslator(state: State, config: RunnableConfig):
+    # Same as `translator`, without holding a worker thread during the LLM call
+    language = resolve_language(state, config)
+    text = cacheable_text(state)
+    cached = lookup_memory(text, language)
+    if cached is not None:
+        return {"messages": [AIMessage(content=cached)]}
+
+    response = await get_model().ainvoke(prepare_messages(state, config))
+    remember(text, language, message_text(response))
+    return {"messages": [response]}
+
+
+Segments = Union[List[str], Dict[str, str]]
+
+
+def pack_segments(segments: Dict[str, str], token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """
+    Split segments into requests of roughly `token_budget` input tokens
+
+    :param segments: Segment ID -> source text, in order
+    :param token_budget: Approximate token budget per request
+    :return: Consecutive groups of segments; an oversized segment gets a group of its own
+    """
+    packs: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    used = 0
+    for segment_id, text in segments.items():
+        cost = approx_tokens(text) + 8
+        if current and used + cost > token_budget:
+            packs.append(current)
+            current, used = {}, 0
+        current[segment_id] = text
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def batch_messages(pack: Dict[str, str], language: str) -> List[BaseMessage]:
+    body = "\n".join(f'<seg id="{segment_id}">{text}</seg>' for segment_id, text in pack.items())
+    return [SystemMessage(content=load_prompt(language) + BATCH_INSTRUCTIONS), HumanMessage(content=body)]
+
+
+def parse_batch_response(content: str, pack: Dict[str, str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Split a batched reply back into segments
+
+    :return: Parsed translations and the IDs that were missing, duplicated, empty or unknown
+    """
+    found: Dict[str, List[str]] = {}
+    for segment_id, text in SEGMENT_RE.findall(content):
+        found.setdefault(segment_id, []).append(text.strip())
+
+    translations = {}
+    failed = []
+    for segment_id in pack:
+        texts = found.get(segment_id, [])
+        if len(texts) == 1 and texts[0]:
+            translations[segment_id] = texts[0]
+        else:
+            failed.append(segment_id)
+    return translations, failed
+
+
+def _normalize_batch(segments: Segments, target_languages: Union[str, List[str]]) -> Tuple[Dict[str, str], List[str]]:
+    if not isinstance(segments, dict):
+        segments = {str(index): text for index, text in enumerate(segments)}
+    languages = [target_languages] if isinstance(target_languages, str) else list(target_languages)
+    return segments, languages
+
+
+def split_remembered(segments: Dict[str, str], language: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Separate segments already in the translation memory from those still to translate
+
+    :return: Remembered translations and the remaining source segments
+    """
+    remembered, remaining = {}, {}
+    for segment_id, text in segments.items():
+        cached = lookup_memory(text, language)
+        if cached is not None:
+            remembered[segment_id] = cached
+        else:
+            remaining[segment_id] = text
+    return remembered, remaining
+
+
+def translate_text(text: str, language: str) -> str:
+    """Translate a single text with the regular translator prompt"""
+    cached = lookup_memory(text, language)
+    if cached is not None:
+        return cached
+    response = get_model().invoke([SystemMessage(content=load_prompt(language)), HumanMessage(content=text)])
+    translation = message_text(response).strip()
+    remember(text, language, translation)
+    return translation
+
+
+async def atranslate_text(text: str, language: str) -> str:
+    cached = lookup_memory(text, language)
+    if cached is not None:
+        return cached
+    response = await get_model().ainvoke([SystemMessage(content=load_prompt(language)), HumanMessage(content=text)])
+    translation = message_text(response).strip()
+    remember(text, language, translation)
+    return translation
+
+
+def translate_batch(
+    segments: Segments,
+    target_languages: Union[str, List[str]],
+    token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+) -> Dict[str, Dict[str, str]]:
+    """
+    Translate many segments with a few LLM calls
+
+    Segments found in the translation memory are answered from it. The rest
+    are packed into token-bounded requests with stable IDs; segments that come
+    back missing or malformed are retried one by one.
+
+    :param segments: Source texts, as a list (IDs are the indices) or an ID -> text dict
+    :param target_languages: One language code or a list of them
+    :param token_budget: Approximate input tokens per request
+    :return: Language -> segment ID -> translation
+    """
+    segments, languages = _normalize_batch(segments, target_languages)
+    results: Dict[str, Dict[str, str]] = {}
+    for language in languages:
+        remembered, remaining = split_remembered(segments, language)
+        translations = results.setdefault(language, remembered)
+        for pack in pack_segments(remaining, token_budget):
+            try:
+                response = get_model().invoke(batch_messages(pack, language))
+                parsed, failed = parse_batch_response(message_text(response), pack)
+            except Exception as e:
+                logger.error(f"Batch translation to {language} failed: {e}")
+                parsed, failed = {}, list(pack)
+            for segment_id, translation in parsed.items():
+                remember(pack[segment_id], language, translation)
+            translations.update(parsed)
+            for segment_id in failed:
+                translations[segment_id] = translate_text(pack[segment_id], language)
+    return {language: {segment_id: results[language][segment_id] for segment_id in segments} for language in languages}
+
+
+async def atranslate_batch(
+    segments: Segments,
+    target_languages: Union[str, List[str]],
+    token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+) -> Dict[str, Dict[str, str]]:
+    """Async variant of `translate_batch`; all requests for all languages run concurrently"""
+    segments, languages = _normalize_batch(segments, target_languages)
+
+    async def run_pack(language: str, pack: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+        try:
+            response = await get_model().ainvoke(batch_messages(pack, language))
+            parsed, failed = parse_batch_response(message_text(response), pack)
+        except Exception as e:
+            logger.error(f"Batch translation to {language} failed: {e}")
+            parsed, failed = {}, list(pack)
+        for segment_id, translation in parsed.items():
+            remember(pack[segment_id], language, translation)
+        retried = await asyncio.gather(*(atranslate_text(pack[segment_id], language) for segment_id in failed))
+        parsed.update(zip(failed, retried))
+        return language, parsed
+
+    results: Dict[str, Dict[str, str]] = {}
+    requests = []
+    for language in languages:
+        remembered, remaining = split_remembered(segments, language)
+        results[language] = remembered
+        requests.extend(run_pack(language, pack) for pack in pack_segments(remaining, token_budget))
+    for language, parsed in await asyncio.gather(*requests):
+        results[language].update(parsed)
+    return {language: {segment_id: results[language][segment_id] for segment_id in segments} for language in languages}
+
+
+def batch_translator(state: BatchState):
+    return {"translations": translate_batch(state["segments"], state["target_languages"])}
+
+
+async def abatch_translator(state: BatchState):
+    return {"translations": await atranslate_batch(state["segments"], state["target_languages"])}
+
+
+ResultCallback = Callable[[str, str], None]
+
+
+class FanoutLimits:
+    def __init__(self, max_concurrency: int = DEFAULT_FANOUT_CONCURRENCY):
+        """
+        Bound on the model calls all fan-outs to one model have in flight together
+
+        Sync fan-outs share one thread pool; async ones share a semaphore per
+        event loop (asyncio primitives cannot cross loops).
+
+        :param max_concurrency: Maximum in-flight model calls
+        """
+        self.max_concurrency = max_concurrency
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fanout")
+        self.semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+
+def get_fanout_limits() -> FanoutLimits:
+    return providers.get(f"translator.fanout_limits:{MODEL_NAME}", FanoutLimits)
+
+
+def fan_out_translate(
+    text: str,
+    target_languages: Optional[List[str]] = None,
+    timeout: float = DEFAULT_FANOUT_TIMEOUT,
+    on_result: Optional[ResultCallback] = None,
+) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Translate one text into many languages concurrently
+
+    Calls run on a pool shared by every fan-out to the model (see `FanoutLimits`).
+
+    :param text: Source text
+    :param target_languages: Language codes; defaults to every supported language
+    :param timeout: Seconds to wait before returning whatever has finished
+    :param on_result: Called with (language, translation) as each language finishes
+    :return: Language -> translation, and the languages that failed or timed out
+    """
+    languages = list(target_languages or LANGUAGES)
+    results: Dict[str, str] = {}
+    deadline = time.monotonic() + timeout
+    pool = get_fanout_limits().pool
+    futures = {pool.submit(translate_text, text, language): language for language in languages}
+    try:
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                language = futures[future]
+                try:
+                    results[language] = future.result()
+                except Exception as e:
+                    logger.error(f"Fan-out translation to {language} failed: {e}")
+                    continue
+                if on_result:
+                    on_result(language, results[language])
+    finally:
+        # Do not wait for stragglers; queued ones are dropped and running ones finish unread
+        for future in futures:
+            future.cancel()
+    return results, [language for language in languages if language not in results]
+
+
+async def afan_out_translate(
+    text: str,
+    target_languages: Optional[List[str]] = None,
+    timeout: float = DEFAULT_FANOUT_TIMEOUT,
+    on_result: Optional[ResultCallback] = None,
+) -> Tuple[Dict[str, str], List[str]]:
+    """Async variant of `fan_out_translate`; unfinished languages are cancelled at the timeout"""
+    languages = list(target_languages or LANGUAGES)
+    semaphore = get_fanout_limits().semaphore()
+    results: Dict[str, str] = {}
+
+    async def run(language: str):
+        async with semaphore:
+            translation = await atranslate_text(text, language)
+        results[language] = translation
+        if on_result:
+            on_result(language, translation)
+
+    async def run_logged(language: str):
+        try:
+            await run(language)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Fan-out translation to {language} failed: {e}")
+
+    tasks = [asyncio.create_task(run_logged(language)) for language in languages]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    return dict(results), [language for language in languages if language not in results]
+
+
+def fanout_translator(state: FanoutState):
+    translations, missing = fan_out_translate(state["text"], state.get("target_languages"))
+    return {"translations": translations, "missing": missing}
+
+
+async def afanout_translator(state: FanoutState):
+    translations, missing = await afan_out_translate(state["text"], state.get("target_languages"))
+    return {"translations": translations, "missing": missing}
+
+
+def build_graph():
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("translator", GraphNode(translator, atranslator))
+    graph_builder.add_edge(START, "translator")
+    graph_builder.add_edge("translator", END)
+    return graph_builder.compile()
+
+
+def build_batch_graph():
+    batch_graph_builder = StateGraph(BatchState)
+    batch_graph_builder.add_node("batch_translator", GraphNode(batch_translator, abatch_translator))
+    batch_graph_builder.add_edge(START, "batch_translator")
+    batch_graph_builder.add_edge("batch_translator", END)
+    return batch_graph_builder.compile()
+
+
+def build_fanout_graph():
+    fanout_graph_builder = StateGraph(FanoutState)
+    fanout_graph_builder.add_node("fanout_translator", GraphNode(fanout_translator, afanout_translator))
+    fanout_graph_builder.add_edge(START, "fanout_translator")
+    fanout_graph_builder.add_edge("fanout_translator", END)
+    return fanout_graph_builder.compile()
+
+
+def __getattr__(name: str):
+    # Graphs referenced from langgraph.json are compiled on first access. There is one
+    # translator graph; each legacy graph name is a copy pinned to its language.
+    if name == "graph":
+        return providers.get("translator.graph", build_graph)
+    if name == "batch_graph":
+        return providers.get("translator.batch_graph", build_batch_graph)
+    if name == "fanout_graph":
+        return providers.get("translator.fanout_graph", build_fanout_graph)
+    if name in GRAPH_ALIASES:
+        configurable = {"target_language": GRAPH_ALIASES[name]}
+        return providers.get(f"translator.{name}", lambda: __getattr__("graph").with_config(configurable=configurable))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,185 @@
+"""
+Compressed in-memory codes for the vectors of a memory store namespace
+
+A namespace's float32 vectors stay in their memory-mapped file; what is kept in
+RAM and scanned per query are codes built from them (see `NamespaceVectors`):
+
+- "int8" (`Int8Codes`): one signed byte per dimension plus a float32 scale per
+  vector, about 4x smaller. It needs no training, so vectors are encoded as
+  they arrive, and its scores rank nearly like the float32 ones.
+- "pq" (`ProductCodes`): product quantization, one byte per subspace of
+  DEFAULT_SUBSPACE_DIMS dimensions, 16x smaller by default. Its codebooks are
+  trained with k-means, so a namespace only gets PQ codes once it holds the
+  quantization config's `min_size` vectors, and they are retrained in the
+  background as it grows. Its scores are coarser.
+
+Codes only pick candidates. Whenever a namespace has codes, the best
+`rerank` * k of them (DEFAULT_RERANK: 4 for int8, 16 for pq) are re-scored
+against the float32 vectors and the top k of those are returned. Namespaces
+without codes, such as a PQ namespace below `min_size`, are searched at full
+precision with no re-ranking step.
+"""
+from typing import Optional
+
+import numpy as np
+
+# Candidates per requested result that are re-scored at full precision; coarser codes need more
+DEFAULT_RERANK = {"int8": 4, "pq": 16}
+# Dimensions per product-quantization subspace; each subspace costs one byte per vector
+DEFAULT_SUBSPACE_DIMS = 4
+PQ_CENTROIDS = 256
+PQ_ITERATIONS = 10
+# Training sample per centroid
+PQ_SAMPLES_PER_CENTROID = 16
+SCORE_CHUNK = 8192
+
+
+class _Codes:
+    # Growable code array indexed by position, like NamespaceVectors.keys
+    def __init__(self, width: int, dtype):
+        self.codes = np.empty((64, width), dtype=dtype)
+        self.size = 0
+
+    def _append(self, codes: np.ndarray):
+        if self.size + len(codes) > len(self.codes):
+            grown = np.empty((max(2 * len(self.codes), self.size + len(codes)), self.codes.shape[1]), self.codes.dtype)
+            grown[:self.size] = self.codes[:self.size]
+            self.codes = grown
+        self.codes[self.size:self.size + len(codes)] = codes
+        self.size += len(codes)
+
+    def keep(self, positions: np.ndarray):
+        """Drop every position not in `positions`, renumbering the rest in order"""
+        self.codes = self.codes[positions]
+        self.size = len(positions)
+
+
+class Int8Codes(_Codes):
+    def __init__(self, dims: int):
+        """
+        Symmetric int8 codes with one float32 scale per vector
+
+        Costs dims + 4 bytes per vector instead of 4 * dims. Needs no training,
+        so vectors are encoded as they arrive.
+        """
+        super().__init__(dims, np.int8)
+        self.scales = np.empty(64, dtype=np.float32)
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def append(self, vectors: np.ndarray):
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        if self.size + len(vectors) > len(self.scales):
+            grown = np.empty(max(2 * len(self.scales), self.size + len(vectors)), dtype=np.float32)
+            grown[:self.size] = self.scales[:self.size]
+            self.scales = grown
+        self.scales[self.size:self.size + len(vectors)] = scales
+        self._append(np.rint(vectors / scales[:, None]).astype(np.int8))
+
+    def keep(self, positions: np.ndarray):
+        self.scales = self.scales[positions]
+        super().keep(positions)
+
+    def decode(self, positions: np.ndarray) -> np.ndarray:
+        return self.codes[positions].astype(np.float32) * self.scales[positions, None]
+
+    def scores(self, positions: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # In chunks: the int8 rows are widened to float32 for the product
+        return np.concatenate([
+            (self.codes[chunk].astype(np.float32) @ query) * self.scales[chunk]
+            for chunk in np.array_split(positions, max(1, len(positions) // SCORE_CHUNK))
+        ]) if len(positions) else np.empty(0, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * (self.codes.shape[1] + 4)
+
+
+class ProductCodes(_Codes):
+    def __init__(self, dims: int, subspace_dims: int = DEFAULT_SUBSPACE_DIMS, seed: int = 0):
+        """
+        Product quantization: each vector is split into subspaces of `subspace_dims`
+        and every subspace is stored as the index of its nearest of 256 centroids
+
+        Costs one byte per subspace (dims / 4 bytes by default, 16x smaller than
+        float32). Inner products are computed from a per-query lookup table.
+        Codebooks are learned with `train` before the first `append`.
+        """
+        if dims % subspace_dims:
+            raise ValueError(f"{dims} dimensions do not split into subspaces of {subspace_dims}")
+        self.dims = dims
+        self.subspaces = dims // subspace_dims
+        self.subspace_dims = subspace_dims
+        self.rng = np.random.default_rng(seed)
+        self.codebooks: Optional[np.ndarray] = None
+        super().__init__(self.subspaces, np.uint8)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        # (n, dims) -> (subspaces, n, subspace_dims), contiguous so each subspace's products go to BLAS
+        return np.ascontiguousarray(vectors.reshape(len(vectors), self.subspaces, self.subspace_dims).transpose(1, 0, 2))
+
+    def train(self, vectors: np.ndarray):
+        """Learn one codebook per subspace with k-means on a sample of `vectors`"""
+        centroids = min(PQ_CENTROIDS, len(vectors))
+        sample_size = min(len(vectors), centroids * PQ_SAMPLES_PER_CENTROID)
+        sample = self._split(vectors[self.rng.choice(len(vectors), sample_size, replace=False)])
+        codebooks = np.empty((self.subspaces, centroids, self.subspace_dims), dtype=np.float32)
+        for subspace, points in enumerate(sample):
+            books = points[self.rng.choice(sample_size, centroids, replace=False)].copy()
+            for _ in range(PQ_ITERATIONS):
+                assignment = self._nearest(points, books)
+                sums = np.stack([np.bincount(assignment, weights=points[:, dim], minlength=centroids)
+                                 for dim in range(self.subspace_dims)], axis=1).astype(np.float32)
+                counts = np.bincount(assignment, minlength=centroids)
+                empty = counts == 0
+                # Re-seed empty centroids from random sample points
+                sums[empty] = points[self.rng.choice(sample_size, int(empty.sum()))]
+                counts[empty] = 1
+                books = sums / counts[:, None]
+            codebooks[subspace] = books
+        self.codebooks = codebooks
+        self.size = 0
+
+    @staticmethod
+    def _nearest(points: np.ndarray, books: np.ndarray) -> np.ndarray:
+        # argmin |p - c|^2 == argmax (p.c - |c|^2 / 2)
+        scores = points @ books.T
+        scores -= 0.5 * np.einsum("ij,ij->i", books, books)
+        return np.argmax(scores, axis=1)
+
+    def append(self, vectors: np.ndarray):
+        self._append(np.stack([self._nearest(points, books)
+                               for points, books in zip(self._split(vectors), self.codebooks)], axis=1).astype(np.uint8))
+
+    def decode(self, positions: np.ndarray) -> np.ndarray:
+        codes = self.codes[positions]
+        return np.concatenate([self.codebooks[subspace][codes[:, subspace]] for subspace in range(self.subspaces)],
+                              axis=1)
+
+    def scores(self, positions: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Table of every centroid's inner product with its part of the query, summed per code
+        table = np.einsum("skd,sd->sk", self.codebooks, query.reshape(self.subspaces, self.subspace_dims))
+        codes = self.codes[positions]
+        scores = np.zeros(len(positions), dtype=np.float32)
+        for subspace in range(self.subspaces):
+            scores += table[subspace][codes[:, subspace]]
+        return scores
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * self.subspaces + (self.codebooks.nbytes if self.codebooks is not None else 0)
+
+
+def make_codes(kind: str, dims: int, subspace_dims: int = DEFAULT_SUBSPACE_DIMS):
+    """Empty code store for a quantization kind: "int8" or "pq" """
+    if kind == "int8":
+        return Int8Codes(dims)
+    if kind == "pq":
+        return ProductCodes(dims, subspace_dims)
+    raise ValueError(f"Unknown quantization {kind!r}; expected 'int8' or 'pq'")